@@ -0,0 +1,86 @@
+"""
+Intervalle de poll adaptatif pour get-messages.php
+==================================================
+Au lieu d'un poll toutes les POLL_INTERVAL_S quoi qu'il arrive :
+
+  - des messages nouveaux au dernier poll       -> POLL_MIN_S (le trafic coule)
+  - des convs actives / réponses en attente     -> x POLL_BACKOFF, plafonné à POLL_ACTIVE_S
+                                                   (une réponse est attendue : poll serré)
+  - rien d'actif, rien en attente               -> x POLL_BACKOFF jusqu'à POLL_MAX_S
+  - un envoi (rr_tick, réponse)                 -> snap() : retour à POLL_MIN_S
+
+`base` est le POLL_INTERVAL_S du worker. Seul l'appel get-messages est
+espacé : la boucle se réveille au moins toutes les `base` secondes (tick,
+refresh, réponses programmées) et saute le poll tant que due() est faux.
+POLL_ADAPTIVE=0 (défaut) garde l'intervalle fixe : due() est toujours vrai.
+"""
+import os
+from typing import Callable, Optional
+
+import clock
+
+POLL_ADAPTIVE = os.getenv('POLL_ADAPTIVE', '0') == '1'
+POLL_MIN_S    = float(os.getenv('POLL_MIN_S',    '1'))
+POLL_MAX_S    = float(os.getenv('POLL_MAX_S',    '60'))
+POLL_BACKOFF  = float(os.getenv('POLL_BACKOFF',  '2'))
+POLL_ACTIVE_S = float(os.getenv('POLL_ACTIVE_S', '2'))     # plafond tant qu'une réponse est attendue
+
+
+class AdaptivePoller:
+
+    def __init__(self, base_s: float, floor_s: float = POLL_MIN_S, ceiling_s: float = POLL_MAX_S,
+                 factor: float = POLL_BACKOFF, enabled: bool = POLL_ADAPTIVE,
+                 active_s: float = POLL_ACTIVE_S, now: Callable[[], float] = clock.monotonic):
+        self.base     = base_s
+        self.floor    = min(floor_s, base_s)
+        self.active   = min(max(active_s, self.floor), base_s)
+        self.ceiling  = max(ceiling_s, base_s)
+        self.factor   = max(factor, 1.0)
+        self.enabled  = enabled
+        self._now     = now
+        self.interval = base_s
+        self._next: Optional[float] = None     # None = poll au prochain passage
+        self.polls    = 0
+        self.skipped  = 0
+
+    def due(self) -> bool:
+        if not self.enabled or self._next is None or self._now() >= self._next:
+            return True
+        self.skipped += 1
+        return False
+
+    def wait_s(self, cap: Optional[float] = None) -> float:
+        """Attente avant le prochain poll, bornée par cap (base par défaut)."""
+        cap = self.base if cap is None else cap
+        if not self.enabled:
+            return cap
+        if self._next is None:
+            return 0.0
+        return min(cap, max(0.0, self._next - self._now()))
+
+    def wake_s(self) -> float:
+        """ENGINE=async : réveil de la tâche inbound, assez fréquent pour voir un snap()."""
+        return self.wait_s(self.floor) if self.enabled else self.base
+
+    def record(self, new_msgs: int, active: int, pending: int = 0) -> float:
+        """Après un poll : nouveaux messages, convs actives, réponses en attente d'envoi."""
+        self.polls += 1
+        if not self.enabled:
+            return self.base
+        if new_msgs:
+            self.interval = self.floor
+        elif active or pending:
+            self.interval = min(self.active, max(self.floor, self.interval * self.factor))
+        else:
+            self.interval = min(self.ceiling, max(self.interval, self.base) * self.factor)
+        self._next = self._now() + self.interval
+        return self.interval
+
+    def snap(self) -> None:
+        """Un envoi vient de partir : une réponse est attendue, poll rapproché."""
+        if not self.enabled:
+            return
+        self.interval = self.floor
+        due = self._now() + self.floor
+        if self._next is None or due < self._next:
+            self._next = due
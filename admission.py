@@ -0,0 +1,136 @@
+"""
+File d'admission des envois (priorités + report sur limite de débit)
+====================================================================
+Priorités : réponses (0) > 1ers messages (1) > refresh / découverte (2).
+
+  - submit() : pour un envoi qui ne doit pas être perdu (réponse). S'il est
+    refusé par le limiteur, il est mis en attente puis réessayé pile quand
+    time_until_allowed() le permet (via scheduler.schedule), au lieu d'être
+    abandonné alors que le message est déjà marqué vu.
+  - admit()  : pour un envoi jetable (1er message, rejoué au tick suivant).
+    Refusé tant qu'un envoi plus prioritaire attend la même capacité : même
+    SIM, ou n'importe laquelle si la limite globale est atteinte. Retourne
+    (accepté, résultats des envois en attente partis pendant l'appel).
+
+Les callables reçoivent l'état en 1er argument : can_send(state, spec),
+wait_for(state, spec) et global_wait(state).
+"""
+import heapq
+import itertools
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import clock
+
+PRIO_REPLY, PRIO_OPENER, PRIO_REFRESH = 0, 1, 2
+MIN_RETRY_S = 0.05
+
+
+class AdmissionQueue:
+
+    def __init__(self, can_send: Callable[[Any, str], bool],
+                 wait_for: Callable[[Any, str], float],
+                 global_wait: Callable[[Any], float],
+                 schedule: Callable[..., float],
+                 now: Callable[[], float] = clock.monotonic):
+        self._can_send    = can_send
+        self._wait_for    = wait_for
+        self._global_wait = global_wait
+        self._schedule    = schedule
+        self._now         = now
+        self._heap: List[tuple] = []          # (prio, seq, state, spec, fn, args)
+        self._seq   = itertools.count()
+        self._timer: Optional[float] = None   # échéance du prochain drain() programmé
+        self.deferred = 0
+        self.retried  = 0
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def clear(self) -> None:
+        """Abandonne les envois en attente (bancs d'essai, tests)."""
+        self._heap.clear()
+        self._timer = None
+
+    def pending(self) -> Dict[int, int]:
+        out: Dict[int, int] = {}
+        for item in self._heap:
+            out[item[0]] = out.get(item[0], 0) + 1
+        return out
+
+    def _blocked(self, state, prio: int, spec: str) -> bool:
+        ahead = [item for item in self._heap if item[0] < prio]
+        if not ahead:
+            return False
+        return any(item[3] == spec for item in ahead) or self._global_wait(state) > 0
+
+    def admit(self, state, prio: int, spec: str) -> Tuple[bool, List[Any]]:
+        """
+        Consomme un envoi si rien de plus prioritaire n'attend la même capacité.
+        Les envois en attente sont d'abord réessayés : leurs résultats sont
+        retournés avec la décision, à traiter par l'appelant comme ceux de drain().
+        """
+        drained = self.drain() or []
+        if self._blocked(state, prio, spec):
+            return False, drained
+        return self._can_send(state, spec), drained
+
+    def submit(self, state, prio: int, spec: str, fn: Callable, *args) -> Any:
+        """
+        Exécute fn(*args) dès que le débit le permet. Retourne son résultat si
+        l'envoi part tout de suite, sinon {"deferred": spec, "in": secondes}.
+        Les envois en attente passés dans la même passe (par priorité) sont
+        comptés comme dans drain() et leurs résultats suivent dans une liste.
+        """
+        seq = next(self._seq)
+        heapq.heappush(self._heap, (prio, seq, state, spec, fn, args))
+        results = self._run()
+        if seq in results:
+            mine = results.pop(seq)
+        else:
+            self.deferred += 1
+            wait = max(self._wait_for(state, spec), MIN_RETRY_S)
+            self._arm()
+            mine = {"deferred": spec, "in": round(wait, 2)}
+        others = [r for r in results.values() if r is not None]
+        if not others:
+            return mine
+        self.retried += len(others)
+        return ([mine] if mine is not None else []) + others
+
+    def drain(self, *_lead) -> Optional[List[Any]]:
+        """Réessaie les envois en attente, par priorité (échéance du scheduler)."""
+        if self._timer is not None and self._timer <= self._now():
+            self._timer = None
+        if not self._heap:
+            return None
+        out = [r for r in self._run().values() if r is not None]
+        self.retried += len(out)
+        self._arm()
+        return out or None
+
+    def _run(self) -> Dict[int, Any]:
+        # Parcours par priorité ; un envoi refusé bloque les moins prioritaires
+        # sur la même SIM (ou partout si c'est la limite globale qui bloque).
+        # Retourne {seq: résultat} des envois partis.
+        kept, blocked, global_full = [], set(), False
+        results: Dict[int, Any] = {}
+        while self._heap:
+            item = heapq.heappop(self._heap)
+            prio, seq, state, spec, fn, args = item
+            if global_full or spec in blocked or not self._can_send(state, spec):
+                kept.append(item)
+                blocked.add(spec)
+                global_full = global_full or self._global_wait(state) > 0
+                continue
+            results[seq] = fn(*args)
+        for item in kept:
+            heapq.heappush(self._heap, item)
+        return results
+
+    def _arm(self) -> None:
+        if not self._heap:
+            return
+        wait = min(max(self._wait_for(item[2], item[3]), MIN_RETRY_S) for item in self._heap)
+        due  = self._now() + wait
+        if self._timer is None or due < self._timer:
+            self._timer = self._schedule(wait, self.drain)
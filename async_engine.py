@@ -0,0 +1,122 @@
+"""
+Moteur asyncio partagé
+======================
+Primitives utilisées par run_async() des deux workers :
+  - AsyncSendLimiter : semaphores globale / par SIM + attente sur can_send
+    (au lieu de sauter l'envoi jusqu'au prochain tick)
+  - every()          : boucle périodique pour poll / refresh / save
+  - to_thread()      : appels HTTP bloquants (GatewayClient) sur un pool dédié
+"""
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Optional, Union
+
+from jsonlog import log
+
+ASYNC_MAX_INFLIGHT = int(os.getenv('ASYNC_MAX_INFLIGHT', '32'))
+ASYNC_PER_SIM      = int(os.getenv('ASYNC_PER_SIM',      '1'))
+ASYNC_RATE_RETRY_S = float(os.getenv('ASYNC_RATE_RETRY_S', '1.0'))
+
+
+class AsyncSendLimiter:
+    """
+    slot(spec, prio) n'entre que lorsque :
+      1. la SIM a moins de `per_sim` envois en vol,
+      2. aucun envoi plus prioritaire (prio plus petite) n'attend le débit de
+         la même SIM — ou de n'importe laquelle si global_wait() > 0,
+      3. can_send(spec) accepte (limites /min globale et par SIM),
+      4. moins de `max_inflight` envois en vol au total.
+    """
+
+    def __init__(self, can_send: Callable[[str], bool],
+                 max_inflight: int = ASYNC_MAX_INFLIGHT, per_sim: int = ASYNC_PER_SIM,
+                 wait_hint: Optional[Callable[[str], float]] = None,
+                 retry_s: float = ASYNC_RATE_RETRY_S,
+                 global_wait: Optional[Callable[[], float]] = None):
+        self._can_send  = can_send
+        self._wait_hint = wait_hint
+        self._retry_s   = retry_s
+        self._per_sim   = per_sim
+        self._global    = asyncio.Semaphore(max_inflight)
+        self._sims: Dict[str, asyncio.Semaphore] = {}
+        self._global_wait = global_wait
+        self._rate_wait: Dict[int, Dict[str, int]] = {}    # prio -> {spec: nb en attente}
+        self.waiting    = 0
+        self.in_flight  = 0
+
+    def _sem(self, spec: str) -> asyncio.Semaphore:
+        sem = self._sims.get(spec)
+        if sem is None:
+            sem = self._sims[spec] = asyncio.Semaphore(self._per_sim)
+        return sem
+
+    def _outranked(self, prio: int, spec: str) -> bool:
+        ahead = [w for p, w in self._rate_wait.items() if p < prio and w]
+        if not ahead:
+            return False
+        return any(spec in w for w in ahead) or bool(self._global_wait and self._global_wait() > 0)
+
+    async def _wait_rate(self, spec: str, prio: int) -> None:
+        waiting = self._rate_wait.setdefault(prio, {})
+        waiting[spec] = waiting.get(spec, 0) + 1
+        try:
+            while self._outranked(prio, spec) or not self._can_send(spec):
+                delay = self._wait_hint(spec) if self._wait_hint else 0.0
+                await asyncio.sleep(max(delay, 0.0) or self._retry_s)
+        finally:
+            waiting[spec] -= 1
+            if not waiting[spec]:
+                del waiting[spec]
+
+    @asynccontextmanager
+    async def slot(self, spec: str, prio: int = 1):
+        self.waiting += 1
+        entered = False
+        try:
+            async with self._sem(spec):
+                await self._wait_rate(spec, prio)
+                async with self._global:
+                    self.waiting   -= 1
+                    self.in_flight += 1
+                    entered = True
+                    try:
+                        yield
+                    finally:
+                        self.in_flight -= 1
+        finally:
+            if not entered:
+                self.waiting -= 1
+
+
+def install_executor(max_workers: int = ASYNC_MAX_INFLIGHT) -> None:
+    """Pool de threads par défaut dimensionné pour les envois concurrents."""
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gw'))
+
+
+async def to_thread(fn: Callable, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+async def every(interval_s: Union[float, Callable[[], float]], fn: Callable[[], Awaitable],
+                label: str) -> None:
+    """
+    Exécute fn() toutes les interval_s secondes ; une erreur ne tue pas la boucle.
+    interval_s peut être un callable, relu après chaque exécution (poll adaptatif).
+    """
+    while True:
+        try:
+            await fn()
+        except Exception as e:
+            log.error(label.upper(), "tache periodique en erreur", err=repr(e), exc_info=True)
+        await asyncio.sleep(interval_s() if callable(interval_s) else interval_s)
+
+
+def spawn(tasks: set, coro) -> asyncio.Task:
+    """create_task en gardant une référence forte jusqu'à la fin de la tâche."""
+    t = asyncio.get_running_loop().create_task(coro)
+    tasks.add(t)
+    t.add_done_callback(tasks.discard)
+    return t
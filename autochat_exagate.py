@@ -4,9 +4,27 @@ API self-hosted: gate.exanewtech.com
 Auth: ?key=API_KEY
 Endpoints: /services/get-devices.php  /services/send.php  /services/get-messages.php
 """
-import os, re, json, time, random, tempfile
+import os, re, random, asyncio
+from collections.abc import Mapping
 from typing import Dict, List, Optional
-import requests
+import clock
+import metrics
+from jsonlog import DEBUG, log
+from gateway_client import GatewayClient, EP_DEVICES
+from reply_scheduler import ReplyScheduler
+from message_cursor import MessageCursor, POLL_CURSOR
+from dedupe import DedupeStore
+from rate_limiter import RateLimiter
+from rr_progress import RoundRobinProgress
+from pair_matrix import PairMatrix, PairMatrixStore
+from tournament import RR_MODE, round_count, round_pairs
+from send_dispatch import DeviceDispatcher, SendCompletions
+from admission import AdmissionQueue, PRIO_OPENER, PRIO_REPLY
+from state_store import StatePersister, make_store
+from loop_profiler import LoopProfiler
+from adaptive_poll import AdaptivePoller
+from webhook import WebhookInbox
+from async_engine import AsyncSendLimiter, every, install_executor, spawn, to_thread
 
 # ─── CONFIG ────────────────────────────────────────────────────────────────────
 BASE_URL  = (os.getenv("SMS_GATEWAY_URL") or "https://gate.exanewtech.com").rstrip("/")
@@ -21,6 +39,11 @@ REPLY_DELAY_MAX_S    = int(os.getenv("REPLY_DELAY_MAX_S",      "5"))
 GLOBAL_SEND_PER_MIN  = int(os.getenv("GLOBAL_SEND_PER_MIN",    "60"))
 PER_SIM_SEND_PER_MIN = int(os.getenv("PER_SIM_SEND_PER_MIN",   "20"))
 RR_TICK_S            = int(os.getenv("RR_TICK_S",              "20"))
+# 1 = au demarrage et en fin de cycle, seen garde le watermark du dernier
+#     message traite (pas de rejeu de l historique) ; 0 = seen vide (ancien)
+RESUME_WATERMARK     = os.getenv("RESUME_WATERMARK", "1") == "1"
+# 1 = convs en matrice compacte (pair_matrix), ecrites en binaire a cote de l etat
+CONV_MATRIX          = os.getenv("CONV_MATRIX", "0") == "1"
 
 TEMPLATES = [
     "Hello !",
@@ -36,27 +59,7 @@ TEMPLATES = [
 ]
 
 # ─── HTTP ───────────────────────────────────────────────────────────────────────
-def _p():
-    return {"key": API_KEY}
-
-def _h():
-    return {"Accept": "application/json"}
-
-def _json(r, ctx=""):
-    body = (r.text or "").strip()
-    if not body:
-        return {}
-    try:
-        return r.json()
-    except ValueError:
-        print(f"[WARN] bad JSON ({ctx}) {r.status_code}: {body[:100]!r}", flush=True)
-        return {}
-
-def api_get(path, params=None):
-    r = requests.get(f"{BASE_URL}{path}", headers=_h(),
-                     params={**_p(), **(params or {})}, timeout=30)
-    r.raise_for_status()
-    return _json(r, path)
+client = GatewayClient(BASE_URL, API_KEY)
 
 # ─── SIMs ───────────────────────────────────────────────────────────────────────
 _NUM_RE   = re.compile(r"\[([^\]]+)\]")
@@ -64,7 +67,7 @@ _PHONE_RE = re.compile(r"^\+\d{7,15}$")
 
 def fetch_sims() -> Dict[str, str]:
     """Retourne {phone: 'device_id|slot'}"""
-    data = api_get("/services/get-devices.php")
+    data = client.get_devices()
     out  = {}
     skip = []
     for dev in (data.get("data") or {}).get("devices", []):
@@ -77,35 +80,58 @@ def fetch_sims() -> Dict[str, str]:
             else:
                 skip.append(label)
     if skip:
-        print(f"[SIMS] Ignores: {skip}", flush=True)
+        log.warn("SIMS", "ignores", labels=skip)
     return out
 
 # ─── SEND ───────────────────────────────────────────────────────────────────────
-def send_sms(spec: str, to: str, msg: str):
+def _send_now(spec: str, to: str, msg: str):
     """GET /services/send.php?key=...&number=...&message=...&devices=DEVICE_ID|SLOT"""
-    r = requests.get(f"{BASE_URL}/services/send.php", headers=_h(), params={
-        **_p(), "number": to, "message": msg,
-        "devices": spec, "type": "sms", "prioritize": 1
-    }, timeout=30)
-    r.raise_for_status()
-    d = _json(r, "send")
-    if isinstance(d, dict) and d.get("success") is False:
-        err = d.get("error", {})
-        raise RuntimeError((err.get("message") if isinstance(err, dict) else str(err)))
-    print(f"  [SMS] {spec} -> {to}: {msg[:55]}", flush=True)
+    try:
+        d = client.send(spec, to, msg)
+        if isinstance(d, dict) and d.get("success") is False:
+            err = d.get("error", {})
+            raise RuntimeError((err.get("message") if isinstance(err, dict) else str(err)))
+    except Exception:
+        metrics.SEND_FAILURES.inc()
+        raise
+    metrics.SENDS.inc()
+    log.info("SMS", "envoye", sample=True, spec=spec, to=to, text=msg[:55])
+
+# Chaque envoi passe par la file de son telephone (send_dispatch)
+dispatcher = DeviceDispatcher()
+# ENGINE=sync : resultats des envois appliques par la boucle (drain_sends)
+sends      = SendCompletions()
+
+def send_sms(spec: str, to: str, msg: str):
+    """Retourne le Future de l envoi : un telephone lent ne bloque pas la boucle."""
+    return dispatcher.submit(spec, _send_now, spec, to, msg)
+
+def send_sms_async(spec: str, to: str, msg: str):
+    return asyncio.wrap_future(dispatcher.submit(spec, _send_now, spec, to, msg))
 
 # ─── MESSAGES RECUS ─────────────────────────────────────────────────────────────
-def fetch_received() -> List[dict]:
+def fetch_received(params: Optional[dict] = None) -> List[dict]:
     """
     GET /services/get-messages.php?status=Received
     Retourne: [{id, number (expediteur), message, deviceID, simSlot}, ...]
     """
-    d = api_get("/services/get-messages.php", {"status": "Received"})
+    d = client.get_messages("Received", **(params or {}))
     if not d or not d.get("success"):
         return []
     msgs = (d.get("data") or {}).get("messages", [])
     return msgs
 
+def poll_inbound(state):
+    """
+    Messages a traiter en ordre croissant, et le curseur a avancer apres
+    chaque message (None hors mode POLL_CURSOR=1).
+    """
+    if not POLL_CURSOR:
+        msgs = sorted(fetch_received(), key=lambda x: int(x.get("id") or x.get("ID") or 0))
+        return msgs, None
+    cursor = MessageCursor(state.setdefault("cursor", {}))
+    return cursor.select(fetch_received(cursor.params())), cursor
+
 def msg_id(m: dict) -> str:
     mid = m.get("id") or m.get("ID")
     if mid:
@@ -118,54 +144,142 @@ def blank():
         "convs":  {},   # {sortedA|sortedB: {turn, status, last_sender}}
         "rr_idx": 0,
         "sims":   {},   # {phone: "dev|slot"}
-        "seen":   {},   # {msg_id: ts}
-        "rate":   {"global": [], "per": {}},
+        "seen":   {},   # DedupeStore: {wm: id, win: {msg_id: ts}}
+        "cursor": {},   # {last_id: int} (POLL_CURSOR=1)
+        "rate":   {},
     }
 
+# Sections stockees ligne a ligne en STATE_BACKEND=sqlite (le reste va dans kv)
+STATE_LAYOUT = {"convs": "convs", "sims": "sims", "seen": "dedupe", "rate": "rate"}
+_store = None
+
+def _get_store():
+    global _store
+    if _store is None:
+        _store = make_store(STATE_FILE, STATE_LAYOUT, prefix="rbs_")
+        if CONV_MATRIX:
+            _store = PairMatrixStore(_store, os.path.splitext(STATE_FILE)[0] + ".convs.bin")
+    return _store
+
 def load_state():
-    if not os.path.exists(STATE_FILE):
-        return blank()
     try:
-        with open(STATE_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return _get_store().load() or blank()
     except Exception:
         return blank()
 
 def save_state(state):
-    d   = os.path.dirname(os.path.abspath(STATE_FILE)) or "."
-    fd, tmp = tempfile.mkstemp(prefix="rbs_", suffix=".json", dir=d)
-    try:
-        with os.fdopen(fd, "w", encoding="utf-8") as f:
-            json.dump(state, f, ensure_ascii=False, indent=2)
-        os.replace(tmp, STATE_FILE)
-    except Exception:
-        try:
-            with open(STATE_FILE, "w", encoding="utf-8") as f:
-                json.dump(state, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"[WARN] save: {e}", flush=True)
-    finally:
-        if os.path.exists(tmp):
-            try: os.remove(tmp)
-            except: pass
+    t0 = clock.monotonic()
+    _get_store().save(state)
+    metrics.SAVE_SECONDS.observe(clock.monotonic() - t0)
+
+_persister = None
+
+def track_state(state):
+    """
+    Enveloppe l etat pour suivre ses mutations : flush_state() n ecrit que
+    si quelque chose a change, au plus une fois par STATE_FLUSH_S.
+    """
+    global _persister, _index, _progress
+    if CONV_MATRIX and not isinstance(state.get("convs"), PairMatrix):
+        state["convs"] = PairMatrix.from_dict(state.get("convs") or {})
+    _persister = StatePersister(_get_store())
+    _persister.install_shutdown_flush()
+    state     = _persister.track(state)
+    _index    = StateIndex(state)
+    _progress = RoundRobinProgress(state, "convs", "sims")
+    _persister.tracker.listeners += [_index.on_change, _progress.on_change]
+    return state
+
+def flush_state(force: bool = False) -> bool:
+    t0    = clock.monotonic()
+    wrote = _persister.flush() if force else _persister.maybe_flush()
+    if wrote:
+        metrics.SAVE_SECONDS.observe(clock.monotonic() - t0)
+        metrics.STATE_BYTES.set(metrics.state_bytes(STATE_FILE))
+    return wrote
+
+# ─── INDEX ──────────────────────────────────────────────────────────────────────
+class StateIndex:
+    """
+    Index inverses pour resoudre le SIM recepteur en O(1) :
+      by_spec   : "dev|slot" -> numero
+      active_of : numero -> cles des convs actives qui l impliquent
+    Tenu a jour par les mutations de l etat suivi (listener du Tracker).
+    """
+
+    def __init__(self, state):
+        self.state = state
+        self.rebuild()
+
+    def rebuild(self):
+        self._sims()
+        self._convs()
+
+    def _sims(self):
+        self.by_spec = {spec: num for num, spec in self.state.get("sims", {}).items()}
+
+    def _convs(self):
+        self.active_of = {}
+        for k, conv in self.state.get("convs", {}).items():
+            self._conv(k, conv)
+
+    def _conv(self, key: str, conv):
+        active = isinstance(conv, Mapping) and conv.get("status") == "active"
+        for num in key.split("|", 1):
+            keys = self.active_of.get(num)
+            if active:
+                self.active_of.setdefault(num, set()).add(key)
+            elif keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.active_of[num]
+
+    def on_change(self, path: tuple, op: str, value):
+        if not path:
+            self.rebuild()
+        elif path[0] == "sims":
+            self._sims()
+        elif path[0] == "convs":
+            if len(path) == 1:
+                self._convs()
+            elif len(path) == 2 or path[2] == "status":
+                self._conv(path[1], self.state.get("convs", {}).get(path[1]))
+
+    def receiver(self, from_num: str, dev_id, slot):
+        """(spec, numero) du SIM qui a recu le message de from_num, sinon (None, None)."""
+        sims = self.state.get("sims", {})
+        if dev_id is not None and slot is not None:
+            num = self.by_spec.get(f"{dev_id}|{slot}")
+            if num is not None:
+                return sims[num], num
+        # Fallback: une conv active qui implique from_num
+        for key in self.active_of.get(from_num, ()):
+            a, b = key.split("|", 1)
+            other = b if a == from_num else a
+            if other in sims:
+                return sims[other], other
+        return None, None
+
+_index    = None
+_progress = None
+
+def _state_index(state) -> StateIndex:
+    if _index is not None and _index.state is state:
+        return _index
+    return StateIndex(state)     # etat non suivi : index reconstruit a la volee
 
 # ─── RATE LIMIT ─────────────────────────────────────────────────────────────────
-def _prune(lst, w=60):
-    now = time.time()
-    return [t for t in lst if now - t <= w]
+def _limiter(state) -> RateLimiter:
+    return RateLimiter(state.setdefault("rate", {}), GLOBAL_SEND_PER_MIN, PER_SIM_SEND_PER_MIN)
 
 def can_send(state, spec: str) -> bool:
-    rate = state.setdefault("rate", {"global": [], "per": {}})
-    rate["global"] = _prune(rate.get("global", []))
-    per = rate.setdefault("per", {})
-    per[spec] = _prune(per.get(spec, []))
-    if len(rate["global"]) >= GLOBAL_SEND_PER_MIN:
-        return False
-    if len(per.get(spec, [])) >= PER_SIM_SEND_PER_MIN:
-        return False
-    rate["global"].append(time.time())
-    per.setdefault(spec, []).append(time.time())
-    return True
+    if _limiter(state).try_acquire(spec):
+        return True
+    metrics.RATE_LIMITED.inc()
+    return False
+
+def time_until_allowed(state, spec: str) -> float:
+    return _limiter(state).time_until_allowed(spec)
 
 # ─── ROUND-ROBIN ────────────────────────────────────────────────────────────────
 def tpl(turn: int) -> str:
@@ -177,78 +291,169 @@ def ck(a: str, b: str) -> str:
 def cur_sender(state, sims_list) -> str:
     return sims_list[state.get("rr_idx", 0) % len(sims_list)]
 
+def _rr_progress(state) -> RoundRobinProgress:
+    if _progress is not None and _progress.state is state:
+        return _progress
+    return RoundRobinProgress(state, "convs", "sims")   # etat non suivi : recompte
+
+def sorted_sims(state) -> List[str]:
+    """Liste triee des SIMs, en cache tant que state["sims"] ne change pas."""
+    return _rr_progress(state).sims_list(state.get("sims", {}))
+
 def sender_done(state, sender: str, sims_list) -> bool:
-    targets = [n for n in sims_list if n != sender]
-    if not targets:
-        return True
-    convs = state.get("convs", {})
-    return all(convs.get(ck(sender, t), {}).get("status") == "done" for t in targets)
+    return _rr_progress(state).sender_done(sender, sims_list)
+
+def reset_seen(state) -> int:
+    """Demarrage / fin de cycle. Retourne le watermark conserve (0 si seen vide)."""
+    if not RESUME_WATERMARK:
+        state["seen"] = {}
+        return 0
+    return DedupeStore(state.setdefault("seen", {})).checkpoint()
 
 def advance_rr(state, sims_list) -> str:
     new_idx = (state.get("rr_idx", 0) + 1) % len(sims_list)
     state["rr_idx"] = new_idx
     if new_idx == 0:
-        state["convs"] = {}
-        state["seen"]  = {}
-        print("[RR] Nouveau cycle complet", flush=True)
+        state.setdefault("convs", {}).clear()
+        reset_seen(state)
+        log.info("RR", "nouveau cycle complet")
     ns = sims_list[new_idx]
-    print(f"[RR] Emetteur suivant -> {ns} (idx={new_idx})", flush=True)
+    log.info("RR", "emetteur suivant", sender=ns, idx=new_idx)
     return ns
 
+def _rr_sender(state, sims_list) -> str:
+    sender = cur_sender(state, sims_list)
+    if sender_done(state, sender, sims_list):
+        log.info("RR", "emetteur termine", sender=sender)
+        sender = advance_rr(state, sims_list)
+    return sender
+
+def _open_ok(state, key: str, sender: str):
+    state.setdefault("convs", {})[key] = {
+        "turn": 1, "status": "active",
+        "last_sender": sender, "at": clock.now()
+    }
+
+def _open_err(state, key: str, sender: str, target: str, e: Exception):
+    log.error("SMS", "ouverture en erreur", sender=sender, to=target, err=str(e))
+    state.setdefault("convs", {})[key] = {
+        "turn": 0, "status": "done", "err": str(e)
+    }
+
+def _active_count(state) -> int:
+    return _rr_progress(state).active
+
+_opening = set()   # cles de conv dont l ouverture est en vol
+
+def _open(state, sender: str, spec: str, target: str, key: str) -> None:
+    """Soumet le 1er message ; la conv est creee par _opened au drain."""
+    _opening.add(key)
+    try:
+        sends.watch(send_sms(spec, target, tpl(1)), _opened, state, key, sender, target)
+    except Exception as e:
+        _opening.discard(key)
+        _open_err(state, key, sender, target, e)
+
+def _opened(fut, state, key: str, sender: str, target: str) -> dict:
+    try:
+        fut.result()
+        _open_ok(state, key, sender)
+        return {"opened": key}
+    except Exception as e:
+        _open_err(state, key, sender, target, e)
+        return {"err": str(e), "key": key}
+    finally:
+        _opening.discard(key)
+
 def rr_tick(state) -> dict:
     sims = state.get("sims", {})
     if len(sims) < 2:
         return {"skip": "not_enough_sims"}
 
-    sims_list = sorted(sims.keys())
-    sender    = cur_sender(state, sims_list)
-
-    if sender_done(state, sender, sims_list):
-        print(f"[RR] {sender} termine", flush=True)
-        sender = advance_rr(state, sims_list)
+    sims_list = sorted_sims(state)
+    sender    = _rr_sender(state, sims_list)
 
     spec    = sims[sender]
     targets = [n for n in sims_list if n != sender]
-    sent = skip = 0
+    queued = skip = 0
+    retried = []    # reponses reportees parties pendant admit()
 
     for target in targets:
         key  = ck(sender, target)
         conv = state.get("convs", {}).get(key)
 
-        if conv is None:
-            # Premier envoi
-            if not can_send(state, spec):
+        if conv is None and key not in _opening:
+            # Premier envoi : file du telephone, resultat applique au drain
+            ok, drained = admission.admit(state, PRIO_OPENER, spec)
+            retried += drained
+            if not ok:
                 skip += 1
                 continue
-            try:
-                send_sms(spec, target, tpl(1))
-                state.setdefault("convs", {})[key] = {
-                    "turn": 1, "status": "active",
-                    "last_sender": sender, "at": time.time()
-                }
-                sent += 1
-                time.sleep(random.uniform(1.5, 3.0))
-            except Exception as e:
-                print(f"  [ERR] {sender}->{target}: {e}", flush=True)
-                state.setdefault("convs", {})[key] = {
-                    "turn": 0, "status": "done", "err": str(e)
-                }
+            _open(state, sender, spec, target, key)
+            queued += 1
+        elif conv is not None and conv.get("status") == "done":
+            skip += 1
+
+    return {"sender": sender, "queued": queued, "opening": len(_opening),
+            "skip": skip, "active": _active_count(state), "replies": retried}
+
+# ─── TOURNOI (RR_MODE=tournament) ───────────────────────────────────────────────
+def _tournament_round(state, sims_list):
+    """
+    Paires de la ronde courante ; passe a la ronde suivante quand elles sont
+    toutes terminees (fin de cycle : convs et seen remis a zero comme advance_rr).
+    """
+    n_rounds = round_count(len(sims_list))
+    r        = state.get("rr_round", 0) % n_rounds
+    pairs    = round_pairs(sims_list, r)
+    convs    = state.get("convs", {})
+    if all(convs.get(ck(a, b), {}).get("status") == "done" for a, b in pairs):
+        r = (r + 1) % n_rounds
+        state["rr_round"] = r
+        if r == 0:
+            state.setdefault("convs", {}).clear()
+            reset_seen(state)
+            log.info("RR", "nouveau cycle complet", mode="tournament")
+        pairs = round_pairs(sims_list, r)
+        log.info("RR", "ronde", round=r + 1, rounds=n_rounds, pairs=len(pairs))
+    return r, pairs
+
+def tournament_tick(state) -> dict:
+    sims = state.get("sims", {})
+    if len(sims) < 2:
+        return {"skip": "not_enough_sims"}
+
+    r, pairs = _tournament_round(state, sorted_sims(state))
+    queued = skip = 0
+    retried = []    # reponses reportees parties pendant admit()
+
+    # Un envoi par SIM dans la ronde : tous soumis d un coup aux files par
+    # telephone, resultats appliques au drain (un telephone lent ne bloque pas les autres)
+    for sender, target in pairs:
+        key  = ck(sender, target)
+        conv = state.get("convs", {}).get(key)
+        if conv is None and key not in _opening:
+            ok, drained = admission.admit(state, PRIO_OPENER, sims[sender])
+            retried += drained
+            if not ok:
                 skip += 1
-        elif conv.get("status") == "done":
+                continue
+            _open(state, sender, sims[sender], target, key)
+            queued += 1
+        elif conv is not None and conv.get("status") == "done":
             skip += 1
 
-    active = sum(1 for c in state.get("convs", {}).values() if c.get("status") == "active")
-    return {"sender": sender, "sent": sent, "skip": skip, "active": active}
+    return {"round": r, "pairs": len(pairs), "queued": queued, "opening": len(_opening),
+            "skip": skip, "active": _active_count(state), "replies": retried}
 
 # ─── MESSAGES ENTRANTS ──────────────────────────────────────────────────────────
-def process(state, msg: dict):
-    """
-    get-messages.php retourne:
-      number   = expediteur (un de nos SIMs)
-      deviceID = device qui a recu
-      simSlot  = slot du SIM recepteur
+_replying: Dict[str, int] = {}   # cle de conv -> tour de la reponse programmee, pas encore partie
 
-    On repond DEPUIS le SIM recepteur VERS l expediteur.
+def _reply_plan(state, msg: dict, deduped: bool = False):
+    """
+    Partie sans I/O de process() : dedupe, SIM recepteur, conv.
+    Retourne (resultat, None) si rien a envoyer, sinon (None, plan).
+    deduped=True : l id a deja ete enregistre par l appelant (ingest async).
     """
     mid      = msg_id(msg)
     from_num = (msg.get("number") or "").strip()
@@ -256,210 +461,524 @@ def process(state, msg: dict):
     slot     = msg.get("simSlot")
 
     if not mid or not from_num:
-        return None
+        return None, None
 
     # Deduplication
-    seen = state.setdefault("seen", {})
-    if mid in seen:
-        return None
-    seen[mid] = time.time()
+    if not deduped and not DedupeStore(state.setdefault("seen", {})).add(mid):
+        metrics.DUPLICATES.inc()
+        return None, None
+    metrics.INBOUND.inc()
 
     sims = state.get("sims", {})
 
     # L expediteur doit etre un de nos SIMs
     if from_num not in sims:
-        return None
+        return None, None
 
-    # Identifier le SIM recepteur via deviceID+simSlot
-    receiver_spec = receiver_num = None
-    if dev_id is not None and slot is not None:
-        candidate = f"{dev_id}|{slot}"
-        for num, spec in sims.items():
-            if spec == candidate:
-                receiver_spec, receiver_num = spec, num
-                break
-
-    # Fallback: chercher la conv active qui implique from_num
-    if not receiver_spec:
-        convs = state.get("convs", {})
-        for k, conv in convs.items():
-            if conv.get("status") != "active":
-                continue
-            parts = k.split("|", 1)
-            if len(parts) != 2:
-                continue
-            a, b = parts
-            if from_num == a and b in sims:
-                receiver_num, receiver_spec = b, sims[b]
-                break
-            if from_num == b and a in sims:
-                receiver_num, receiver_spec = a, sims[a]
-                break
+    # Identifier le SIM recepteur via deviceID+simSlot, sinon via une conv active
+    receiver_spec, receiver_num = _state_index(state).receiver(from_num, dev_id, slot)
 
     if not receiver_spec or not receiver_num:
-        print(f"  [SKIP] cant identify receiver for from={from_num} dev={dev_id} slot={slot}", flush=True)
-        return {"skip": "no_receiver", "from": from_num}
+        log.warn("IN", "recepteur introuvable", sample=True, **{"from": from_num}, dev=dev_id, slot=slot)
+        return {"skip": "no_receiver", "from": from_num}, None
 
     key  = ck(from_num, receiver_num)
     convs = state.setdefault("convs", {})
     conv  = convs.get(key)
 
     if conv is None:
-        conv = {"turn": 1, "status": "active",
-                "last_sender": from_num, "at": time.time()}
-        convs[key] = conv
+        convs[key] = {"turn": 1, "status": "active",
+                      "last_sender": from_num, "at": clock.now()}
+        conv = convs[key]
 
     if conv.get("status") == "done":
-        return {"skip": "done", "key": key}
+        return {"skip": "done", "key": key}, None
+
+    # Une reponse deja programmee pour cette conv calculerait le meme tour
+    if key in _replying:
+        return {"skip": "reply_pending", "key": key}, None
 
     turn = int(conv.get("turn", 1))
     if turn >= MAX_TURNS:
         conv["status"] = "done"
-        print(f"  [DONE] {key}", flush=True)
-        return {"done": key}
-
-    if not can_send(state, receiver_spec):
-        return {"skip": "rate", "key": key}
+        log.info("DONE", "conv terminee", sample=True, key=key)
+        return {"done": key}, None
 
     next_turn = turn + 1
-    reply     = tpl(next_turn)
+    _replying[key] = next_turn
+    return None, {"key": key, "spec": receiver_spec, "from": receiver_num,
+                  "to": from_num, "turn": next_turn, "text": tpl(next_turn)}
+
+def _live_conv(state, plan) -> Optional[dict]:
+    """
+    Conv relue a l echeance de la reponse : None si elle a disparu (fin de
+    cycle, SIM retiree), est terminee ou a deja avance depuis le plan.
+    """
+    conv = state.get("convs", {}).get(plan["key"])
+    if not conv or conv.get("status") == "done":
+        return None
+    if int(conv.get("turn", 1)) != plan["turn"] - 1:
+        return None
+    return conv
+
+replies   = ReplyScheduler()
+admission = AdmissionQueue(can_send, time_until_allowed,
+                           lambda state: _limiter(state).global_wait(), replies.schedule)
+
+def _apply_reply(plan, conv) -> dict:
+    key, next_turn = plan["key"], plan["turn"]
+    conv["turn"]        = next_turn
+    conv["last_sender"] = plan["from"]
+    conv["at"]          = clock.now()
+    if next_turn >= MAX_TURNS:
+        conv["status"] = "done"
+        log.info("DONE", "conv terminee", sample=True, key=key)
+    log.info("REPLY", "reponse envoyee", sample=True, **{"from": plan["from"]}, to=plan["to"], turn=next_turn)
+    return {"replied": key, "turn": next_turn}
+
+def process(state, msg: dict):
+    """
+    get-messages.php retourne:
+      number   = expediteur (un de nos SIMs)
+      deviceID = device qui a recu
+      simSlot  = slot du SIM recepteur
+
+    On repond DEPUIS le SIM recepteur VERS l expediteur.
+    La reponse n est pas envoyee ici : elle est programmee dans `replies`
+    et partira pendant l attente de la boucle principale.
+    """
+    res, plan = _reply_plan(state, msg)
+    if plan is None:
+        return res
 
     delay = random.randint(REPLY_DELAY_MIN_S, REPLY_DELAY_MAX_S)
-    time.sleep(delay)
+    replies.schedule(delay, _submit_reply, state, plan)
+    return {"scheduled": plan["key"], "turn": plan["turn"], "in": delay}
+
+def _submit_reply(state, plan):
+    """Echeance de `replies` : envoi prioritaire, reporte (pas perdu) si le debit est plein."""
+    return admission.submit(state, PRIO_REPLY, plan["spec"], _send_reply, state, plan)
 
+def _send_reply(state, plan) -> dict:
+    """Soumet la reponse a la file du telephone ; _reply_sent l applique au drain."""
+    conv = _live_conv(state, plan)
+    if conv is None:
+        _replying.pop(plan["key"], None)
+        return {"skip": "conv_gone", "key": plan["key"], "turn": plan["turn"]}
     try:
-        send_sms(receiver_spec, from_num, reply)
-        conv["turn"]        = next_turn
-        conv["last_sender"] = receiver_num
-        conv["at"]          = time.time()
-        if next_turn >= MAX_TURNS:
-            conv["status"] = "done"
-            print(f"  [DONE] {key}", flush=True)
-        print(f"  [REPLY] {receiver_num} -> {from_num} tour={next_turn}", flush=True)
-        return {"replied": key, "turn": next_turn}
+        sends.watch(send_sms(plan["spec"], plan["to"], plan["text"]), _reply_sent, state, plan)
     except Exception as e:
-        return {"err": str(e), "key": key}
+        _replying.pop(plan["key"], None)
+        return {"err": str(e), "key": plan["key"]}
+    return {"sending": plan["key"], "turn": plan["turn"]}
+
+def _reply_sent(fut, state, plan) -> dict:
+    try:
+        fut.result()
+        conv = _live_conv(state, plan)
+        if conv is None:
+            return {"skip": "conv_gone", "key": plan["key"], "turn": plan["turn"]}
+        return _apply_reply(plan, conv)
+    except Exception as e:
+        return {"err": str(e), "key": plan["key"]}
+    finally:
+        _replying.pop(plan["key"], None)
 
 # ─── MAIN ───────────────────────────────────────────────────────────────────────
-def run():
+def _apply_sims(state, fresh: Dict[str, str]):
+    """
+    Remplace la liste des SIMs et purge les convs avec numeros invalides.
+    Ne touche l etat que si quelque chose change (pas d ecriture a vide).
+    """
+    valid = set(fresh.keys())
+    convs = state.setdefault("convs", {})
+    for k in [k for k in convs if not all(p in valid for p in k.split("|", 1))]:
+        del convs[k]
+    if state.get("sims") != fresh:
+        state["sims"] = fresh
+
+def _log_new(msgs: List[dict], seen_ids) -> int:
+    new_msgs = [m for m in msgs if msg_id(m) not in seen_ids]
+    if new_msgs:
+        log.info("INBOUND", "nouveaux messages", new=len(new_msgs), total=len(msgs))
+        if not log.enabled(DEBUG):
+            return len(new_msgs)
+        for m in new_msgs:
+            log.debug("INBOUND", "message", sample=True, **{"from": m.get("number")},
+                      dev=m.get("deviceID"), slot=m.get("simSlot"), id=m.get("id") or m.get("ID"),
+                      text=str(m.get("message", ""))[:40])
+    return len(new_msgs)
+
+def _startup():
     if not API_KEY:
         raise SystemExit("SMS_GATEWAY_API_KEY manquant.")
 
-    print("AutoChat ExaGate v4 — Round-Robin Broadcast", flush=True)
-    print(f"BASE_URL = {BASE_URL}", flush=True)
+    log.info("INIT", "AutoChat ExaGate v4 — Round-Robin Broadcast", base_url=BASE_URL)
 
     # Test connexion
     try:
-        r = requests.get(f"{BASE_URL}/services/get-devices.php",
-                         headers=_h(), params=_p(), timeout=10)
-        print(f"[INIT] connexion -> {r.status_code}", flush=True)
+        r = client.request("GET", EP_DEVICES, timeout=10)
+        log.info("INIT", "connexion", status=r.status_code)
         if r.status_code != 200:
-            print(f"[INIT] body: {r.text[:200]}", flush=True)
+            log.warn("INIT", "connexion", status=r.status_code, body=r.text[:200])
     except Exception as e:
         raise SystemExit(f"Connexion impossible: {e}")
 
-    # Charger etat (toujours reset seen au demarrage)
+    # Charger etat (seen repart du watermark persiste, ou vide si RESUME_WATERMARK=0)
     state = blank() if os.getenv("RESET_STATE", "0") == "1" else load_state()
-    state["seen"] = {}  # toujours vider seen au demarrage pour ne pas rater de msgs
+    wm    = reset_seen(state)
     if os.getenv("RESET_STATE", "0") == "1":
-        print("[INIT] RESET_STATE=1 — etat vierge", flush=True)
+        log.info("INIT", "RESET_STATE=1 — etat vierge")
+    elif wm:
+        log.info("INIT", "reprise apres le watermark, convs conservees", watermark=wm)
     else:
-        print("[INIT] seen vide, convs conservees", flush=True)
+        log.info("INIT", "seen vide, convs conservees")
 
     # Recuperer SIMs
     try:
         sims = fetch_sims()
         if len(sims) < 2:
             raise SystemExit(f"Seulement {len(sims)} SIM(s), minimum 2.")
-        # Purger convs avec numeros invalides
-        valid = set(sims.keys())
-        state["convs"] = {k: v for k, v in state.get("convs", {}).items()
-                          if all(p in valid for p in k.split("|", 1))}
-        state["sims"]  = sims
+        _apply_sims(state, sims)
         save_state(state)
-        print(f"[INIT] {len(sims)} SIMs valides:", flush=True)
-        for num, spec in sorted(sims.items()):
-            print(f"  {num} -> {spec}", flush=True)
+        log.info("INIT", "SIMs valides", count=len(sims), sims=dict(sorted(sims.items())))
     except SystemExit:
         raise
     except Exception as e:
         raise SystemExit(f"Erreur SIMs: {e}")
 
-    print(f"\nDemarrage dans 3s... MAX_TURNS={MAX_TURNS}\n", flush=True)
-    time.sleep(3)
-
-    last_refresh = 0.0
-    last_tick    = 0.0
+    log.info("INIT", "demarrage dans 3s", max_turns=MAX_TURNS, rr_mode=RR_MODE)
+    clock.sleep(3)
+    return state
+
+def export_metrics(state):
+    """Jauges de /metrics, posees depuis la boucle (l etat n est pas lu par le thread HTTP)."""
+    metrics.ACTIVE_CONVS.set(_active_count(state))
+    metrics.RR_POSITION.set(state.get("rr_round" if RR_MODE == "tournament" else "rr_idx", 0))
+    metrics.PENDING_REPLIES.set(len(replies), queue="scheduled")
+    metrics.PENDING_REPLIES.set(len(admission), queue="deferred")
+    metrics.PENDING_REPLIES.set(max(0, len(_tasks) - len(_opening)), queue="async")
+    metrics.PENDING_REPLIES.set(len(sends), queue="sending")
+    metrics.SIMS.set(len(state.get("sims", {})))
+    metrics.set_send_queue(dispatcher.gauges())
+    metrics.POLL_INTERVAL.set(poller.interval)
+
+# Temps par phase (refresh / inbound / tick / save / wait) + cProfile / tracemalloc sur signal
+profiler = LoopProfiler()
+# Intervalle de get-messages selon le trafic attendu (POLL_ADAPTIVE=1)
+poller   = AdaptivePoller(POLL_INTERVAL_S)
+# Messages pousses par le gateway (WEBHOOK_PORT) ; le poll devient un rattrapage
+inbox    = WebhookInbox()
+
+def _pending_replies() -> int:
+    # programmees, reportees, en vol (sync) ou en tache (async) : toutes dans _replying
+    return len(_replying)
+
+def drain_sends() -> list:
+    """ENGINE=sync : applique les envois termines (convs, log) ; thread de la boucle."""
+    done = sends.drain()
+    if done:
+        log.results("SEND", done)
+        poller.snap()
+    return done
+
+def _record_poll(state, new: int) -> None:
+    before = poller.interval
+    poller.record(new, _active_count(state), _pending_replies())
+    if poller.enabled and poller.interval != before:
+        log.debug("POLL", "intervalle", interval_s=poller.interval, new=new)
+
+def _start_push() -> None:
+    if inbox.start():
+        poller.enabled = False       # intervalle fixe : seul le balayage WEBHOOK_SWEEP_S interroge
+
+def _poll_due() -> bool:
+    return inbox.sweep_due() if inbox.running else poller.due()
+
+def _ingest(state, msgs: List[dict], cursor=None, tag: str = "IN") -> int:
+    """Traite une page de get-messages ou un lot pousse ; retourne le nombre de nouveaux."""
+    new = _log_new(msgs, DedupeStore(state.setdefault("seen", {})))
+    results = []
+    for m in msgs:
+        r = process(state, m)
+        if cursor:
+            cursor.advance(m)
+        if r is not None:
+            results.append(r)
+    if results:
+        log.results(tag, results)
+    return new
+
+def run_once(state, timers: Dict[str, float]) -> bool:
+    """
+    Une iteration de la boucle principale (refresh SIMs, poll, tick), sans
+    l attente finale. timers = {"refresh": ts, "tick": ts}, mis a jour ici.
+    Retourne False si trop peu de SIMs (deja attendu : pas de replies.sleep).
+    """
+    try:
+        now = clock.now()
 
-    while True:
-        try:
-            now = time.time()
+        # Rafraichissement SIMs
+        if now - timers.get("refresh", 0.0) >= SIM_REFRESH_S:
+            try:
+                fresh = fetch_sims()
+                if fresh:
+                    _apply_sims(state, fresh)
+                    timers["refresh"] = now
+                    log.info("SIMS", "rafraichies", count=len(fresh), sims=sorted(fresh))
+                    log.info("HTTP", "latences", latency=client.latency_stats(), send=dispatcher.gauges())
+            except Exception as e:
+                log.warn("SIMS", "refresh en erreur", err=str(e))
+        profiler.mark("refresh")
 
-            # Rafraichissement SIMs
-            if now - last_refresh >= SIM_REFRESH_S:
-                try:
-                    fresh = fetch_sims()
-                    if fresh:
-                        valid = set(fresh.keys())
-                        state["convs"] = {k: v for k, v in state.get("convs", {}).items()
-                                          if all(p in valid for p in k.split("|", 1))}
-                        state["sims"] = fresh
-                        last_refresh  = now
-                        print(f"[SIMS] {len(fresh)}: {sorted(fresh.keys())}", flush=True)
-                except Exception as e:
-                    print(f"[WARN refresh] {e}", flush=True)
+        sims = state.get("sims", {})
+        if len(sims) < 2:
+            clock.sleep(15)
+            return False
 
-            sims = state.get("sims", {})
-            if len(sims) < 2:
-                time.sleep(15)
-                continue
+        # ── Messages entrants → reponse tac-a-tac ─────────────────────
+        drain_sends()                  # convs a jour avant de traiter les reponses recues
+        pushed = inbox.drain()
+        if pushed:
+            try:
+                _ingest(state, pushed, tag="PUSH")
+            except Exception as e:
+                log.error("PUSH", "lot pousse en erreur", err=str(e), exc_info=True)
+        if _poll_due():
+            new = 0
+            try:
+                msgs, cursor = poll_inbound(state)
+                new = _ingest(state, msgs, cursor)
+            except Exception as e:
+                log.error("IN", "inbound en erreur", err=str(e), exc_info=True)
+            finally:
+                _record_poll(state, new)
+        profiler.mark("inbound")
 
-            # ── Messages entrants → reponse tac-a-tac ─────────────────────
+        # ── Tick round-robin ───────────────────────────────────────────
+        if now - timers.get("tick", 0.0) >= RR_TICK_S:
             try:
-                msgs = sorted(fetch_received(),
-                              key=lambda x: int(x.get("id") or x.get("ID") or 0))
-
-                seen_ids = state.get("seen", {})
-                new_msgs = [m for m in msgs if msg_id(m) not in seen_ids]
-
-                if new_msgs:
-                    print(f"[INBOUND] {len(new_msgs)} nouveau(x) sur {len(msgs)} total", flush=True)
-                    for m in new_msgs:
-                        print(f"  from={m.get('number')!r} dev={m.get('deviceID')} "
-                              f"slot={m.get('simSlot')} id={m.get('id') or m.get('ID')} "
-                              f"msg={str(m.get('message',''))[:40]!r}", flush=True)
-
-                results = []
-                for m in msgs:
-                    r = process(state, m)
-                    if r is not None:
-                        results.append(r)
-                if results:
-                    print(f"[IN] {results}", flush=True)
+                rr = tournament_tick(state) if RR_MODE == "tournament" else rr_tick(state)
+                timers["tick"] = now
+                retried = rr.pop("replies", [])
+                if retried:
+                    log.results("REPLY", retried)
+                if rr.get("queued", 0) > 0 or retried:
+                    poller.snap()
+                if rr.get("queued", 0) > 0 or rr.get("active", 0) > 0:
+                    log.info("RR", "tick", **rr)
+            except Exception as e:
+                log.error("RR", "tick en erreur", err=str(e))
+        profiler.mark("tick")
+
+        flush_state()
+        export_metrics(state)
+        profiler.mark("save")
+
+    except Exception as e:
+        log.error("LOOP", "iteration en erreur", err=repr(e), exc_info=True)
+    return True
 
+def wait_next_poll() -> list:
+    """
+    Attente du prochain poll (POLL_INTERVAL_S, moins si le poller l attend plus
+    tot) : les reponses programmees partent pendant ce temps, un push l ecourte.
+    """
+    done = replies.sleep(poller.wait_s(), wake=inbox.wait if inbox.running else None)
+    if done:
+        log.results("REPLY", done)
+        poller.snap()
+    return done + drain_sends()
+
+def run():
+    state  = track_state(_startup())
+    metrics.serve()
+    _start_push()
+    profiler.install_signals()
+    timers = {"refresh": 0.0, "tick": 0.0}
+
+    while True:
+        profiler.begin()
+        if run_once(state, timers):
+            try:
+                wait_next_poll()
             except Exception as e:
-                import traceback
-                print(f"[ERR inbound] {e}", flush=True)
-                traceback.print_exc()
+                log.error("LOOP", "attente en erreur", err=repr(e), exc_info=True)
+        profiler.mark("wait")
+        profiler.end()
 
-            # ── Tick round-robin ───────────────────────────────────────────
-            if now - last_tick >= RR_TICK_S:
-                try:
-                    rr = rr_tick(state)
-                    last_tick = now
-                    if rr.get("sent", 0) > 0 or rr.get("active", 0) > 0:
-                        print(f"[RR] {rr}", flush=True)
-                except Exception as e:
-                    print(f"[ERR tick] {e}", flush=True)
+# ─── ASYNC ──────────────────────────────────────────────────────────────────────
+# Meme logique que run(), mais envois / poll / refresh sont des coroutines :
+# les ouvertures d un emetteur partent en parallele, bornees par AsyncSendLimiter
+# (can_send + semaphores) au lieu de send + sleep en serie.
+_tasks   = set()
 
-            save_state(state)
+async def _open_async(state, limiter, sender: str, spec: str, target: str, key: str):
+    try:
+        async with limiter.slot(spec, PRIO_OPENER):
+            await send_sms_async(spec, target, tpl(1))
+        _open_ok(state, key, sender)
+    except Exception as e:
+        _open_err(state, key, sender, target, e)
+    finally:
+        _opening.discard(key)
 
-        except Exception as e:
-            import traceback
-            print(f"[ERR loop] {repr(e)}", flush=True)
-            traceback.print_exc()
+async def rr_tick_async(state, limiter) -> dict:
+    sims = state.get("sims", {})
+    if len(sims) < 2:
+        return {"skip": "not_enough_sims"}
 
-        time.sleep(POLL_INTERVAL_S)
+    sims_list = sorted_sims(state)
+    sender    = _rr_sender(state, sims_list)
+    spec      = sims[sender]
+    queued = skip = 0
+
+    for target in sims_list:
+        if target == sender:
+            continue
+        key  = ck(sender, target)
+        conv = state.get("convs", {}).get(key)
+        if conv is None and key not in _opening:
+            _opening.add(key)
+            spawn(_tasks, _open_async(state, limiter, sender, spec, target, key))
+            queued += 1
+        elif conv is not None and conv.get("status") == "done":
+            skip += 1
+
+    return {"sender": sender, "queued": queued, "opening": len(_opening),
+            "skip": skip, "active": _active_count(state)}
+
+async def tournament_tick_async(state, limiter) -> dict:
+    sims = state.get("sims", {})
+    if len(sims) < 2:
+        return {"skip": "not_enough_sims"}
+
+    r, pairs = _tournament_round(state, sorted_sims(state))
+    queued = skip = 0
+
+    for sender, target in pairs:
+        key  = ck(sender, target)
+        conv = state.get("convs", {}).get(key)
+        if conv is None and key not in _opening:
+            _opening.add(key)
+            spawn(_tasks, _open_async(state, limiter, sender, sims[sender], target, key))
+            queued += 1
+        elif conv is not None and conv.get("status") == "done":
+            skip += 1
+
+    return {"round": r, "pairs": len(pairs), "queued": queued, "opening": len(_opening),
+            "skip": skip, "active": _active_count(state)}
+
+async def process_async(state, msg: dict, limiter, deduped: bool = False):
+    res, plan = _reply_plan(state, msg, deduped)
+    if plan is None:
+        return res
+    try:
+        await asyncio.sleep(random.randint(REPLY_DELAY_MIN_S, REPLY_DELAY_MAX_S))
+        async with limiter.slot(plan["spec"], PRIO_REPLY):
+            conv = _live_conv(state, plan)
+            if conv is None:
+                return {"skip": "conv_gone", "key": plan["key"], "turn": plan["turn"]}
+            await send_sms_async(plan["spec"], plan["to"], plan["text"])
+        return _apply_reply(plan, conv)
+    except Exception as e:
+        return {"err": str(e), "key": plan["key"]}
+    finally:
+        _replying.pop(plan["key"], None)
+
+async def _reply_and_log(state, msg: dict, limiter):
+    # id deja enregistre dans seen par ingest(), avant spawn()
+    r = await process_async(state, msg, limiter, deduped=True)
+    if r is not None:
+        log.info("IN", "resultat", sample=True, **r)
+        if "replied" in r:
+            poller.snap()
+
+async def _main_async(state):
+    install_executor()
+    limiter = AsyncSendLimiter(lambda spec: can_send(state, spec),
+                               wait_hint=lambda spec: time_until_allowed(state, spec),
+                               global_wait=lambda: _limiter(state).global_wait())
+
+    async def refresh():
+        with profiler.phase("refresh"):
+            fresh = await to_thread(fetch_sims)
+            if fresh:
+                _apply_sims(state, fresh)
+                log.info("SIMS", "rafraichies", count=len(fresh), sims=sorted(fresh))
+                log.info("HTTP", "latences", latency=client.latency_stats(), send=dispatcher.gauges())
+
+    def ingest(msgs, cursor=None) -> int:
+        seen = DedupeStore(state.setdefault("seen", {}))
+        new  = _log_new(msgs, seen)
+        for m in msgs:
+            # Enregistre avant spawn() : un poll / push qui repasse le meme
+            # message avant que la tache ne tourne ne la duplique pas
+            if seen.add(msg_id(m)):
+                spawn(_tasks, _reply_and_log(state, m, limiter))
+            else:
+                metrics.DUPLICATES.inc()
+            if cursor:
+                cursor.advance(m)
+        return new
+
+    async def inbound():
+        if len(state.get("sims", {})) < 2 or not _poll_due():
+            return
+        profiler.begin()
+        new = 0
+        try:
+            with profiler.phase("inbound"):
+                msgs, cursor = await to_thread(poll_inbound, state)
+                new = ingest(msgs, cursor)
+        finally:
+            _record_poll(state, new)
+        profiler.end()
+
+    async def push():
+        # Reveille par le thread HTTP du webhook (call_soon_threadsafe)
+        woken = asyncio.Event()
+        loop  = asyncio.get_running_loop()
+        inbox.on_push = lambda: loop.call_soon_threadsafe(woken.set)
+        while True:
+            pushed = inbox.drain()
+            if pushed:
+                try:
+                    with profiler.phase("push"):
+                        ingest(pushed)
+                except Exception as e:
+                    log.error("PUSH", "lot pousse en erreur", err=repr(e), exc_info=True)
+            await woken.wait()
+            woken.clear()
+
+    async def tick():
+        tick_fn = tournament_tick_async if RR_MODE == "tournament" else rr_tick_async
+        with profiler.phase("tick"):
+            rr = await tick_fn(state, limiter)
+        if rr.get("queued", 0) > 0:
+            poller.snap()
+        if rr.get("queued", 0) > 0 or rr.get("active", 0) > 0:
+            log.info("RR", "tick", **rr, inflight=limiter.in_flight, waiting=limiter.waiting)
+
+    async def save():
+        with profiler.phase("save"):
+            flush_state()
+            export_metrics(state)
+
+    await asyncio.gather(
+        *([push()] if inbox.running else []),
+        every(SIM_REFRESH_S,   refresh, "refresh"),
+        every(poller.wake_s,   inbound, "inbound"),
+        every(RR_TICK_S,       tick,    "tick"),
+        every(POLL_INTERVAL_S, save,    "save"),
+    )
+
+def run_async():
+    state = track_state(_startup())
+    metrics.serve()
+    _start_push()
+    profiler.install_signals()
+    asyncio.run(_main_async(state))
 
 if __name__ == "__main__":
-    run()
+    run_async() if os.getenv("ENGINE", "sync") == "async" else run()
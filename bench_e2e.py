@@ -0,0 +1,260 @@
+"""
+Benchmark de bout en bout (débit / latence) par taille de flotte
+================================================================
+Lance un worker (autochat_exagate.py et/ou rbsoft_auto_chat.py) en
+sous-processus contre fake_gateway servi en local, pour chaque taille de
+BENCH_SIZES, et ajoute une ligne JSON par run dans BENCH_OUT :
+
+  sends_per_s        envois acceptés par le gateway / s (depuis le 1er envoi)
+  reply_latency_ms   p50/p90/p99/max entre la livraison d'un message et
+                     l'envoi de la réponse en sens inverse (poll + planif + envoi)
+  cycle_s            temps jusqu'à ce que toutes les paires aient échangé
+                     leurs MAX_TURNS messages (null si pas fini dans la durée)
+  cpu_per_iter_ms    CPU du worker / nb de polls get-messages (≈ itérations)
+  state_bytes_per_min  octets écrits sur disque par le worker (write_bytes de
+                     /proc/<pid>/io, Linux ; logs envoyés vers /dev/null)
+
+Lancement :
+  python bench_e2e.py
+  BENCH_SIZES=10,100 BENCH_WORKERS=exagate,rbsoft BENCH_DURATION_S=30 python bench_e2e.py
+
+Les variables du worker (ENGINE, STATE_BACKEND, RR_MODE, MAX_TURNS...) et du
+faux gateway (FAKE_LATENCY_MS, FAKE_DELIVERY_DELAY_S...) passent telles
+quelles ; BENCH_WORKER_ENV ne fixe que des défauts adaptés au benchmark.
+Pour rbsoft, la découverte est pré-remplie dans l'état (pas de phase 1).
+"""
+import json
+import os
+import platform
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from fake_gateway import FakeGateway, serve_in_thread
+
+BENCH_SIZES      = [int(x) for x in os.getenv('BENCH_SIZES', '10,100,1000,5000').split(',') if x.strip()]
+BENCH_WORKERS    = [x.strip() for x in os.getenv('BENCH_WORKERS', 'exagate').split(',') if x.strip()]
+BENCH_DURATION_S = float(os.getenv('BENCH_DURATION_S', '60'))
+BENCH_OUT        = os.getenv('BENCH_OUT', 'bench_results.jsonl')
+BENCH_LOG_DIR    = os.getenv('BENCH_LOG_DIR', '')         # garde les logs des workers (comptés dans write_bytes)
+
+HERE    = os.path.dirname(os.path.abspath(__file__))
+WORKERS = {"exagate": "autochat_exagate.py", "rbsoft": "rbsoft_auto_chat.py"}
+
+# Défauts : pas de délai artificiel ni de limite de débit, pour mesurer le pipeline
+BENCH_WORKER_ENV = {
+    "ENGINE":                 "async",
+    "MAX_TURNS":              "4",
+    "POLL_INTERVAL_S":        "1",
+    "RR_TICK_S":              "1",
+    "RR_TICK_INTERVAL_S":     "1",
+    "REPLY_DELAY_MIN_S":      "0",
+    "REPLY_DELAY_MAX_S":      "0",
+    "GLOBAL_SEND_PER_MIN":    "1000000",
+    "PER_SIM_SEND_PER_MIN":   "1000000",
+    "SIM_REFRESH_INTERVAL_S": "3600",
+    "POLL_CURSOR":            "1",
+    "MSG_CURSOR_PARAM":       "last_id",
+    "SMS_GATEWAY_API_KEY":    "bench",
+}
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"n": 0, "p50": None, "p90": None, "p99": None, "max": None}
+    v = sorted(values)
+    pick = lambda q: round(v[min(len(v) - 1, int(q * len(v)))] * 1000, 1)
+    return {"n": len(v), "p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99),
+            "max": round(v[-1] * 1000, 1)}
+
+
+class RunRecorder:
+    """Listener du faux gateway : latence livraison→réponse, pic d'envois sur 60 s, avancement des paires."""
+
+    def __init__(self, pairs_total: int, msgs_per_pair: int):
+        self.pairs_total   = pairs_total
+        self.msgs_per_pair = msgs_per_pair
+        self.peak_per_min  = 0
+        self._last_min: Deque[float] = deque()    # instants des envois de la dernière minute
+        self.first_send: Optional[float] = None
+        self.last_send:  Optional[float] = None
+        self.cycle_at:   Optional[float] = None
+        self.latencies: List[float] = []
+        self._awaiting: Dict[tuple, float] = {}   # (qui doit répondre, à qui) → livré à
+        self._per_pair: Dict[tuple, int]   = {}
+        self.pairs_done = 0
+
+    def __call__(self, event: str, from_num: str, to_num: str, t: float) -> None:
+        if event == "deliver":
+            self._awaiting[(to_num, from_num)] = t
+            return
+        if event == "auto":                       # réponse du faux destinataire, pas du worker
+            self._awaiting.pop((from_num, to_num), None)
+            return
+        self.first_send = self.first_send if self.first_send is not None else t
+        self.last_send  = t
+        self._last_min.append(t)
+        while self._last_min[0] <= t - 60:
+            self._last_min.popleft()
+        self.peak_per_min = max(self.peak_per_min, len(self._last_min))
+        due = self._awaiting.pop((from_num, to_num), None)
+        if due is not None:
+            self.latencies.append(max(0.0, t - due))
+        pair = (from_num, to_num) if from_num < to_num else (to_num, from_num)
+        n = self._per_pair.get(pair, 0) + 1
+        self._per_pair[pair] = n
+        if n == self.msgs_per_pair:
+            self.pairs_done += 1
+            if self.pairs_done == self.pairs_total and self.cycle_at is None:
+                self.cycle_at = t
+
+
+def _write_bytes(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            for line in f:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _seed_rbsoft(workdir: str, sims: Dict[str, str], env: Dict[str, str]) -> None:
+    """État rbsoft avec la découverte déjà faite (sinon N SMS d'enregistrement en série)."""
+    sys.path.insert(0, HERE)
+    from rbsoft_auto_chat import _default_state
+    state = _default_state()
+    state["known_sims"] = dict(sims)
+    state["discovery"].update(done=True, confirmed_sims=dict(sims), all_sims=dict(sims))
+    path = os.path.join(workdir, env.get("STATE_FILE", "rbsoft_state.json"))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+
+
+def run_one(worker: str, sims: int, duration_s: float = BENCH_DURATION_S) -> dict:
+    gateway = FakeGateway(devices=sims, slots=1)
+    server  = serve_in_thread(gateway, port=0)
+    url     = "http://%s:%d" % server.server_address[:2]
+    env     = {**BENCH_WORKER_ENV, **os.environ, "SMS_GATEWAY_URL": url}
+    env.setdefault("PYTHONUNBUFFERED", "1")
+
+    turns       = int(env["MAX_TURNS"])
+    directed    = worker == "rbsoft" and env.get("RR_MODE", "sender") != "tournament"
+    pairs_total = sims * (sims - 1) // 2
+    recorder    = RunRecorder(pairs_total, turns * (2 if directed else 1))
+    gateway.listeners.append(recorder)
+
+    workdir = tempfile.mkdtemp(prefix=f"bench_{worker}_{sims}_")
+    if worker == "rbsoft":
+        _seed_rbsoft(workdir, {n: f"{d}|{s}" for n, (d, s) in gateway.sims.items()}, env)
+    log = subprocess.DEVNULL
+    if BENCH_LOG_DIR:
+        os.makedirs(BENCH_LOG_DIR, exist_ok=True)
+        log = open(os.path.join(BENCH_LOG_DIR, f"{worker}_{sims}.log"), "w")
+
+    cpu0  = resource.getrusage(resource.RUSAGE_CHILDREN)
+    t0    = time.monotonic()
+    proc  = subprocess.Popen([sys.executable, os.path.join(HERE, WORKERS[worker])],
+                             cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    wbytes = wbytes0 = _write_bytes(proc.pid)
+    try:
+        while time.monotonic() - t0 < duration_s and proc.poll() is None:
+            time.sleep(0.5)
+            wbytes = _write_bytes(proc.pid) if proc.poll() is None else wbytes
+            if recorder.cycle_at is not None:
+                break
+    finally:
+        exited = proc.poll()
+        if exited is None:
+            proc.send_signal(signal.SIGTERM)         # flush de l'état (install_shutdown_flush)
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+        elapsed = time.monotonic() - t0
+        cpu1 = resource.getrusage(resource.RUSAGE_CHILDREN)
+        server.shutdown()
+        server.server_close()
+        if log is not subprocess.DEVNULL:
+            log.close()
+
+    stats     = gateway.stats()
+    state_sz  = _dir_bytes(workdir)
+    shutil.rmtree(workdir, ignore_errors=True)
+    cpu_s     = (cpu1.ru_utime - cpu0.ru_utime) + (cpu1.ru_stime - cpu0.ru_stime)
+    polls     = stats["calls"].get("get_messages", 0)
+    window    = (recorder.last_send - recorder.first_send) if recorder.first_send is not None else 0.0
+    written   = (wbytes - wbytes0) if wbytes is not None and wbytes0 is not None else None
+    return {
+        "worker":            worker,
+        "engine":            env.get("ENGINE"),
+        "rr_mode":           env.get("RR_MODE", "sender"),
+        "state_backend":     env.get("STATE_BACKEND", "json"),
+        "sims":              sims,
+        "duration_s":        round(elapsed, 2),
+        "exit_code":         exited,             # non-null : le worker s'est arrêté seul
+        "sends":             stats["sent"],
+        "send_errors":       stats["errors"],
+        "sends_per_s":       round(stats["sent"] / window, 2) if window > 0 else None,
+        "peak_sends_per_min": recorder.peak_per_min,
+        "reply_latency_ms":  percentiles(recorder.latencies),
+        "pairs_total":       pairs_total,
+        "pairs_done":        recorder.pairs_done,
+        "cycle_s":           round(recorder.cycle_at - t0, 2) if recorder.cycle_at else None,
+        "polls":             polls,
+        "cpu_s":             round(cpu_s, 3),
+        "cpu_per_iter_ms":   round(cpu_s * 1000 / polls, 2) if polls else None,
+        "state_bytes_written": written,
+        "state_bytes_per_min": round(written * 60 / elapsed) if written is not None and elapsed else None,
+        "state_file_bytes":  state_sz,
+    }
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    meta = {"rev": _git_rev(), "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(), "host": platform.node()}
+    print(f"[BENCH] {meta} tailles={BENCH_SIZES} workers={BENCH_WORKERS} "
+          f"duree={BENCH_DURATION_S}s -> {BENCH_OUT}", flush=True)
+    for worker in BENCH_WORKERS:
+        if worker not in WORKERS:
+            raise SystemExit(f"worker inconnu: {worker} (choix: {', '.join(WORKERS)})")
+        for sims in BENCH_SIZES:
+            res = {**meta, **run_one(worker, sims)}
+            with open(BENCH_OUT, "a", encoding="utf-8") as f:
+                f.write(json.dumps(res) + "\n")
+            lat = res["reply_latency_ms"]
+            print(f"[BENCH] {worker} sims={sims} sends/s={res['sends_per_s']} "
+                  f"reply p50={lat['p50']}ms p99={lat['p99']}ms cycle={res['cycle_s']}s "
+                  f"cpu/iter={res['cpu_per_iter_ms']}ms state={res['state_bytes_per_min']}B/min",
+                  flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+Micro-benchmarks des fonctions chaudes (sans réseau)
+====================================================
+Chronomètre can_send, process / process_inbound, rr_tick / tick_round_robin,
+msg_id / msg_id_from, le parsing de fetch_sims et save_state / atomic_save
+sur un état synthétique (par défaut 1k SIMs, 500k convs, 1M ids vus), puis
+compare le meilleur temps (min, le moins bruité) de chaque mesure à une
+baseline enregistrée : au-delà de MICRO_THRESHOLD (0.5 = +50 %), le script
+sort en code 1.
+
+Sans baseline, le passage à l'échelle sert de garde-fou : chaque mesure est
+aussi prise sur un état MICRO_SCALE fois plus petit. Une fonction en O(1)
+(can_send, process, msg_id) ne doit pas ralentir de plus de MICRO_SCALE_SLACK
+fois ; une fonction linéaire (rr_tick, fetch_sims en SIMs, save_state en
+convs) pas plus que sa dimension x MICRO_SCALE_SLACK : une dérive
+quadratique sort en code 1.
+
+  python bench_micro.py                  # mesure + comparaison à la baseline
+  MICRO_SAVE=1 python bench_micro.py     # (ré)enregistre la baseline
+  MICRO_SIMS=200 MICRO_CONVS=20000 MICRO_SEEN=100000 python bench_micro.py
+  MICRO_SCALE=0 python bench_micro.py    # sans la mesure sur l'état réduit
+
+La baseline dépend de la machine : l'enregistrer sur celle qui exécute la
+comparaison. Une mesure n'est comparée que si la taille de l'état est la même.
+rr_tick part d'un émetteur dont toutes les convs sont actives (tick à vide
+sur N-1 cibles) ; get-devices est servi par FakeGateway sans HTTP. Entre deux
+appels (hors chrono), les réponses programmées, la file d'admission et les
+réponses en cours sont vidées : process() mesure toujours le même travail.
+"""
+import atexit
+import itertools
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+_TMP = tempfile.mkdtemp(prefix="bench_micro_")
+atexit.register(shutil.rmtree, _TMP, True)   # enregistré avant les workers : exécuté après leur flush
+os.environ.setdefault("STATE_FILE", os.path.join(_TMP, "state.json"))
+os.environ.setdefault("GLOBAL_SEND_PER_MIN", "100000000")
+os.environ.setdefault("PER_SIM_SEND_PER_MIN", "100000000")
+
+from dedupe import DedupeStore
+from fake_gateway import FakeGateway, sim_number
+
+MICRO_SIMS      = int(os.getenv('MICRO_SIMS', '1000'))
+MICRO_CONVS     = int(os.getenv('MICRO_CONVS', '500000'))
+MICRO_SEEN      = int(os.getenv('MICRO_SEEN', '1000000'))
+MICRO_WORKERS   = [w.strip() for w in os.getenv('MICRO_WORKERS', 'exagate,rbsoft').split(',') if w.strip()]
+MICRO_ONLY      = os.getenv('MICRO_ONLY', '')                  # filtre sur le nom (sous-chaîne)
+MICRO_BUDGET_S  = float(os.getenv('MICRO_BUDGET_S', '1'))      # temps de mesure par benchmark
+MICRO_BASELINE  = os.getenv('MICRO_BASELINE', 'bench_micro_baseline.json')
+MICRO_THRESHOLD = float(os.getenv('MICRO_THRESHOLD', '0.5'))
+MICRO_SAVE      = os.getenv('MICRO_SAVE', '0') == '1'
+MICRO_SCALE     = int(os.getenv('MICRO_SCALE', '10'))          # état réduit d'un facteur 10 ; 0 = off
+MICRO_SCALE_SLACK = float(os.getenv('MICRO_SCALE_SLACK', '3'))
+
+# Mesures linéaires -> dimension de l'état qui les gouverne ; les autres restent ~constantes
+LINEAR = {"exagate.rr_tick": "sims", "exagate.fetch_sims": "sims", "exagate.save_state": "convs",
+          "rbsoft.tick_round_robin": "sims", "rbsoft.fetch_sims": "sims", "rbsoft.atomic_save": "convs"}
+
+# (mesures, purge entre deux appels, tailles réelles {"sims", "convs"})
+Benches = Tuple[Dict[str, Callable[[], object]], Callable[[], None], Dict[str, int]]
+
+
+# ── Mesure ──────────────────────────────────────────────────────────────────
+def measure(fn: Callable[[], object], budget_s: float = MICRO_BUDGET_S,
+            min_rounds: int = 3, max_rounds: int = 100000,
+            reset: Optional[Callable[[], None]] = None) -> Dict[str, float]:
+    """Appelle fn() jusqu'à épuiser budget_s (au moins min_rounds) ; temps en µs.
+    reset() est appelé avant chaque appel, hors chrono."""
+    reset = reset or (lambda: None)
+    reset()
+    fn()                                         # échauffement (caches, index)
+    times: List[float] = []
+    end = time.perf_counter() + budget_s
+    while len(times) < max_rounds and (len(times) < min_rounds or time.perf_counter() < end):
+        reset()
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1e6)
+    return {"rounds": len(times), "min_us": min(times), "median_us": statistics.median(times),
+            "mean_us": statistics.fmean(times),
+            "stddev_us": statistics.stdev(times) if len(times) > 1 else 0.0}
+
+
+# ── Fixtures synthétiques ───────────────────────────────────────────────────
+def _sims(n: int) -> Dict[str, str]:
+    return {sim_number(i): f"{i + 1}|0" for i in range(n)}
+
+
+def _fill_seen(store: Dict, n: int) -> None:
+    seen = DedupeStore(store)
+    for i in range(1, n + 1):
+        seen.add(str(i))
+
+
+def _devices_payload(n: int) -> dict:
+    return FakeGateway(devices=n, slots=1).get_devices({})
+
+
+def _turn(i: int, max_turns: int) -> int:
+    return 1 + i % max(1, max_turns - 2)        # jamais le dernier tour : process() planifie
+
+
+def _resetter(mod) -> Callable[[], None]:
+    # process() programme une réponse et réserve la conv : sans purge, le tas
+    # grossit d'un appel à l'autre et la conv suivante est refusée (reply_pending)
+    def reset() -> None:
+        mod.replies.clear()
+        mod.admission.clear()
+        mod._replying.clear()
+    return reset
+
+
+def exagate_benches(n_sims: int = MICRO_SIMS, n_convs: int = MICRO_CONVS,
+                    n_seen: int = MICRO_SEEN) -> Benches:
+    import autochat_exagate as ex
+    state = ex.blank()
+    sims  = _sims(n_sims)
+    nums  = sorted(sims)
+    state["sims"] = sims
+    now   = time.time()
+    # Les convs de nums[0] (émetteur courant) viennent en premier et restent actives
+    for i, (a, b) in enumerate(itertools.islice(itertools.combinations(nums, 2), n_convs)):
+        status = "active" if a == nums[0] or i % 2 else "done"
+        state["convs"][ex.ck(a, b)] = {"turn": _turn(i, ex.MAX_TURNS), "status": status,
+                                       "last_sender": a, "at": now}
+    _fill_seen(state["seen"], n_seen)
+    state = ex.track_state(state)
+
+    ids   = itertools.count(n_seen + 1)
+    peers = itertools.cycle(nums[1:])
+    dev, slot = sims[nums[0]].split("|")
+
+    def process():
+        ex.process(state, {"id": next(ids), "number": next(peers), "message": "x",
+                           "deviceID": int(dev), "simSlot": int(slot), "status": "Received"})
+
+    specs   = itertools.cycle(list(sims.values()))
+    payload = _devices_payload(n_sims)
+    ex.client.get_devices = lambda timeout=None: payload
+    msg     = {"id": 123456, "number": nums[1], "message": "x"}
+    return {
+        "exagate.can_send":   lambda: ex.can_send(state, next(specs)),
+        "exagate.process":    process,
+        "exagate.rr_tick":    lambda: ex.rr_tick(state),
+        "exagate.msg_id":     lambda: ex.msg_id(msg),
+        "exagate.fetch_sims": ex.fetch_sims,
+        "exagate.save_state": lambda: ex.save_state(state),
+    }, _resetter(ex), {"sims": len(sims), "convs": len(state["convs"])}
+
+
+def rbsoft_benches(n_sims: int = MICRO_SIMS, n_convs: int = MICRO_CONVS,
+                   n_seen: int = MICRO_SEEN) -> Benches:
+    import rbsoft_auto_chat as rb
+    state = rb._default_state()
+    sims  = _sims(n_sims)
+    nums  = sorted(sims)
+    state["known_sims"] = sims
+    state["discovery"].update(done=True, confirmed_sims=dict(sims), all_sims=dict(sims))
+    now   = time.time()
+    for i, (a, b) in enumerate(itertools.islice(itertools.permutations(nums, 2), n_convs)):
+        status = "active" if a == nums[0] or i % 2 else "done"
+        state["pairs"][rb.pair_key(a, b)] = {"sender": a, "receiver": b, "turn": _turn(i, rb.MAX_TURNS),
+                                             "status": status, "last_sent_at": now}
+    state["reply_routing"] = {b: nums[0] for b in nums[1:]}
+    _fill_seen(state["dedupe_msg_ids"], n_seen)
+    state = rb.track_state(state)
+
+    ids   = itertools.count(n_seen + 1)
+    peers = itertools.cycle(nums[1:])
+
+    def process_inbound():
+        rb.process_inbound(state, {"id": next(ids), "number": next(peers), "message": "x",
+                                   "status": "Received"})
+
+    specs   = itertools.cycle(list(sims.values()))
+    payload = _devices_payload(n_sims)
+    rb.client.get_devices = lambda timeout=None: payload
+    msg     = {"id": 123456, "number": nums[1], "message": "x"}
+    return {
+        "rbsoft.can_send":         lambda: rb.can_send(state, next(specs)),
+        "rbsoft.process_inbound":  process_inbound,
+        "rbsoft.tick_round_robin": lambda: rb.tick_round_robin(state, state["known_sims"]),
+        "rbsoft.msg_id_from":      lambda: rb.msg_id_from(msg),
+        "rbsoft.fetch_sims":       lambda: rb.fetch_sims(state),
+        "rbsoft.atomic_save":      lambda: rb.atomic_save(state),
+    }, _resetter(rb), {"sims": len(sims), "convs": len(state["pairs"])}
+
+
+WORKER_BENCHES = {"exagate": exagate_benches, "rbsoft": rbsoft_benches}
+
+
+# ── Baseline ────────────────────────────────────────────────────────────────
+def _fixture() -> Dict[str, int]:
+    return {"sims": MICRO_SIMS, "convs": MICRO_CONVS, "seen": MICRO_SEEN}
+
+
+def load_baseline(path: str = MICRO_BASELINE) -> Dict[str, dict]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(name: str, res: Dict[str, float], base: Optional[dict]) -> Optional[float]:
+    """Ratio min / min de la baseline, ou None si pas de baseline comparable."""
+    if not base or base.get("fixture") != _fixture() or not base.get("min_us"):
+        return None
+    return res["min_us"] / base["min_us"]
+
+
+# ── Passage à l'échelle ─────────────────────────────────────────────────────
+def scale_limit(name: str, big: Dict[str, int], small: Dict[str, int],
+                slack: float = MICRO_SCALE_SLACK) -> float:
+    """Ratio grand état / petit état toléré : slack en O(1), croissance de la dimension x slack en O(n)."""
+    dim = LINEAR.get(name)
+    return (big[dim] / max(1, small[dim]) if dim else 1) * slack
+
+
+def measure_small(worker: str, factor: int = MICRO_SCALE) -> Tuple[Dict[str, float], Dict[str, int]]:
+    """min µs de chaque mesure sur l'état réduit d'un facteur `factor`, et ses tailles."""
+    benches, reset, sizes = WORKER_BENCHES[worker](max(3, MICRO_SIMS // factor),
+                                                   max(1, MICRO_CONVS // factor),
+                                                   max(1, MICRO_SEEN // factor))
+    out = {}
+    for name, fn in benches.items():
+        if MICRO_ONLY and MICRO_ONLY not in name:
+            continue
+        out[name] = measure(fn, reset=reset)["min_us"]
+    return out, sizes
+
+
+def main() -> int:
+    baseline = load_baseline()
+    results: Dict[str, dict] = {}
+    failed: List[str] = []
+    print(f"[MICRO] fixture={_fixture()} baseline={MICRO_BASELINE} seuil=+{MICRO_THRESHOLD:.0%}"
+          f" echelle=x{MICRO_SCALE or '-'}", flush=True)
+    print(f"{'benchmark':<26}{'rounds':>8}{'min µs':>12}{'median µs':>12}{'mean µs':>12}"
+          f"  vs baseline  vs /{MICRO_SCALE or '-'}", flush=True)
+    for worker in MICRO_WORKERS:
+        small, small_sizes = measure_small(worker) if MICRO_SCALE > 1 else ({}, {})
+        t0 = time.perf_counter()
+        benches, reset, sizes = WORKER_BENCHES[worker]()
+        print(f"  ({worker}: etat construit en {time.perf_counter() - t0:.1f}s)", flush=True)
+        for name, fn in benches.items():
+            if MICRO_ONLY and MICRO_ONLY not in name:
+                continue
+            res   = measure(fn, reset=reset)
+            ratio = compare(name, res, baseline.get(name))
+            verdict = "-" if ratio is None else f"x{ratio:.2f}"
+            if ratio is not None and ratio > 1 + MICRO_THRESHOLD:
+                verdict += "  REGRESSION"
+                failed.append(name)
+            growth = "-"
+            if small.get(name):
+                g, limit = res["min_us"] / small[name], scale_limit(name, sizes, small_sizes)
+                growth = f"x{g:.2f}"
+                if g > limit:
+                    growth += f"  SUPERLINEAIRE (>x{limit:.0f})"
+                    failed.append(name)
+            print(f"{name:<26}{res['rounds']:>8}{res['min_us']:>12.1f}{res['median_us']:>12.1f}"
+                  f"{res['mean_us']:>12.1f}  {verdict:<11}  {growth}", flush=True)
+            results[name] = {**{k: round(v, 2) for k, v in res.items()}, "fixture": _fixture()}
+        del benches, small
+
+    if MICRO_SAVE:
+        with open(MICRO_BASELINE, "w", encoding="utf-8") as f:
+            json.dump({**baseline, **results}, f, indent=2, sort_keys=True)
+        print(f"[MICRO] baseline enregistree : {MICRO_BASELINE}", flush=True)
+    if failed:
+        print(f"[MICRO] {len(failed)} regression(s) : {failed}", flush=True)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
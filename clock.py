@@ -0,0 +1,71 @@
+"""
+Horloge injectable (temps réel ou virtuel)
+==========================================
+Les workers et leurs modules lisent l'heure ici plutôt que dans time.* :
+
+  clock.now()        ≈ time.time()       horodatages persistés, fenêtres de débit
+  clock.monotonic()  ≈ time.monotonic()  échéances, intervalles
+  clock.sleep(s)     ≈ time.sleep(s)
+
+Par défaut SystemClock (temps réel, comportement inchangé). simulate.py
+installe une VirtualClock : sleep() avance le temps sans attendre, une
+journée simulée passe en quelques secondes. Les fonctions du module
+délèguent à l'horloge courante à chaque appel, on peut donc les passer en
+valeur par défaut (now=clock.now) à des objets créés avant install().
+"""
+import time
+from typing import Optional
+
+
+class SystemClock:
+    now       = staticmethod(time.time)
+    monotonic = staticmethod(time.monotonic)
+    sleep     = staticmethod(time.sleep)
+
+
+class VirtualClock:
+    """Temps simulé, mono-thread : sleep(s) avance l'horloge de s secondes."""
+
+    def __init__(self, start: Optional[float] = None):
+        self.t     = time.time() if start is None else start
+        self.start = self.t
+
+    def now(self) -> float:
+        return self.t
+
+    def monotonic(self) -> float:
+        return self.t
+
+    def sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            self.t += seconds
+
+    @property
+    def elapsed(self) -> float:
+        return self.t - self.start
+
+
+_current = SystemClock()
+
+
+def install(c) -> object:
+    """Remplace l'horloge courante ; retourne la précédente."""
+    global _current
+    prev, _current = _current, c
+    return prev
+
+
+def current():
+    return _current
+
+
+def now() -> float:
+    return _current.now()
+
+
+def monotonic() -> float:
+    return _current.monotonic()
+
+
+def sleep(seconds: float) -> None:
+    _current.sleep(seconds)
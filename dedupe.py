@@ -0,0 +1,90 @@
+"""
+Dédupe bornée des messages entrants
+===================================
+Remplace le dict {msg_id: ts} qui grossissait sans fin. Le dict persisté
+dans l'état devient :
+
+    {"wm": 1234, "win": {"1240": 1792200000, "1238": 1792199990, ...}}
+
+  - wm  : watermark monotone — tout id numérique <= wm est considéré vu
+  - win : fenêtre des ids récents (au-dessus du watermark ou non numériques),
+          en ordre d'insertion, bornée par DEDUPE_WINDOW et DEDUPE_TTL_S.
+
+Un id numérique qui sort de la fenêtre est absorbé par le watermark : la
+taille (mémoire et JSON) reste plafonnée quelle que soit l'uptime.
+"""
+import os
+from typing import Callable, Dict, Optional
+
+import clock
+
+DEDUPE_WINDOW = int(os.getenv('DEDUPE_WINDOW', '2000'))
+DEDUPE_TTL_S  = int(os.getenv('DEDUPE_TTL_S',  '86400'))
+
+
+def _num(mid: str) -> Optional[int]:
+    return int(mid) if mid.isdigit() else None
+
+
+class DedupeStore:
+
+    def __init__(self, store: Dict, max_size: int = DEDUPE_WINDOW, ttl_s: int = DEDUPE_TTL_S,
+                 now: Callable[[], float] = clock.now):
+        if 'wm' not in store:
+            # Ancien format {msg_id: ts} → fenêtre, puis rognage
+            legacy = dict(store)
+            store.clear()
+            store['wm']  = 0
+            store['win'] = {str(k): int(v) for k, v in legacy.items()}
+        self._s       = store
+        self.max_size = max_size
+        self.ttl_s    = ttl_s
+        self._now     = now
+        self._evict(int(now()))
+
+    @property
+    def watermark(self) -> int:
+        return self._s['wm']
+
+    def __len__(self) -> int:
+        return len(self._s['win'])
+
+    def __contains__(self, mid) -> bool:
+        mid = str(mid)
+        n   = _num(mid)
+        if n is not None and n <= self._s['wm']:
+            return True
+        return mid in self._s['win']
+
+    def add(self, mid) -> bool:
+        """Enregistre mid ; retourne False s'il était déjà vu."""
+        if mid in self:
+            return False
+        now = int(self._now())
+        self._s['win'][str(mid)] = now
+        self._evict(now)
+        return True
+
+    def checkpoint(self) -> int:
+        """
+        Absorbe les ids numériques de la fenêtre dans le watermark (démarrage,
+        fin de cycle) ; les ids non numériques restent dans la fenêtre.
+        """
+        win  = self._s['win']
+        nums = [n for n in map(_num, win) if n is not None]
+        if nums:
+            self._s['wm'] = max(self._s['wm'], max(nums))
+        self._s['win'] = {k: v for k, v in win.items() if _num(k) is None}
+        return self._s['wm']
+
+    def _evict(self, now: int) -> None:
+        win   = self._s['win']
+        limit = now - self.ttl_s
+        while win:
+            oldest = next(iter(win))
+            if len(win) <= self.max_size and win[oldest] >= limit:
+                break
+            del win[oldest]
+            n = _num(oldest)
+            if n is not None and n > self._s['wm']:
+                self._s['wm'] = n
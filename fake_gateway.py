@@ -0,0 +1,416 @@
+"""
+Faux gateway ExaGate local (tests et benchmarks)
+================================================
+Remplace gate.exanewtech.com sur un poste sans réseau : mêmes endpoints et
+mêmes formes JSON que celles lues par fetch_sims, send_sms et fetch_received.
+
+  GET|POST /services/get-devices.php   → {"success", "data": {"devices": [{id, sims}]}}
+  GET|POST /services/send.php          → {"success", "data": {"messages": [...]}}
+  GET|POST /services/get-messages.php  → {"success", "data": {"messages": [...]}}
+  GET      /fake/stats                 → compteurs du faux gateway (benchmarks)
+
+Chaque envoi vers un numéro connu revient, après FAKE_DELIVERY_DELAY_S, en
+message "Received" sur l'appareil/slot de la SIM cible (number = SIM émettrice).
+Les ids reçus sont croissants dans l'ordre de livraison ; FAKE_CURSOR_PARAM
+(défaut last_id) filtre id > valeur, comme MSG_CURSOR_PARAM côté workers.
+
+FAKE_AUTO_REPLY=<texte> : la SIM cible répond d'elle-même (comme le
+destinataire humain attendu par rbsoft_auto_chat.py) ; la réponse revient à
+l'émetteur après le même délai de livraison. Pas de réponse à une réponse
+automatique, et elle ne compte pas dans "sent" (compteur "auto_replies").
+
+Push (FAKE_WEBHOOK_URL) : un thread livre les messages à l'échéance et POST
+chacun (JSON) sur l'URL, en plus de get-messages ; FAKE_WEBHOOK_DROP = part
+des callbacks perdus, pour exercer le balayage de rattrapage des workers.
+  FAKE_WEBHOOK_URL=http://127.0.0.1:8090/inbound python fake_gateway.py
+  WEBHOOK_PORT=8090 SMS_GATEWAY_URL=http://127.0.0.1:8765 ... python autochat_exagate.py
+
+Lancement :
+  FAKE_DEVICES=20 python fake_gateway.py
+  SMS_GATEWAY_URL=http://127.0.0.1:8765 SMS_GATEWAY_API_KEY=test python autochat_exagate.py
+  SMS_GATEWAY_URL=http://127.0.0.1:8765 SMS_GATEWAY_API_KEY=test python rbsoft_auto_chat.py
+
+Latence par requête (FAKE_LATENCY_DIST) :
+  const     : FAKE_LATENCY_MS
+  uniform   : FAKE_LATENCY_MS ± FAKE_LATENCY_JITTER (fraction)
+  exp       : exponentielle de moyenne FAKE_LATENCY_MS
+  lognormal : médiane FAKE_LATENCY_MS, sigma FAKE_LATENCY_JITTER
+"""
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+import clock
+from gateway_client import GatewayClient
+
+FAKE_HOST              = os.getenv('FAKE_HOST', '127.0.0.1')
+FAKE_PORT              = int(os.getenv('FAKE_PORT', '8765'))
+FAKE_DEVICES           = int(os.getenv('FAKE_DEVICES', '10'))
+FAKE_SLOTS             = int(os.getenv('FAKE_SLOTS', '1'))            # SIMs par appareil (1 ou 2)
+FAKE_LATENCY_MS        = float(os.getenv('FAKE_LATENCY_MS', '30'))
+FAKE_LATENCY_DIST      = os.getenv('FAKE_LATENCY_DIST', 'uniform')    # const | uniform | exp | lognormal
+FAKE_LATENCY_JITTER    = float(os.getenv('FAKE_LATENCY_JITTER', '0.5'))
+FAKE_ERROR_RATE        = float(os.getenv('FAKE_ERROR_RATE', '0'))     # part des send.php refusés
+FAKE_DELIVERY_DELAY_S  = float(os.getenv('FAKE_DELIVERY_DELAY_S', '1'))
+FAKE_DELIVERY_JITTER_S = float(os.getenv('FAKE_DELIVERY_JITTER_S', '0'))
+FAKE_API_KEY           = os.getenv('FAKE_API_KEY', '')                # vide = toute clé acceptée
+FAKE_CURSOR_PARAM      = os.getenv('FAKE_CURSOR_PARAM', 'last_id')
+FAKE_KEEP_MESSAGES     = int(os.getenv('FAKE_KEEP_MESSAGES', '0'))    # 0 = tout garder
+FAKE_SEED              = os.getenv('FAKE_SEED', '')
+FAKE_WEBHOOK_URL       = os.getenv('FAKE_WEBHOOK_URL', '')            # vide = pas de push
+FAKE_WEBHOOK_DROP      = float(os.getenv('FAKE_WEBHOOK_DROP', '0'))   # part des callbacks perdus
+FAKE_AUTO_REPLY        = os.getenv('FAKE_AUTO_REPLY', '')             # vide = pas de réponse automatique
+
+NUMBER_PREFIX = '+2376'
+
+
+def sim_number(index: int) -> str:
+    """Numéro de la index-ième SIM (format attendu par _PHONE_RE / parse_sim_number)."""
+    return f"{NUMBER_PREFIX}{index:08d}"
+
+
+class FakeGateway:
+
+    def __init__(self, devices: int = FAKE_DEVICES, slots: int = FAKE_SLOTS,
+                 latency_ms: float = FAKE_LATENCY_MS, latency_dist: str = FAKE_LATENCY_DIST,
+                 latency_jitter: float = FAKE_LATENCY_JITTER, error_rate: float = FAKE_ERROR_RATE,
+                 delivery_delay_s: float = FAKE_DELIVERY_DELAY_S,
+                 delivery_jitter_s: float = FAKE_DELIVERY_JITTER_S,
+                 api_key: str = FAKE_API_KEY, cursor_param: str = FAKE_CURSOR_PARAM,
+                 keep_messages: int = FAKE_KEEP_MESSAGES, seed: Optional[str] = FAKE_SEED or None,
+                 webhook_url: str = FAKE_WEBHOOK_URL, webhook_drop: float = FAKE_WEBHOOK_DROP,
+                 auto_reply: str = FAKE_AUTO_REPLY):
+        self.latency_ms        = latency_ms
+        self.latency_dist      = latency_dist
+        self.latency_jitter    = latency_jitter
+        self.error_rate        = error_rate
+        self.delivery_delay_s  = delivery_delay_s
+        self.delivery_jitter_s = delivery_jitter_s
+        self.api_key           = api_key
+        self.cursor_param      = cursor_param
+        self.keep_messages     = keep_messages
+        self.webhook_url       = webhook_url
+        self.webhook_drop      = webhook_drop
+        self.auto_reply        = auto_reply
+        self._rng  = random.Random(seed)
+        self._lock = threading.Lock()
+        # {numéro: (device_id, slot)} et l'inverse {"dev|slot": numéro}
+        self.sims: Dict[str, Tuple[int, int]] = {}
+        self.spec_number: Dict[str, str] = {}
+        for d in range(max(0, devices)):
+            for s in range(max(1, slots)):
+                num = sim_number(d * max(1, slots) + s)
+                self.sims[num] = (d + 1, s)
+                self.spec_number[f"{d + 1}|{s}"] = num
+        self._pending: List[tuple] = []       # (échéance, seq, message) en attente de livraison
+        self._inbox:   List[dict]  = []       # messages "Received" livrés, ids croissants
+        self._seq      = itertools.count(1)
+        self._next_id  = 1
+        self._outbox:  List[dict]  = []       # livrés, à pousser sur webhook_url
+        self._wake     = threading.Event()    # nouvel envoi : recalcul de la prochaine échéance
+        self._sent_id  = itertools.count(1)
+        self.counters: Dict[str, int] = {"sent": 0, "errors": 0, "delivered": 0,
+                                         "unroutable": 0, "requests": 0,
+                                         "pushed": 0, "push_dropped": 0, "push_errors": 0,
+                                         "auto_replies": 0}
+        self.calls: Dict[str, int] = {}       # requêtes par endpoint
+        # Observateurs (benchmarks) : fn(event, from_num, to_num, t) avec event
+        # "send" (t = envoi accepté), "deliver" (t = échéance de livraison) ou
+        # "auto" (réponse automatique émise à t), t en clock.monotonic(). Appelés sous le verrou : doivent rester légers.
+        self.listeners: List[Callable[[str, str, str, float], None]] = []
+
+    # ── Simulation ──────────────────────────────────────────────────────────
+    def latency_s(self) -> float:
+        base = self.latency_ms / 1000.0
+        if base <= 0:
+            return 0.0
+        with self._lock:
+            if self.latency_dist == 'const':
+                return base
+            if self.latency_dist == 'exp':
+                return self._rng.expovariate(1.0 / base)
+            if self.latency_dist == 'lognormal':
+                return base * self._rng.lognormvariate(0.0, self.latency_jitter)
+            return max(0.0, base * (1 + self._rng.uniform(-self.latency_jitter, self.latency_jitter)))
+
+    def _delivery_delay(self) -> float:
+        # Appelé sous self._lock
+        delay = self.delivery_delay_s
+        if self.delivery_jitter_s:
+            delay += self._rng.uniform(0, self.delivery_jitter_s)
+        return delay
+
+    def _queue_delivery(self, at: float, sender: str, to: str, text: str, auto: bool = False) -> None:
+        # Appelé sous self._lock
+        target = self.sims[to]
+        msg = {"number": sender, "message": text, "deviceID": target[0], "simSlot": target[1],
+               "status": "Received", "sentDate": time.strftime("%Y-%m-%d %H:%M:%S"), "_to": to}
+        if auto:
+            msg["_auto"] = True
+        heapq.heappush(self._pending, (at + self._delivery_delay(), next(self._seq), msg))
+        self._wake.set()
+
+    def _deliver_due(self, now: float) -> None:
+        # Appelé sous self._lock : les ids sont attribués à la livraison
+        while self._pending and self._pending[0][0] <= now:
+            due, _, msg = heapq.heappop(self._pending)
+            msg["id"] = self._next_id
+            msg["deliveredDate"] = time.strftime("%Y-%m-%d %H:%M:%S")
+            self._next_id += 1
+            self._inbox.append(msg)
+            self.counters["delivered"] += 1
+            if self.webhook_url:
+                self._outbox.append(_public(msg))
+            for fn in self.listeners:
+                fn("deliver", msg["number"], msg["_to"], due)
+            if self.auto_reply and not msg.get("_auto"):
+                # Le destinataire répond tout de suite ; peut être livré dans cette même boucle
+                self.counters["auto_replies"] += 1
+                self._queue_delivery(due, msg["_to"], msg["number"], self.auto_reply, auto=True)
+                for fn in self.listeners:
+                    fn("auto", msg["_to"], msg["number"], due)
+        if self.keep_messages and len(self._inbox) > self.keep_messages:
+            del self._inbox[:len(self._inbox) - self.keep_messages]
+
+    # ── Push webhook ────────────────────────────────────────────────────────
+    def start_push(self) -> threading.Thread:
+        """Thread de livraison à l'échéance + POST sur webhook_url (serveur HTTP, temps réel)."""
+        t = threading.Thread(target=self._push_loop, name="fake-webhook", daemon=True)
+        t.start()
+        return t
+
+    def _push_loop(self) -> None:
+        session = requests.Session()
+        while True:
+            self._wake.clear()
+            with self._lock:
+                self._deliver_due(clock.monotonic())
+                batch, self._outbox = self._outbox, []
+                wait = self._pending[0][0] - clock.monotonic() if self._pending else None
+            for msg in batch:
+                self._push(session, msg)
+            if not batch:
+                self._wake.wait(None if wait is None else max(0.0, wait))
+
+    def _push(self, session: requests.Session, msg: dict) -> None:
+        with self._lock:
+            if self.webhook_drop and self._rng.random() < self.webhook_drop:
+                self.counters["push_dropped"] += 1
+                return
+        try:
+            r  = session.post(self.webhook_url, json=msg, timeout=5)
+            ok = r.status_code < 400
+        except requests.RequestException:
+            ok = False
+        with self._lock:
+            self.counters["pushed" if ok else "push_errors"] += 1
+
+    # ── Endpoints ───────────────────────────────────────────────────────────
+    def get_devices(self, params: Dict[str, str]) -> dict:
+        devices: Dict[int, dict] = {}
+        for num, (did, slot) in self.sims.items():
+            dev = devices.setdefault(did, {"id": did, "name": f"Fake #{did}", "sims": {}})
+            dev["sims"][str(slot)] = f"SIM #{slot + 1} [{num}]"
+        return {"success": True, "data": {"devices": list(devices.values())}}
+
+    def send(self, params: Dict[str, str]) -> dict:
+        spec, to, text = params.get("devices", ""), params.get("number", ""), params.get("message", "")
+        if not to or not text:
+            return _error(400, "number et message requis")
+        sender = self.spec_number.get(spec)
+        if sender is None:
+            return _error(404, f"appareil inconnu: {spec}")
+        with self._lock:
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.counters["errors"] += 1
+                return _error(500, "echec d'envoi simule")
+            self.counters["sent"] += 1
+            now  = time.strftime("%Y-%m-%d %H:%M:%S")
+            did, slot = spec.split("|", 1)
+            sent = {"ID": next(self._sent_id), "number": to, "message": text,
+                    "deviceID": int(did), "simSlot": int(slot), "status": "Pending",
+                    "type": params.get("type", "sms"), "sentDate": now}
+            if to not in self.sims:
+                self.counters["unroutable"] += 1
+            else:
+                self._queue_delivery(clock.monotonic(), sender, to, text)
+            for fn in self.listeners:
+                fn("send", sender, to, clock.monotonic())
+        return {"success": True, "data": {"messages": [sent]}}
+
+    def get_messages(self, params: Dict[str, str]) -> dict:
+        status = params.get("status", "Received")
+        with self._lock:
+            self._deliver_due(clock.monotonic())
+            if status != "Received":
+                return {"success": True, "data": {"messages": []}}
+            msgs = self._inbox
+            after = params.get(self.cursor_param) if self.cursor_param else None
+            if after not in (None, ""):
+                try:
+                    floor = int(after)
+                except ValueError:
+                    return _error(400, f"{self.cursor_param} invalide")
+                msgs = [m for m in msgs if m["id"] > floor]
+            return {"success": True, "data": {"messages": [_public(m) for m in msgs]}}
+
+    def stats(self, params: Optional[Dict[str, str]] = None) -> dict:
+        with self._lock:
+            self._deliver_due(clock.monotonic())
+            return {**self.counters, "pending": len(self._pending), "inbox": len(self._inbox),
+                    "sims": len(self.sims), "calls": dict(self.calls)}
+
+    ROUTES = {
+        "/services/get-devices.php":  "get_devices",
+        "/services/send.php":         "send",
+        "/services/get-messages.php": "get_messages",
+        "/fake/stats":                "stats",
+    }
+
+    def handle(self, path: str, params: Dict[str, str]) -> Tuple[int, dict]:
+        """Retourne (code HTTP, corps JSON) ; la latence simulée est appliquée par l'appelant."""
+        name = self.ROUTES.get(path)
+        if name is None:
+            return 404, _error(404, f"endpoint inconnu: {path}")
+        with self._lock:
+            self.counters["requests"] += 1
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if name != "stats" and self.api_key and params.get("key") != self.api_key:
+            return 401, _error(401, "cle API invalide")
+        return 200, getattr(self, name)(params)
+
+
+def _public(msg: dict) -> dict:
+    return {k: v for k, v in msg.items() if not k.startswith("_")}
+
+
+def _error(code: int, message: str) -> dict:
+    return {"success": False, "data": None, "error": {"code": code, "message": message}}
+
+
+class _LocalResponse:
+    """Sous-ensemble de requests.Response lu par GatewayClient et les workers."""
+
+    def __init__(self, status_code: int, body: dict):
+        self.status_code = status_code
+        self._body       = body               # construit pour cette requête : pas de copie
+
+    @property
+    def text(self) -> str:
+        return json.dumps(self._body)
+
+    def json(self) -> Any:
+        return self._body
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"HTTP {self.status_code}: {self.text[:120]}", response=self)
+
+
+class LocalClient(GatewayClient):
+    """
+    GatewayClient branché directement sur un FakeGateway, sans HTTP ni
+    thread : la latence simulée passe par clock.sleep (temps virtuel sous
+    simulate.py). Mêmes endpoints typés et mêmes compteurs latency_stats().
+    """
+
+    def __init__(self, gateway: FakeGateway, api_key: str = "local"):
+        super().__init__("local://fake-gateway", api_key)
+        self.gateway = gateway
+
+    def request(self, method: str, path: str, params: Optional[dict] = None,
+                data: Optional[dict] = None, timeout: Optional[float] = None) -> _LocalResponse:
+        p = {k: str(v) for k, v in {'key': self.api_key, **(params or {}), **(data or {})}.items()}
+        delay = self.gateway.latency_s()
+        clock.sleep(delay)
+        code, body = self.gateway.handle(path, p)
+        self._record(path, delay, code < 400)
+        return _LocalResponse(code, body)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"             # keep-alive : le pool requests.Session est réutilisé
+    gateway: FakeGateway
+
+    def _params(self, body: bytes = b"") -> Tuple[str, Dict[str, str]]:
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+        if body:
+            params.update({k: v[-1] for k, v in
+                           parse_qs(body.decode("utf-8", "replace"), keep_blank_values=True).items()})
+        return url.path, params
+
+    def _reply(self, path: str, params: Dict[str, str]) -> None:
+        if path != "/fake/stats":
+            delay = self.gateway.latency_s()
+            if delay:
+                time.sleep(delay)
+        code, body = self.gateway.handle(path, params)
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._reply(*self._params())
+
+    def do_POST(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        self._reply(*self._params(self.rfile.read(n) if n else b""))
+
+    def log_message(self, *args):
+        pass
+
+
+def make_server(gateway: FakeGateway, host: str = FAKE_HOST, port: int = FAKE_PORT) -> ThreadingHTTPServer:
+    """Serveur HTTP multi-thread lié à gateway (port 0 = port libre, voir server_address)."""
+    handler = type("FakeGatewayHandler", (_Handler,), {"gateway": gateway})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.gateway = gateway
+    if gateway.webhook_url:
+        gateway.start_push()
+    return server
+
+
+def serve_in_thread(gateway: FakeGateway, host: str = FAKE_HOST, port: int = FAKE_PORT) -> ThreadingHTTPServer:
+    """Démarre le serveur en arrière-plan (benchmarks) ; server.shutdown() pour l'arrêter."""
+    server = make_server(gateway, host, port)
+    threading.Thread(target=server.serve_forever, name="fake-gateway", daemon=True).start()
+    return server
+
+
+def main():
+    gateway = FakeGateway()
+    server  = make_server(gateway)
+    host, port = server.server_address[:2]
+    print("=" * 60, flush=True)
+    print(f"  Faux gateway ExaGate : http://{host}:{port}", flush=True)
+    print(f"  Appareils: {FAKE_DEVICES} x {FAKE_SLOTS} SIM  ({len(gateway.sims)} numeros)", flush=True)
+    print(f"  Latence: {FAKE_LATENCY_DIST} {FAKE_LATENCY_MS}ms  Erreurs: {FAKE_ERROR_RATE:.1%}"
+          f"  Livraison: {FAKE_DELIVERY_DELAY_S}s", flush=True)
+    print(f"  SMS_GATEWAY_URL=http://{host}:{port}", flush=True)
+    if FAKE_WEBHOOK_URL:
+        print(f"  Push: {FAKE_WEBHOOK_URL}  (perdus: {FAKE_WEBHOOK_DROP:.0%})", flush=True)
+    print("=" * 60, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Client HTTP partagé pour l'API ExaGate (gate.exanewtech.com)
+=============================================================
+Une seule session requests par process : keep-alive + pool de connexions,
+donc la poignée de main TCP+TLS est payée une fois et pas à chaque SMS.
+
+  Auth   : ?key=API_KEY
+  Devices: GET /services/get-devices.php
+  Send   : GET /services/send.php?number=...&message=...&devices=DEVICE_ID|SLOT
+  Messages: GET /services/get-messages.php?status=Received
+"""
+import os
+import time
+import threading
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from jsonlog import log
+
+EP_DEVICES  = '/services/get-devices.php'
+EP_SEND     = '/services/send.php'
+EP_MESSAGES = '/services/get-messages.php'
+
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '10'))
+HTTP_TIMEOUT_S = int(os.getenv('HTTP_TIMEOUT_S', '30'))
+
+
+def safe_json(r: requests.Response, context: str = "") -> dict:
+    """Parse JSON sans lever — {} si la réponse est vide ou non-JSON."""
+    body = (r.text or "").strip()
+    if not body:
+        return {}
+    try:
+        return r.json()
+    except ValueError:
+        snippet = body[:120].replace("\n", " ")
+        log.warn("HTTP", "bad JSON", context=context, status=r.status_code, body=snippet)
+        return {}
+
+
+class GatewayClient:
+    """Session poolée + compteurs de latence par endpoint."""
+
+    def __init__(self, base_url: str, api_key: str,
+                 pool_size: int = HTTP_POOL_SIZE, timeout: float = HTTP_TIMEOUT_S):
+        self.base_url = base_url.rstrip('/')
+        self.api_key  = api_key
+        self.timeout  = timeout
+        self.session  = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({"Accept": "application/json"})
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._stats_lock = threading.Lock()
+
+    # ── bas niveau ──────────────────────────────────────────────────────────
+    def request(self, method: str, path: str, params: Optional[dict] = None,
+                data: Optional[dict] = None, timeout: Optional[float] = None) -> requests.Response:
+        p  = {'key': self.api_key, **(params or {})}
+        t0 = time.monotonic()
+        ok = False
+        try:
+            r = self.session.request(method, f"{self.base_url}{path}", params=p, data=data,
+                                     timeout=timeout or self.timeout)
+            ok = r.status_code < 400
+            return r
+        finally:
+            self._record(path, time.monotonic() - t0, ok)
+
+    def get_json(self, path: str, params: Optional[dict] = None,
+                 timeout: Optional[float] = None) -> dict:
+        r = self.request('GET', path, params=params, timeout=timeout)
+        r.raise_for_status()
+        return safe_json(r, path)
+
+    def post_json(self, path: str, payload: Optional[dict] = None,
+                  params: Optional[dict] = None) -> dict:
+        r = self.request('POST', path, params=params, data=payload or {})
+        r.raise_for_status()
+        return safe_json(r, path)
+
+    # ── endpoints typés ─────────────────────────────────────────────────────
+    def get_devices(self, timeout: Optional[float] = None) -> dict:
+        return self.get_json(EP_DEVICES, timeout=timeout)
+
+    def send(self, spec: str, number: str, message: str) -> dict:
+        """spec = 'DEVICE_ID|SLOT'."""
+        return self.get_json(EP_SEND, {
+            'number': number, 'message': message,
+            'devices': spec, 'type': 'sms', 'prioritize': 1,
+        })
+
+    def get_messages(self, status: str = 'Received', **filters) -> dict:
+        return self.get_json(EP_MESSAGES, {'status': status, **filters})
+
+    # ── latence ─────────────────────────────────────────────────────────────
+    def _record(self, path: str, dt: float, ok: bool) -> None:
+        metrics.GATEWAY_SECONDS.observe(dt, endpoint=metrics.endpoint_label(path))
+        with self._stats_lock:
+            s = self._stats.setdefault(path, {'count': 0, 'errors': 0,
+                                              'total_s': 0.0, 'max_s': 0.0})
+            s['count']   += 1
+            s['errors']  += 0 if ok else 1
+            s['total_s'] += dt
+            s['max_s']    = max(s['max_s'], dt)
+
+    def latency_stats(self) -> Dict[str, Dict[str, float]]:
+        """{path: {count, errors, total_s, max_s, avg_s}}"""
+        with self._stats_lock:
+            out = {}
+            for path, s in self._stats.items():
+                out[path] = {**s, 'avg_s': s['total_s'] / s['count'] if s['count'] else 0.0}
+            return out
+
+    def close(self) -> None:
+        self.session.close()
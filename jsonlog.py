@@ -0,0 +1,195 @@
+"""
+Logs structurés (JSON lines) avec écriture en arrière-plan
+==========================================================
+Remplace print(..., flush=True) dans les workers : un appel log.info(...)
+ne fait que filtrer le niveau et poser un tuple dans une file bornée ; un
+thread daemon sérialise les événements et les écrit par lots (un write +
+un flush par lot au lieu d'un par ligne).
+
+  log.info("RR", "emetteur suivant", sender=ns, idx=3)
+  -> {"ts": 1700000000.123, "level": "INFO", "tag": "RR", "msg": "emetteur suivant", "sender": "+237...", "idx": 3}
+
+  LOG_LEVEL=DEBUG|INFO|WARN|ERROR   niveau minimum (INFO)
+  LOG_FORMAT=json|text              text = "[TAG] msg k=v", pour lire à l'œil
+  LOG_SAMPLE_EVERY=N                événements par message (sample=True) : 1 sur N par tag
+  LOG_QUEUE_MAX=10000               file pleine -> événement jeté et compté (log_dropped)
+
+La sérialisation se fait dans le thread d'écriture : les champs passés doivent
+être des valeurs ou des copies, jamais une référence vers l'état en cours de
+mutation. flush() attend que la file soit vidée (fin de process, tests).
+"""
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional, TextIO
+
+import clock
+
+DEBUG, INFO, WARN, ERROR = 10, 20, 30, 40
+LEVELS = {"DEBUG": DEBUG, "INFO": INFO, "WARN": WARN, "WARNING": WARN, "ERROR": ERROR}
+_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARN: "WARN", ERROR: "ERROR"}
+
+LOG_LEVEL        = LEVELS.get(os.getenv('LOG_LEVEL', 'INFO').upper(), INFO)
+LOG_FORMAT       = os.getenv('LOG_FORMAT', 'json')
+LOG_SAMPLE_EVERY = max(1, int(os.getenv('LOG_SAMPLE_EVERY', '1')))
+LOG_QUEUE_MAX    = int(os.getenv('LOG_QUEUE_MAX', '10000'))
+LOG_BATCH        = 512
+
+_STOP = object()
+
+
+class JsonLogger:
+
+    def __init__(self, stream: Optional[TextIO] = None, level: int = LOG_LEVEL,
+                 fmt: str = LOG_FORMAT, sample_every: int = LOG_SAMPLE_EVERY,
+                 queue_max: int = LOG_QUEUE_MAX):
+        self.stream       = stream              # None = sys.stdout au moment de l'écriture
+        self.level        = level
+        self.fmt          = fmt
+        self.sample_every = sample_every
+        self._q: "queue.Queue" = queue.Queue(queue_max)
+        self._seen: Dict[str, int] = {}         # tag -> événements échantillonnables vus
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.dropped      = 0
+        self.sampled_out  = 0
+        self._reported    = 0
+
+    # ── API ─────────────────────────────────────────────────────────────────
+    def enabled(self, level: int) -> bool:
+        return level >= self.level
+
+    def log(self, level: int, tag: str, msg: str = "", sample: bool = False,
+            exc_info: bool = False, **fields: Any) -> None:
+        if level < self.level:
+            return
+        if sample and self.sample_every > 1:
+            n = self._seen.get(tag, 0)
+            self._seen[tag] = n + 1
+            if n % self.sample_every:
+                self.sampled_out += 1
+                return
+            fields["sample"] = self.sample_every
+        if exc_info:
+            fields["exc"] = traceback.format_exc()
+        if self._thread is None:
+            self._start()
+        try:
+            self._q.put_nowait((clock.now(), level, tag, msg, fields))
+        except queue.Full:
+            self.dropped += 1
+
+    def debug(self, tag: str, msg: str = "", **fields: Any) -> None:
+        self.log(DEBUG, tag, msg, **fields)
+
+    def info(self, tag: str, msg: str = "", **fields: Any) -> None:
+        self.log(INFO, tag, msg, **fields)
+
+    def warn(self, tag: str, msg: str = "", **fields: Any) -> None:
+        self.log(WARN, tag, msg, **fields)
+
+    def error(self, tag: str, msg: str = "", **fields: Any) -> None:
+        self.log(ERROR, tag, msg, **fields)
+
+    def results(self, tag: str, items: List[dict], msg: str = "resultats") -> None:
+        """
+        Lot de résultats (dicts) : une ligne de synthèse par type (1re clé de
+        chaque dict) au lieu du repr de la liste ; le détail en DEBUG, échantillonné.
+        """
+        if not self.enabled(INFO):
+            return
+        kinds: Dict[str, int] = {}
+        for r in items:
+            k = next(iter(r), "?")
+            if k in ("ignored", "skip"):             # la valeur est la raison
+                k = f"{k}:{r[k]}"
+            kinds[k] = kinds.get(k, 0) + 1
+        self.info(tag, msg, n=len(items), kinds=kinds)
+        if self.enabled(DEBUG):
+            for r in items:
+                self.log(DEBUG, tag, msg, sample=True, **r)
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Attend l'écriture de tout ce qui est en file (temps réel, pas l'horloge injectée)."""
+        deadline = time.monotonic() + timeout
+        while self._q.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.005)
+        return not self._q.unfinished_tasks
+
+    def close(self, timeout: float = 5.0) -> None:
+        if self._thread is None:
+            return
+        try:
+            self._q.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+        self._thread = None
+
+    # ── écriture ────────────────────────────────────────────────────────────
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="jsonlog", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def format(self, ts: float, level: int, tag: str, msg: str, fields: Dict[str, Any]) -> str:
+        if self.fmt == "text":
+            extra = " ".join(f"{k}={v}" for k, v in fields.items() if k != "exc")
+            line  = f"[{tag}] {msg} {extra}".rstrip()
+            if level >= WARN:
+                line = f"{_NAMES[level]} {line}"
+            if "exc" in fields:
+                line += "\n" + fields["exc"].rstrip()
+            return line + "\n"
+        rec = {"ts": round(ts, 3), "level": _NAMES.get(level, str(level)), "tag": tag}
+        if msg:
+            rec["msg"] = msg
+        rec.update(fields)
+        return json.dumps(rec, ensure_ascii=False, default=str) + "\n"
+
+    def _drain(self) -> List[Any]:
+        batch = [self._q.get()]
+        try:
+            while len(batch) < LOG_BATCH:
+                batch.append(self._q.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._drain()
+            stop  = any(r is _STOP for r in batch)
+            lines = []
+            for r in batch:
+                if r is _STOP:
+                    continue
+                try:
+                    lines.append(self.format(*r))
+                except Exception as e:           # un champ non sérialisable ne tue pas le thread
+                    lines.append(self.format(r[0], ERROR, "LOG", "format", {"err": repr(e), "src": r[2]}))
+            if self.dropped != self._reported:
+                lines.append(self.format(clock.now(), WARN, "LOG", "log_dropped",
+                                         {"dropped": self.dropped - self._reported}))
+                self._reported = self.dropped
+            try:
+                stream = self.stream or sys.stdout
+                stream.write("".join(lines))
+                stream.flush()
+            except Exception:
+                pass
+            for _ in batch:
+                self._q.task_done()
+            if stop:
+                return
+
+
+log = JsonLogger()
@@ -0,0 +1,189 @@
+"""
+Chronométrage par phase de la boucle + captures cProfile / tracemalloc
+======================================================================
+Chaque itération de la boucle principale est découpée en phases (refresh,
+inbound, tick, save, wait) chronométrées sur clock.monotonic ; toutes les
+LOOP_STATS_EVERY itérations un événement de synthèse est journalisé :
+
+  {"tag": "LOOP", "msg": "synthese", "iter": 100, "wall_s": 503.2,
+   "phases": {"refresh": {"share": 0.001, "avg_ms": 4.0, "max_ms": 210.0}, ...}}
+
+Capture à la demande, sans redémarrage, pour les PROFILE_ITERS itérations
+suivantes (fichiers écrits dans PROFILE_DIR) :
+
+  kill -USR1 <pid>     cProfile     -> profile_<pid>_<horodatage>.prof  (pstats / snakeviz)
+  kill -USR2 <pid>     tracemalloc  -> tracemalloc_<pid>_<horodatage>.txt (top + diff)
+  PROFILE_ON_START=cpu,mem          mêmes captures dès la 1re itération
+
+En ENGINE=async les tâches périodiques sont chronométrées avec phase() (durée
+await compris) et une itération = un poll inbound.
+"""
+import cProfile
+import os
+import signal
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+import clock
+from jsonlog import log
+
+LOOP_STATS_EVERY = int(os.getenv('LOOP_STATS_EVERY', '100'))   # 0 = pas de synthèse
+PROFILE_ITERS    = int(os.getenv('PROFILE_ITERS', '50'))
+PROFILE_DIR      = os.getenv('PROFILE_DIR', '.')
+PROFILE_ON_START = os.getenv('PROFILE_ON_START', '')           # "cpu", "mem" ou "cpu,mem"
+PROFILE_TOP      = int(os.getenv('PROFILE_TOP', '30'))          # lignes du rapport tracemalloc
+
+
+class LoopProfiler:
+
+    def __init__(self, every: int = LOOP_STATS_EVERY, profile_iters: int = PROFILE_ITERS,
+                 out_dir: str = PROFILE_DIR, label: str = "LOOP",
+                 now: Callable[[], float] = clock.monotonic):
+        self.every         = every
+        self.profile_iters = profile_iters
+        self.out_dir       = out_dir
+        self.label         = label
+        self._now          = now
+        self._mark: Optional[float] = None
+        self._start: Optional[float] = None          # 1er begin() : le démarrage n'est pas compté
+        self._phases: Dict[str, List[float]] = {}   # phase -> [total, max]
+        self._iters        = 0
+        self.iterations    = 0
+        self._armed        = set()
+        self._cpu: Optional[cProfile.Profile] = None
+        self._cpu_left     = 0
+        self._mem_base     = None
+        self._mem_left     = 0
+        self.written: List[str] = []
+        for kind in PROFILE_ON_START.split(','):
+            if kind.strip():
+                self.arm(kind.strip())
+
+    # ── phases ──────────────────────────────────────────────────────────────
+    def _add(self, phase: str, dt: float) -> None:
+        p = self._phases.get(phase)
+        if p is None:
+            self._phases[phase] = [dt, dt]
+        else:
+            p[0] += dt
+            p[1]  = max(p[1], dt)
+
+    def begin(self) -> None:
+        """Début d'itération : démarre les captures armées, remet le chrono de mark()."""
+        self._start_captures()
+        self._mark = self._now()
+        if self._start is None:
+            self._start = self._mark
+
+    def mark(self, phase: str) -> None:
+        """Attribue à `phase` le temps écoulé depuis le mark() / begin() précédent."""
+        t = self._now()
+        if self._mark is not None:
+            self._add(phase, t - self._mark)
+        self._mark = t
+
+    @contextmanager
+    def phase(self, name: str):
+        t0 = self._now()
+        try:
+            yield
+        finally:
+            self._add(name, self._now() - t0)
+
+    def end(self) -> None:
+        """Fin d'itération : synthèse toutes les `every` itérations, fin des captures."""
+        self._iters     += 1
+        self.iterations += 1
+        self._stop_captures()
+        if self.every and self._iters >= self.every:
+            log.info(self.label, "synthese", **self.summary())
+            self.reset()
+
+    def summary(self) -> Dict[str, object]:
+        """{iter, wall_s, phases: {phase: {share, avg_ms, max_ms}}} depuis la dernière synthèse."""
+        wall   = max(self._now() - (self._start or self._now()), 1e-9)
+        phases = {}
+        for name, (total, peak) in self._phases.items():
+            avg = total / self._iters if self._iters else 0.0
+            phases[name] = {"share": round(total / wall, 3), "avg_ms": round(avg * 1000, 1),
+                            "max_ms": round(peak * 1000, 1)}
+        return {"iter": self._iters, "wall_s": round(wall, 2), "phases": phases}
+
+    def reset(self) -> None:
+        self._phases = {}
+        self._iters  = 0
+        self._start  = None
+
+    # ── captures ────────────────────────────────────────────────────────────
+    def arm(self, kind: str) -> None:
+        """kind = 'cpu' (cProfile) ou 'mem' (tracemalloc), pour les profile_iters itérations suivantes."""
+        if kind not in ("cpu", "mem"):
+            raise ValueError(f"capture inconnue: {kind!r} (cpu, mem)")
+        self._armed.add(kind)
+
+    def install_signals(self) -> None:
+        """SIGUSR1 -> cProfile, SIGUSR2 -> tracemalloc (le handler ne fait qu'armer)."""
+        for name, kind in (("SIGUSR1", "cpu"), ("SIGUSR2", "mem")):
+            sig = getattr(signal, name, None)
+            if sig is None:
+                continue                        # Windows
+            try:
+                signal.signal(sig, lambda signum, frame, kind=kind: self.arm(kind))
+            except ValueError:
+                pass                            # hors du thread principal
+
+    def _path(self, prefix: str, ext: str) -> str:
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        return os.path.join(self.out_dir, f"{prefix}_{os.getpid()}_{stamp}.{ext}")
+
+    def _start_captures(self) -> None:
+        if not self._armed:
+            return
+        if "cpu" in self._armed and self._cpu is None:
+            self._cpu, self._cpu_left = cProfile.Profile(), self.profile_iters
+            self._cpu.enable()
+            log.info("PROFILE", "cProfile demarre", iterations=self.profile_iters)
+        if "mem" in self._armed and self._mem_base is None:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+            self._mem_base, self._mem_left = tracemalloc.take_snapshot(), self.profile_iters
+            log.info("PROFILE", "tracemalloc demarre", iterations=self.profile_iters)
+        self._armed.clear()
+
+    def _stop_captures(self) -> None:
+        # tracemalloc d'abord : l'écriture du .prof n'entre pas dans son rapport
+        if self._mem_base is not None:
+            self._mem_left -= 1
+            if self._mem_left <= 0:
+                snap = tracemalloc.take_snapshot()
+                path = self._path("tracemalloc", "txt")
+                self._write_mem(path, self._mem_base, snap)
+                self._mem_base = None
+                tracemalloc.stop()
+                self._written(path)
+        if self._cpu is not None:
+            self._cpu_left -= 1
+            if self._cpu_left <= 0:
+                self._cpu.disable()
+                path = self._path("profile", "prof")
+                self._cpu.dump_stats(path)
+                self._cpu = None
+                self._written(path)
+
+    def _write_mem(self, path: str, base, snap) -> None:
+        current, peak = tracemalloc.get_traced_memory()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"traced current={current} peak={peak} iterations={self.profile_iters}\n\n")
+            f.write(f"== top {PROFILE_TOP} (lineno) ==\n")
+            for stat in snap.statistics("lineno")[:PROFILE_TOP]:
+                f.write(f"{stat}\n")
+            f.write(f"\n== diff depuis le debut de la capture (top {PROFILE_TOP}) ==\n")
+            for stat in snap.compare_to(base, "lineno")[:PROFILE_TOP]:
+                f.write(f"{stat}\n")
+
+    def _written(self, path: str) -> None:
+        self.written.append(path)
+        log.info("PROFILE", "capture ecrite", path=path)
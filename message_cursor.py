@@ -0,0 +1,80 @@
+"""
+Curseur de poll incrémental pour get-messages.php
+=================================================
+Garde un high-water mark (dernier id traité) persisté dans l'état.
+  - params()  : filtre envoyé au gateway si MSG_CURSOR_PARAM est configuré
+  - select()  : parcourt la page depuis le plus récent et s'arrête au premier
+                id déjà traité — pas de tri si la page est déjà ordonnée
+                (croissante ou décroissante) ; tri complet seulement en repli.
+
+Une page est jugée ordonnée d'après ses extrémités (le gateway trie par id) ;
+un désordre rencontré dans la partie parcourue bascule sur le tri complet.
+MSG_CURSOR_LOOKBACK re-présente les derniers ids sous le curseur (inserts
+concurrents côté gateway) ; la dédupe habituelle écarte les doublons.
+"""
+import os
+from typing import Dict, List, Optional
+
+POLL_CURSOR         = os.getenv('POLL_CURSOR', '0') == '1'
+MSG_CURSOR_PARAM    = os.getenv('MSG_CURSOR_PARAM', '')      # ex: "last_id" si le gateway le supporte
+MSG_CURSOR_LOOKBACK = int(os.getenv('MSG_CURSOR_LOOKBACK', '20'))
+
+
+def numeric_id(m: dict) -> Optional[int]:
+    mid = m.get('id') or m.get('ID')
+    try:
+        return int(mid)
+    except (TypeError, ValueError):
+        return None
+
+
+class MessageCursor:
+
+    def __init__(self, store: Dict[str, int], param: str = MSG_CURSOR_PARAM,
+                 lookback: int = MSG_CURSOR_LOOKBACK):
+        self._s       = store            # dict persisté dans l'état : {"last_id": int}
+        self.param    = param
+        self.lookback = lookback
+
+    @property
+    def last_id(self) -> int:
+        return int(self._s.get('last_id', 0))
+
+    def _floor(self) -> int:
+        return self.last_id - self.lookback if self.last_id else -1
+
+    def params(self) -> dict:
+        if not self.param or not self.last_id:
+            return {}
+        return {self.param: max(0, self._floor())}
+
+    def select(self, msgs: List[dict]) -> List[dict]:
+        """Messages d'id > curseur (moins lookback), en ordre croissant."""
+        if not msgs:
+            return []
+        first, last = numeric_id(msgs[0]), numeric_id(msgs[-1])
+        if first is None or last is None:
+            return self._select_slow(msgs)
+        floor = self._floor()
+        order = range(len(msgs) - 1, -1, -1) if last >= first else range(len(msgs))
+        out, prev = [], None
+        for i in order:
+            mid = numeric_id(msgs[i])
+            if mid is None or (prev is not None and mid > prev):
+                return self._select_slow(msgs)   # page non ordonnée
+            if mid <= floor:
+                break
+            out.append(msgs[i])
+            prev = mid
+        out.reverse()
+        return out
+
+    def _select_slow(self, msgs: List[dict]) -> List[dict]:
+        floor = self._floor()
+        keep  = [m for m in msgs if (numeric_id(m) is None or numeric_id(m) > floor)]
+        return sorted(keep, key=lambda m: numeric_id(m) or 0)
+
+    def advance(self, m: dict) -> None:
+        mid = numeric_id(m)
+        if mid is not None and mid > self.last_id:
+            self._s['last_id'] = mid
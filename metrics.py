@@ -0,0 +1,255 @@
+"""
+Métriques au format texte Prometheus (endpoint HTTP embarqué)
+=============================================================
+METRICS_PORT=9108 démarre un petit serveur HTTP (thread daemon) qui sert
+GET /metrics ; 0 (défaut) = désactivé, les compteurs restent en mémoire.
+
+  autochat_sends_total / autochat_send_failures_total       send.php
+  autochat_rate_limited_total                                refus de can_send
+  autochat_inbound_processed_total / _duplicates_total       messages reçus
+  autochat_webhook_messages_total{result}                    push webhook (accepted, rejected, full)
+  autochat_gateway_request_seconds{endpoint}                 histogramme par endpoint
+  autochat_state_save_seconds                                histogramme des écritures d'état
+  autochat_active_conversations, autochat_rr_position,
+  autochat_pending_replies{queue}, autochat_state_bytes,
+  autochat_sims, autochat_send_queue{field},
+  autochat_poll_interval_seconds                             jauges
+
+Sans dépendance (pas de prometheus_client) : compteurs, jauges et
+histogrammes protégés par un verrou, le thread HTTP ne fait que lire.
+Les jauges sont posées par la boucle principale, pas calculées au scrape :
+l'état n'est jamais lu hors de son thread.
+"""
+import glob
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from jsonlog import log
+
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')   # labels = numéros / SIMs : pas exposé par défaut
+
+# Secondes : de l'aller-retour local (ms) au timeout HTTP (30 s)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+def _labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_: str, labelnames: Sequence[str] = ()):
+        self.name       = name
+        self.help       = help_
+        self.labelnames = tuple(labelnames)
+        self._lock      = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+        if not self.labelnames:
+            self._values[()] = self._zero()     # série sans label exposée dès le départ
+
+    def _zero(self):
+        return 0
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += self._samples(items)
+        return lines
+
+    def _samples(self, items) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, n: float = 1, **labels) -> None:
+        k = self._key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0) + n
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, v: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = v
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """Buckets cumulés au rendu ; par série : [compte par bucket..., somme, total]."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_, labelnames)
+
+    def _zero(self):
+        return [0] * len(self.buckets) + [0.0, 0]
+
+    def observe(self, v: float, **labels) -> None:
+        k = self._key(labels)
+        with self._lock:
+            s = self._values.get(k)
+            if s is None:
+                s = self._values[k] = self._zero()
+            for i, b in enumerate(self.buckets):
+                if v <= b:
+                    s[i] += 1
+                    break
+            s[-2] += v
+            s[-1] += 1
+
+    def _samples(self, items) -> List[str]:
+        out = []
+        for k, s in items:
+            acc = 0
+            for b, c in zip(self.buckets, s):
+                acc += c
+                le   = 'le="%s"' % _fmt(b)
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, k, le)} {acc}")
+            inf = 'le="+Inf"'
+            out.append(f"{self.name}_bucket{_labels(self.labelnames, k, inf)} {s[-1]}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, k)} {_fmt(s[-2])}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, k)} {s[-1]}")
+        return out
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_, labelnames))
+
+    def gauge(self, name: str, help_: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_, labelnames))
+
+    def histogram(self, name: str, help_: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines += m.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ── Catalogue (commun aux deux workers) ─────────────────────────────────────
+SENDS           = REGISTRY.counter("autochat_sends_total", "SMS acceptes par send.php")
+SEND_FAILURES   = REGISTRY.counter("autochat_send_failures_total", "Envois en erreur (HTTP ou success=false)")
+RATE_LIMITED    = REGISTRY.counter("autochat_rate_limited_total", "Envois refuses par le limiteur de debit")
+INBOUND         = REGISTRY.counter("autochat_inbound_processed_total", "Messages recus traites (hors doublons)")
+DUPLICATES      = REGISTRY.counter("autochat_inbound_duplicates_total", "Messages recus deja vus")
+WEBHOOK         = REGISTRY.counter("autochat_webhook_messages_total", "Messages pousses sur le webhook",
+                                   ("result",))
+GATEWAY_SECONDS = REGISTRY.histogram("autochat_gateway_request_seconds", "Latence des appels au gateway",
+                                     ("endpoint",))
+SAVE_SECONDS    = REGISTRY.histogram("autochat_state_save_seconds", "Duree des ecritures de l'etat")
+ACTIVE_CONVS    = REGISTRY.gauge("autochat_active_conversations", "Conversations actives")
+RR_POSITION     = REGISTRY.gauge("autochat_rr_position", "Index de l'emetteur (ou de la ronde en tournoi)")
+PENDING_REPLIES = REGISTRY.gauge("autochat_pending_replies", "Reponses en attente", ("queue",))
+STATE_BYTES     = REGISTRY.gauge("autochat_state_bytes", "Taille sur disque des fichiers d'etat")
+SIMS            = REGISTRY.gauge("autochat_sims", "SIMs actives")
+SEND_QUEUE      = REGISTRY.gauge("autochat_send_queue", "Files d'envoi par telephone", ("field",))
+POLL_INTERVAL   = REGISTRY.gauge("autochat_poll_interval_seconds", "Intervalle courant entre deux get-messages")
+
+
+def endpoint_label(path: str) -> str:
+    """'/services/send.php' -> 'send.php'."""
+    return path.rsplit("/", 1)[-1]
+
+
+def state_bytes(state_file: str) -> int:
+    """Somme des fichiers <STATE_FILE sans extension>.* (json, journal, db, wal, convs.bin)."""
+    total = 0
+    for path in glob.glob(glob.escape(os.path.splitext(state_file)[0]) + ".*"):
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+
+def set_send_queue(gauges: Dict[str, object]) -> None:
+    """Recopie dispatcher.gauges() (queued, in_flight)."""
+    for field in ("queued", "in_flight"):
+        SEND_QUEUE.set(gauges.get(field, 0), field=field)
+
+
+# ── Serveur HTTP ────────────────────────────────────────────────────────────
+class _Handler(BaseHTTPRequestHandler):
+    registry: Registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def serve(port: int = METRICS_PORT, host: str = METRICS_HOST,
+          registry: Registry = REGISTRY) -> Optional[ThreadingHTTPServer]:
+    """Démarre /metrics dans un thread daemon ; None si port=0 ou port occupé."""
+    if not port:
+        return None
+    handler = type("MetricsHandler", (_Handler,), {"registry": registry})
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        log.warn("METRICS", "port indisponible", port=port, err=str(e))
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    log.info("METRICS", "serveur demarre", url=f"http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,346 @@
+"""
+Matrice compacte des convs (grandes flottes de SIMs)
+====================================================
+Remplace le dict {"+2376..|+2376..": {turn, status, last_sender, at}} —
+un dict Python par paire, soit ~500k dicts pour 1000 SIMs — par :
+
+  - des numéros internés en petits ids (0, 1, 2, ...)
+  - un id de paire triangulaire p = j*(j-1)/2 + i (i < j), stable quand de
+    nouveaux numéros arrivent (les paires s'ajoutent en fin de tableaux)
+  - des tableaux `array` indexés par p : status (B), champs présents (B),
+    turn (H), last_sender (B : 1 = numéro i, 2 = numéro j), at (d)
+
+PairMatrix se manipule comme le dict d'origine (convs.get(key),
+convs[key] = {...}, conv["turn"] = n, del convs[key], itération) : les convs
+sont des vues (ConvView) sur les tableaux. Les champs hors de ce schéma
+(ex. "err") vont dans un petit dict `extra` par paire.
+
+dumps() / loads() : sérialisation binaire (en-tête + tableaux bruts + extra
+en JSON). PairMatrixStore écrit la matrice à part, à côté du backend d'état.
+"""
+import os
+import sys
+import json
+import struct
+import tempfile
+from array import array
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+_MAGIC  = b"PMX1"
+_HEADER = struct.Struct("<4sBII")            # magic, big-endian?, nb numéros, nb paires
+
+_STATUS = {"active": 1, "done": 2}           # 3 = autre valeur (dans extra)
+_STATUS_NAME = {1: "active", 2: "done"}
+F_TURN, F_LAST, F_AT = 1, 2, 4               # bits de `fields`
+
+
+def _tri(i: int, j: int) -> int:
+    if i > j:
+        i, j = j, i
+    return j * (j - 1) // 2 + i
+
+
+class ConvView(MutableMapping):
+    """Vue dict d'une paire de la matrice ; les écritures passent dans les tableaux."""
+
+    __slots__ = ("_m", "_p", "_key")
+
+    def __init__(self, m: "PairMatrix", p: int, key: str):
+        self._m, self._p, self._key = m, p, key
+
+    def __getitem__(self, field: str) -> Any:
+        return self._m._get(self._p, self._key, field)
+
+    def __setitem__(self, field: str, value: Any) -> None:
+        if self._m.status[self._p]:          # paire supprimée entre-temps : vue détachée
+            self._m._set(self._p, self._key, field, value)
+            self._m._notify((self._key, field), "set", value)
+
+    def __delitem__(self, field: str) -> None:
+        self._m._del(self._p, field)
+        self._m._notify((self._key, field), "del", None)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._m._fields(self._p))
+
+    def __len__(self) -> int:
+        return len(self._m._fields(self._p))
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class PairMatrix(MutableMapping):
+
+    def __init__(self):
+        self.nums: List[str] = []
+        self.ids:  Dict[str, int] = {}
+        self.status = array("B")
+        self.fields = array("B")
+        self.turn   = array("H")
+        self.last   = array("B")
+        self.at     = array("d")
+        self.extra: Dict[int, Dict[str, Any]] = {}
+        self._len   = 0
+        self._listener: Optional[Callable[[tuple, str, Any], None]] = None
+
+    @classmethod
+    def from_dict(cls, convs: Mapping) -> "PairMatrix":
+        m = cls()
+        for k, conv in convs.items():
+            m._store(k, conv)
+        return m
+
+    # ── Suivi (state_store._wrap appelle bind_tracker) ──────────────────────
+    def bind_tracker(self, tracker, path: tuple) -> None:
+        self._listener = lambda p, op, v: tracker.touch(path + p, op, v)
+
+    def _notify(self, path: tuple, op: str, value: Any) -> None:
+        if self._listener is not None:
+            self._listener(path, op, value)
+
+    # ── Ids ─────────────────────────────────────────────────────────────────
+    def _intern(self, num: str) -> int:
+        i = self.ids.get(num)
+        if i is None:
+            i = self.ids[num] = len(self.nums)
+            self.nums.append(num)
+            if i:                            # i nouvelles paires (i, 0..i-1)
+                for a in (self.status, self.fields, self.turn, self.last, self.at):
+                    a.frombytes(bytes(i * a.itemsize))
+        return i
+
+    def _pid(self, key: str, create: bool = False) -> Optional[int]:
+        parts = key.split("|", 1)
+        if len(parts) != 2 or parts[0] == parts[1]:
+            if create:
+                raise KeyError(key)
+            return None
+        if create:
+            return _tri(self._intern(parts[0]), self._intern(parts[1]))
+        i, j = self.ids.get(parts[0]), self.ids.get(parts[1])
+        if i is None or j is None:
+            return None
+        return _tri(i, j)
+
+    def _key(self, i: int, j: int) -> str:
+        a, b = self.nums[i], self.nums[j]
+        return f"{a}|{b}" if a <= b else f"{b}|{a}"
+
+    def _ends(self, p: int, key: str):
+        """(numéro d'id bas, numéro d'id haut) de la paire."""
+        a, b = key.split("|", 1)
+        return (a, b) if self.ids[a] < self.ids[b] else (b, a)
+
+    # ── Champs ──────────────────────────────────────────────────────────────
+    def _fields(self, p: int) -> List[str]:
+        f, out = self.fields[p], []
+        if f & F_TURN:
+            out.append("turn")
+        if self.status[p] in _STATUS_NAME or "status" in self.extra.get(p, ()):
+            out.append("status")
+        if f & F_LAST:
+            out.append("last_sender")
+        if f & F_AT:
+            out.append("at")
+        out.extend(k for k in self.extra.get(p, ()) if k not in out)
+        return out
+
+    def _get(self, p: int, key: str, field: str) -> Any:
+        ex = self.extra.get(p)
+        if ex is not None and field in ex:
+            return ex[field]
+        if field == "status" and self.status[p] in _STATUS_NAME:
+            return _STATUS_NAME[self.status[p]]
+        f = self.fields[p]
+        if field == "turn" and f & F_TURN:
+            return self.turn[p]
+        if field == "last_sender" and f & F_LAST:
+            return self._ends(p, key)[self.last[p] - 1]
+        if field == "at" and f & F_AT:
+            return self.at[p]
+        raise KeyError(field)
+
+    def _set(self, p: int, key: str, field: str, value: Any) -> None:
+        self._del(p, field)
+        if field == "status" and value in _STATUS:
+            self.status[p] = _STATUS[value]
+            return
+        if field == "turn" and isinstance(value, int) and 0 <= value < 65536:
+            self.turn[p] = value
+            self.fields[p] |= F_TURN
+            return
+        if field == "last_sender" and value in self._ends(p, key):
+            self.last[p] = self._ends(p, key).index(value) + 1
+            self.fields[p] |= F_LAST
+            return
+        if field == "at" and isinstance(value, (int, float)):
+            self.at[p] = value
+            self.fields[p] |= F_AT
+            return
+        self.extra.setdefault(p, {})[field] = value
+
+    def _del(self, p: int, field: str) -> None:
+        if field == "status" and self.status[p]:
+            self.status[p] = 3               # paire toujours présente, sans statut connu
+        bit = {"turn": F_TURN, "last_sender": F_LAST, "at": F_AT}.get(field, 0)
+        self.fields[p] &= ~bit & 0xFF
+        ex = self.extra.get(p)
+        if ex is not None:
+            ex.pop(field, None)
+            if not ex:
+                del self.extra[p]
+
+    def _store(self, key: str, conv: Mapping) -> int:
+        p = self._pid(key, create=True)
+        if not self.status[p]:
+            self._len += 1
+        self.status[p], self.fields[p] = 3, 0
+        self.extra.pop(p, None)
+        for field, value in conv.items():
+            self._set(p, key, field, value)
+        return p
+
+    # ── Interface dict ──────────────────────────────────────────────────────
+    def __getitem__(self, key: str) -> ConvView:
+        p = self._pid(key)
+        if p is None or not self.status[p]:
+            raise KeyError(key)
+        return ConvView(self, p, key)
+
+    def __setitem__(self, key: str, conv: Mapping) -> None:
+        conv = dict(conv)
+        self._store(key, conv)
+        self._notify((key,), "set", conv)
+
+    def __delitem__(self, key: str) -> None:
+        p = self._pid(key)
+        if p is None or not self.status[p]:
+            raise KeyError(key)
+        self.status[p] = self.fields[p] = 0
+        self.extra.pop(p, None)
+        self._len -= 1
+        self._notify((key,), "del", None)
+
+    def __iter__(self) -> Iterator[str]:
+        status, p = self.status, 0
+        for j in range(1, len(self.nums)):
+            for i in range(j):
+                if status[p]:
+                    yield self._key(i, j)
+                p += 1
+
+    def __len__(self) -> int:
+        return self._len
+
+    def clear(self) -> None:
+        n = len(self.status)
+        self.status = array("B", bytes(n))
+        self.fields = array("B", bytes(n))
+        self.extra.clear()
+        self._len = 0
+        self._notify((), "set", {})
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        return {k: dict(v) for k, v in self.items()}
+
+    def __repr__(self) -> str:
+        return f"PairMatrix({len(self.nums)} numeros, {self._len} convs)"
+
+
+# ─── Sérialisation binaire ──────────────────────────────────────────────────────
+def dumps(m: PairMatrix) -> bytes:
+    nums  = "\n".join(m.nums).encode("utf-8")
+    extra = json.dumps({str(p): v for p, v in m.extra.items()},
+                       ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return b"".join([
+        _HEADER.pack(_MAGIC, sys.byteorder == "big", len(m.nums), len(m.status)),
+        struct.pack("<I", len(nums)), nums,
+        m.status.tobytes(), m.fields.tobytes(), m.turn.tobytes(), m.last.tobytes(), m.at.tobytes(),
+        struct.pack("<I", len(extra)), extra,
+    ])
+
+
+def loads(data: bytes) -> PairMatrix:
+    magic, big, n_nums, n_pairs = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC:
+        raise ValueError("pair matrix: en-tete invalide")
+    off = _HEADER.size
+    (ln,) = struct.unpack_from("<I", data, off); off += 4
+    m = PairMatrix()
+    m.nums = data[off:off + ln].decode("utf-8").split("\n") if n_nums else []
+    m.ids  = {n: i for i, n in enumerate(m.nums)}
+    off += ln
+    for name in ("status", "fields", "turn", "last", "at"):
+        a = getattr(m, name)
+        size = n_pairs * a.itemsize
+        a.frombytes(data[off:off + size])
+        if a.itemsize > 1 and big != (sys.byteorder == "big"):
+            a.byteswap()
+        off += size
+    (le,) = struct.unpack_from("<I", data, off); off += 4
+    m.extra = {int(p): v for p, v in json.loads(data[off:off + le] or b"{}").items()}
+    m._len  = sum(1 for s in m.status if s)
+    return m
+
+
+class PairMatrixStore:
+    """
+    Enveloppe un backend d'état : la section `section` (PairMatrix) est écrite
+    en binaire dans `path` quand elle est sale, le reste passe au backend.
+    Les records de journal de cette section sont ignorés : la matrice est
+    réécrite à chaque flush qui la touche.
+    """
+
+    def __init__(self, inner, path: str, section: str = "convs"):
+        self.inner   = inner
+        self.path    = path
+        self.section = section
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        state = self.inner.load()
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                state = state or {}
+                state[self.section] = loads(f.read())
+        elif state is not None and not isinstance(state.get(self.section), PairMatrix):
+            state[self.section] = PairMatrix.from_dict(state.get(self.section) or {})
+        return state
+
+    def record(self, path: tuple, op: str, value: Any) -> None:
+        if path and path[0] != self.section and hasattr(self.inner, "record"):
+            self.inner.record(path, op, value)
+
+    def save(self, state: Dict[str, Any], dirty: Optional[Set[tuple]] = None) -> None:
+        m = state.get(self.section)
+        if not isinstance(m, PairMatrix):
+            self.inner.save(state, dirty)
+            return
+        if dirty is not None and () in dirty:
+            dirty = None                     # racine remplacée : tout réécrire
+        if dirty is None or any(d and d[0] == self.section for d in dirty):
+            self._write(dumps(m))
+        rest = {k: v for k, v in state.items() if k != self.section}
+        if dirty is None:
+            self.inner.save(rest)
+            return
+        dirty = {d for d in dirty if d and d[0] != self.section}
+        if dirty:
+            self.inner.save(rest, dirty)
+
+    def _write(self, data: bytes) -> None:
+        d = os.path.dirname(os.path.abspath(self.path)) or "."
+        fd, tmp = tempfile.mkstemp(prefix="pmx_", suffix=".bin", dir=d)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def close(self) -> None:
+        self.inner.close()
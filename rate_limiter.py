@@ -0,0 +1,67 @@
+"""
+Limiteur de débit GCRA (global + par SIM)
+=========================================
+Remplace les listes de timestamps des 60 dernières secondes (élaguées à
+chaque appel et persistées en entier) par un seul instant théorique
+d'arrivée (TAT) par compteur :
+
+    {"tat": 1792200012.5, "sims": {"1|0": 1792200010.0, "2|0": ...}}
+
+Pour une limite de N envois / fenêtre, l'intervalle d'émission est
+T = fenêtre / N et une rafale de N envois reste permise (tolérance (N-1)·T),
+comme avec la fenêtre glissante. Chaque vérification est O(1) et la taille
+persistée est constante par SIM.
+"""
+from typing import Callable, Dict
+
+import clock
+
+
+class RateLimiter:
+
+    def __init__(self, store: Dict, global_limit: int, per_sim_limit: int,
+                 window_s: float = 60.0, now: Callable[[], float] = clock.now):
+        self._s    = store
+        self._now  = now
+        self._g_iv = window_s / max(global_limit, 1)
+        self._s_iv = window_s / max(per_sim_limit, 1)
+        self._g_tol = (max(global_limit, 1) - 1) * self._g_iv
+        self._s_tol = (max(per_sim_limit, 1) - 1) * self._s_iv
+        if 'tat' not in store:
+            self._migrate(window_s)
+
+    def _migrate(self, window_s: float) -> None:
+        # Ancien format {"global": [ts...], "per"|"per_sim": {spec: [ts...]}} :
+        # n envois récents → TAT = now + n·T (il reste N - n envois immédiats)
+        now    = self._now()
+        recent = lambda lst: sum(1 for t in lst or [] if now - t <= window_s)
+        legacy = dict(self._s)
+        per    = legacy.get('per') or legacy.get('per_sim') or {}
+        self._s.clear()
+        n = recent(legacy.get('global'))
+        self._s['tat']  = round(now + n * self._g_iv, 3) if n else 0.0
+        self._s['sims'] = {spec: round(now + k * self._s_iv, 3)
+                           for spec, k in ((s, recent(l)) for s, l in per.items()) if k}
+
+    def _wait(self, spec: str, now: float) -> float:
+        g = self._s['tat'] - self._g_tol - now
+        s = self._s['sims'].get(spec, 0.0) - self._s_tol - now
+        return max(g, s, 0.0)
+
+    def global_wait(self) -> float:
+        """Secondes avant que la limite globale accepte un envoi (toutes SIMs)."""
+        return max(self._s['tat'] - self._g_tol - self._now(), 0.0)
+
+    def time_until_allowed(self, spec: str) -> float:
+        """Secondes avant qu'un envoi sur spec soit accepté (0 = tout de suite)."""
+        return self._wait(spec, self._now())
+
+    def try_acquire(self, spec: str) -> bool:
+        """Consomme un envoi global + SIM si les deux limites le permettent."""
+        now = self._now()
+        if self._wait(spec, now) > 0:
+            return False
+        self._s['tat'] = round(max(self._s['tat'], now) + self._g_iv, 3)
+        sims = self._s['sims']
+        sims[spec] = round(max(sims.get(spec, 0.0), now) + self._s_iv, 3)
+        return True
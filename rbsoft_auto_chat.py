@@ -14,15 +14,29 @@ Structure SIM retournée :
 
 import os
 import re
-import json
-import time
+import asyncio
 import uuid
 import random
-import tempfile
 import threading
+from concurrent.futures import Future
 from typing import Dict, Any, List, Optional, Set, Tuple
-import requests
-from requests import HTTPError
+import clock
+import metrics
+from jsonlog import log
+from gateway_client import GatewayClient, EP_DEVICES
+from reply_scheduler import ReplyScheduler
+from message_cursor import MessageCursor, POLL_CURSOR
+from dedupe import DedupeStore
+from rate_limiter import RateLimiter
+from rr_progress import RoundRobinProgress
+from tournament import RR_MODE, round_count, round_pairs
+from send_dispatch import DeviceDispatcher, SendCompletions
+from admission import AdmissionQueue, PRIO_OPENER, PRIO_REFRESH, PRIO_REPLY
+from state_store import StatePersister, make_store
+from loop_profiler import LoopProfiler
+from adaptive_poll import AdaptivePoller
+from webhook import WebhookInbox
+from async_engine import AsyncSendLimiter, every, install_executor, spawn, to_thread
 
 # =========================
 # CONFIG
@@ -43,11 +57,7 @@ GLOBAL_SEND_PER_MIN    = int(os.getenv('GLOBAL_SEND_PER_MIN',    '120'))
 PER_SIM_SEND_PER_MIN   = int(os.getenv('PER_SIM_SEND_PER_MIN',   '30'))
 DISCOVERY_WAIT_S       = int(os.getenv('DISCOVERY_WAIT_S',       '30'))
 MIN_SIMS_REQUIRED      = int(os.getenv('MIN_SIMS_REQUIRED',      '2'))
-
-# ── Vrais endpoints (découverts dans le code source PHP) ─────────────────────
-EP_DEVICES  = '/services/get-devices.php'
-EP_SEND     = '/services/send.php'
-EP_MESSAGES = '/services/get-messages.php'   # supporte ?status=Received
+RR_TICK_INTERVAL_S     = int(os.getenv('RR_TICK_INTERVAL_S',     '15'))  # fréquence des envois initiaux (async)
 
 DISCOVERY_TAG    = '[AUTOCHAT:REGISTER]'
 CONVERSATION_TAG = '[AUTOCHAT:CONV'
@@ -68,32 +78,9 @@ TEMPLATES = [
 # =========================
 # HTTP helpers
 # =========================
-def _base_params() -> dict:
-    """Paramètres d'authentification à ajouter à chaque requête."""
-    return {'key': API_KEY}
-
-def _headers() -> dict:
-    return {"Accept": "application/json"}
-
-def _safe_json(r: requests.Response, context: str = "") -> dict:
-    """Parse JSON de manière sécurisée — retourne {} si la réponse est vide ou non-JSON."""
-    body = r.text.strip() if r.text else ""
-    if not body:
-        # Réponse vide : normal quand aucun message (ex: 204 No Content)
-        return {}
-    try:
-        return r.json()
-    except ValueError:
-        # Log uniquement si ce n'est pas une réponse HTML/vide attendue
-        snippet = body[:120].replace("\n", " ")
-        print(f"[WARN] JSON parse fail ({context}) status={r.status_code} body={snippet!r}", flush=True)
-        return {}
+client = GatewayClient(BASE_URL, API_KEY)
 
-def api_get(path: str, params: Optional[dict] = None) -> dict:
-    p = {**_base_params(), **(params or {})}
-    r = requests.get(f"{BASE_URL}{path}", headers=_headers(), params=p, timeout=30)
-    r.raise_for_status()
-    data = _safe_json(r, path)
+def _raise_api_error(data: dict) -> dict:
     if isinstance(data, dict) and data.get("success") is False:
         err  = data.get("error", {})
         code = err.get("code", 0) if isinstance(err, dict) else 0
@@ -101,25 +88,15 @@ def api_get(path: str, params: Optional[dict] = None) -> dict:
         raise RuntimeError(f"API error {code}: {msg}")
     return data
 
+def api_get(path: str, params: Optional[dict] = None) -> dict:
+    return _raise_api_error(client.get_json(path, params))
+
 def api_get_raw(path: str, params: Optional[dict] = None) -> dict:
     """Retourne le dict brut sans lever d'exception sur success=False."""
-    p = {**_base_params(), **(params or {})}
-    r = requests.get(f"{BASE_URL}{path}", headers=_headers(), params=p, timeout=30)
-    r.raise_for_status()
-    return _safe_json(r, path)
+    return client.get_json(path, params)
 
 def api_post(path: str, payload: Optional[dict] = None, params: Optional[dict] = None) -> dict:
-    p = {**_base_params(), **(params or {})}
-    r = requests.post(f"{BASE_URL}{path}", headers=_headers(), params=p,
-                      data=payload or {}, timeout=30)
-    r.raise_for_status()
-    data = _safe_json(r, path)
-    if isinstance(data, dict) and data.get("success") is False:
-        err  = data.get("error", {})
-        code = err.get("code", 0) if isinstance(err, dict) else 0
-        msg  = err.get("message", str(err)) if isinstance(err, dict) else str(err)
-        raise RuntimeError(f"API error {code}: {msg}")
-    return data
+    return _raise_api_error(client.post_json(path, payload, params))
 
 # =========================
 # Parsing des SIMs
@@ -157,8 +134,9 @@ def _default_state() -> Dict[str, Any]:
         # Round-robin: quel SIM est l'émetteur courant
         'round_robin':    {'sender_idx': 0, 'cycle': 0},
         'known_sims':     {},          # {number: "device_id|slot"}
-        'dedupe_msg_ids': {},
-        'rate':           {'global': [], 'per_sim': {}},
+        'dedupe_msg_ids': {},          # DedupeStore: {wm: id, win: {msg_id: ts}}
+        'cursor':         {},          # {last_id: int} (POLL_CURSOR=1)
+        'rate':           {},
         'meta':           {'last_sim_refresh': 0},
         'discovery': {
             'done':             False,
@@ -169,56 +147,67 @@ def _default_state() -> Dict[str, Any]:
         },
     }
 
+# Sections stockées ligne à ligne en STATE_BACKEND=sqlite (le reste va dans kv)
+STATE_LAYOUT = {'pairs': 'convs', 'known_sims': 'sims', 'dedupe_msg_ids': 'dedupe', 'rate': 'rate'}
+_store = None
+
+def _get_store():
+    global _store
+    if _store is None:
+        _store = make_store(STATE_FILE, STATE_LAYOUT, prefix="rbsoft_")
+    return _store
+
 def load_state() -> Dict[str, Any]:
-    if not os.path.exists(STATE_FILE):
+    state = _get_store().load()
+    if state is None:
         return _default_state()
-    with open(STATE_FILE, 'r', encoding='utf-8') as f:
-        state = json.load(f)
     if 'discovery' not in state:
         state['discovery'] = _default_state()['discovery']
     return state
 
 def atomic_save(state: Dict[str, Any]) -> None:
-    # Temp file in same dir as STATE_FILE to avoid cross-device rename (Render.com)
-    state_dir = os.path.dirname(os.path.abspath(STATE_FILE)) or "."
-    fd, tmp = tempfile.mkstemp(prefix="rbsoft_", suffix=".json", dir=state_dir)
-    try:
-        with os.fdopen(fd, "w", encoding="utf-8") as f:
-            json.dump(state, f, ensure_ascii=False, indent=2)
-        os.replace(tmp, STATE_FILE)
-    except Exception:
-        # Fallback: direct write if rename still fails
-        try:
-            with open(STATE_FILE, "w", encoding="utf-8") as f:
-                json.dump(state, f, ensure_ascii=False, indent=2)
-        except Exception as e2:
-            print(f"[WARN] atomic_save failed: {e2}", flush=True)
-    finally:
-        if os.path.exists(tmp):
-            try: os.remove(tmp)
-            except: pass
+    t0 = clock.monotonic()
+    _get_store().save(state)
+    metrics.SAVE_SECONDS.observe(clock.monotonic() - t0)
+
+_persister: Optional[StatePersister] = None
+
+def track_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Enveloppe l'état pour suivre ses mutations : flush_state() n'écrit que
+    si quelque chose a changé, au plus une fois par STATE_FLUSH_S.
+    """
+    global _persister, _progress
+    _persister = StatePersister(_get_store())
+    _persister.install_shutdown_flush()
+    state     = _persister.track(state)
+    _progress = RoundRobinProgress(state, "pairs", "known_sims", directed=True)
+    _persister.tracker.listeners.append(_progress.on_change)
+    return state
+
+def flush_state(force: bool = False) -> bool:
+    t0    = clock.monotonic()
+    wrote = _persister.flush() if force else _persister.maybe_flush()
+    if wrote:
+        metrics.SAVE_SECONDS.observe(clock.monotonic() - t0)
+        metrics.STATE_BYTES.set(metrics.state_bytes(STATE_FILE))
+    return wrote
 
 # =========================
 # Rate limiting
 # =========================
-def _prune(ts_list: List[float], window_s: int = 60) -> List[float]:
-    now = time.time()
-    return [t for t in ts_list if (now - t) <= window_s]
+def _limiter(state: Dict[str, Any]) -> RateLimiter:
+    return RateLimiter(state.setdefault('rate', {}), GLOBAL_SEND_PER_MIN, PER_SIM_SEND_PER_MIN)
 
 def can_send(state: Dict[str, Any], spec: str) -> bool:
-    """spec = 'device_id|slot' ou 'device_id'."""
-    now  = time.time()
-    rate = state.setdefault('rate', {'global': [], 'per_sim': {}})
-    rate['global'] = _prune(rate.get('global', []))
-    per = rate.setdefault('per_sim', {})
-    per[spec] = _prune(per.get(spec, []))
-    if len(rate['global']) >= GLOBAL_SEND_PER_MIN:
-        return False
-    if len(per[spec]) >= PER_SIM_SEND_PER_MIN:
-        return False
-    rate['global'].append(now)
-    per[spec].append(now)
-    return True
+    """spec = 'device_id|slot' ou 'device_id'. Consomme un envoi si permis."""
+    if _limiter(state).try_acquire(spec):
+        return True
+    metrics.RATE_LIMITED.inc()
+    return False
+
+def time_until_allowed(state: Dict[str, Any], spec: str) -> float:
+    return _limiter(state).time_until_allowed(spec)
 
 # =========================
 # Fetch SIMs (API réelle)
@@ -243,7 +232,7 @@ def fetch_sims(state: Dict[str, Any]) -> Dict[str, str]:
       }
     }
     """
-    data     = api_get(EP_DEVICES)
+    data     = _raise_api_error(client.get_devices())
     devices  = data.get('data', {}).get('devices', [])
     sims_map: Dict[str, str] = {}
 
@@ -263,41 +252,60 @@ def fetch_sims(state: Dict[str, Any]) -> Dict[str, str]:
 # =========================
 # Send SMS (API réelle)
 # =========================
-def send_sms(state: Dict[str, Any], spec: str, to_number: str, message: str) -> None:
+def _send_now(spec: str, to_number: str, message: str) -> None:
     """
     Envoie un SMS via GET /services/send.php?key=...&number=...&message=...&devices=DEVICE_ID|SLOT
     """
-    params = {
-        'number':   to_number,
-        'message':  message,
-        'devices':  spec,
-        'type':     'sms',
-        'prioritize': 1,
-    }
     # Le gateway accepte GET et POST — on utilise GET pour la simplicité
-    p = {**_base_params(), **params}
-    r = requests.get(f'{BASE_URL}{EP_SEND}', headers=_headers(), params=p, timeout=30)
-    r.raise_for_status()
-    data = _safe_json(r, EP_SEND)
-    if isinstance(data, dict) and data.get("success") is False:
-        err = data.get("error", {})
-        msg = err.get("message", str(err)) if isinstance(err, dict) else str(err)
-        raise RuntimeError(f"send_sms error: {msg}")
-    print(f"  [SMS] {spec} -> {to_number} | {message[:40]}", flush=True)
+    try:
+        data = client.send(spec, to_number, message)
+        if isinstance(data, dict) and data.get("success") is False:
+            err = data.get("error", {})
+            msg = err.get("message", str(err)) if isinstance(err, dict) else str(err)
+            raise RuntimeError(f"send_sms error: {msg}")
+    except Exception:
+        metrics.SEND_FAILURES.inc()
+        raise
+    metrics.SENDS.inc()
+    log.info("SMS", "envoyé", sample=True, spec=spec, to=to_number, text=message[:40])
+
+# Chaque envoi passe par la file de son téléphone (send_dispatch) : un appareil
+# lent ou hors ligne ne retient plus les envois destinés aux autres.
+dispatcher = DeviceDispatcher()
+# ENGINE=sync : les résultats des envois sont appliqués par la boucle (drain_sends)
+sends      = SendCompletions()
+
+def send_sms(state: Dict[str, Any], spec: str, to_number: str, message: str) -> Future:
+    """Retourne le Future de l'envoi : la boucle n'attend pas le téléphone."""
+    return dispatcher.submit(spec, _send_now, spec, to_number, message)
+
+def send_sms_async(spec: str, to_number: str, message: str) -> "asyncio.Future":
+    return asyncio.wrap_future(dispatcher.submit(spec, _send_now, spec, to_number, message))
 
 # =========================
 # Fetch messages reçus
 # =========================
-def fetch_received_messages(state: Dict[str, Any]) -> List[dict]:
+def fetch_received_messages(state: Dict[str, Any], params: Optional[dict] = None) -> List[dict]:
     """
     GET /services/get-messages.php?key=...&status=Received
     Réponse: {"success": true, "data": {"messages": [{number, message, status, deviceID, simSlot, ...}]}}
     """
-    data = api_get_raw(EP_MESSAGES, params={'status': 'Received'})
+    data = client.get_messages('Received', **(params or {}))
     if not isinstance(data, dict) or not data.get('success'):
         return []
     return data.get('data', {}).get('messages', [])
 
+def poll_inbound(state: Dict[str, Any]) -> Tuple[List[dict], Optional[MessageCursor]]:
+    """
+    Messages à traiter en ordre croissant + curseur à avancer après chaque
+    message (None hors mode POLL_CURSOR=1 : liste complète triée).
+    """
+    if not POLL_CURSOR:
+        msgs = fetch_received_messages(state)
+        return sorted(msgs, key=lambda x: int(x.get("id") or x.get("ID") or 0)), None
+    cursor = MessageCursor(state.setdefault("cursor", {}))
+    return cursor.select(fetch_received_messages(state, cursor.params())), cursor
+
 def msg_id_from(msg: dict) -> Optional[str]:
     """Retourne un ID stable pour dédupliquer (ID BDD ou hash contenu)."""
     mid = msg.get('id') or msg.get('ID')
@@ -321,19 +329,27 @@ def discovery_send_registrations(state: Dict[str, Any], sims_map: Dict[str, str]
     disc    = state['discovery']
     col_num = disc['collector_number']
 
-    print(f'\n[DISCOVERY] Collecteur : {col_num} (spec={disc["collector_spec"]})', flush=True)
-    print(f'[DISCOVERY] Envoi registration depuis {len(sims_map)-1} SIM(s)...', flush=True)
+    log.info("DISCOVERY", "collecteur", number=col_num, spec=disc["collector_spec"])
+    log.info("DISCOVERY", "envoi des registrations", sims=len(sims_map) - 1)
 
     for number, spec in sorted(sims_map.items()):
         if number == col_num:
             continue
         msg = f'{DISCOVERY_TAG} number={number} spec={spec}'
+        # Priorité la plus basse : attend que le débit laisse passer l'envoi
+        while True:
+            ok, drained = admission.admit(state, PRIO_REFRESH, spec)
+            if drained:
+                log.results("REPLY", drained)
+            if ok:
+                break
+            clock.sleep(max(time_until_allowed(state, spec), 0.5))
         try:
-            send_sms(state, spec, col_num, msg)
-            print(f'  [REG] {number} ({spec}) → {col_num}', flush=True)
-            time.sleep(random.uniform(1.0, 2.5))
+            send_sms(state, spec, col_num, msg).result()
+            log.info("REG", "registration envoyée", number=number, spec=spec, to=col_num)
+            clock.sleep(random.uniform(1.0, 2.5))
         except Exception as e:
-            print(f'  [REG] ERREUR {number}: {e}', flush=True)
+            log.error("REG", "registration en erreur", number=number, err=str(e))
 
 def parse_registration(content: str) -> Optional[Tuple[str, str]]:
     """Parse un SMS de registration. Retourne (number, spec) ou None."""
@@ -359,12 +375,12 @@ def discovery_collect_registrations(state: Dict[str, Any]) -> None:
     all_sims  = disc['all_sims']
     expected  = len(all_sims) - 1
     confirmed = disc['confirmed_sims']
-    dedupe    = state.setdefault('dedupe_msg_ids', {})
+    dedupe    = DedupeStore(state.setdefault('dedupe_msg_ids', {}))
 
-    print(f'\n[DISCOVERY] Attente de {expected} SMS (timeout={DISCOVERY_WAIT_S}s)...', flush=True)
+    log.info("DISCOVERY", "attente des registrations", expected=expected, timeout_s=DISCOVERY_WAIT_S)
 
-    deadline = time.time() + DISCOVERY_WAIT_S
-    while time.time() < deadline:
+    deadline = clock.now() + DISCOVERY_WAIT_S
+    while clock.now() < deadline:
         try:
             msgs = fetch_received_messages(state)
             for msg in msgs:
@@ -377,32 +393,32 @@ def discovery_collect_registrations(state: Dict[str, Any]) -> None:
                 parsed = parse_registration(content)
                 if parsed:
                     num, spec = parsed
-                    dedupe[mid] = time.time()
+                    dedupe.add(mid)
                     if num not in confirmed:
                         confirmed[num] = spec
-                        print(f'  ✓ CONFIRMÉ {num} (spec={spec})', flush=True)
+                        log.info("DISCOVERY", "confirmé", number=num, spec=spec)
 
             atomic_save(state)
             if len(confirmed) >= expected:
-                print(f'[DISCOVERY] Tous confirmés ({len(confirmed)}/{expected}).', flush=True)
+                log.info("DISCOVERY", "tous confirmés", confirmed=len(confirmed), expected=expected)
                 break
         except Exception as e:
-            print(f'[DISCOVERY] Erreur polling : {e}', flush=True)
+            log.warn("DISCOVERY", "erreur de polling", err=str(e))
 
-        time.sleep(POLL_INTERVAL_S)
+        clock.sleep(POLL_INTERVAL_S)
 
     # Fallback : ajouter les non-confirmés depuis l'API
     missing = {n: s for n, s in all_sims.items()
                if n != col_num and n not in confirmed}
     if missing:
-        print(f'[DISCOVERY] Fallback API pour {len(missing)} SIM(s) : {list(missing.keys())}', flush=True)
+        log.warn("DISCOVERY", "fallback API", count=len(missing), sims=list(missing))
         confirmed.update(missing)
 
     # Inclure le collecteur lui-même
     confirmed[col_num] = all_sims[col_num]
     disc['confirmed_sims'] = confirmed
     disc['done'] = True
-    print(f'[DISCOVERY] Terminée. SIMs : {list(confirmed.keys())}', flush=True)
+    log.info("DISCOVERY", "terminée", sims=list(confirmed))
 
 def run_discovery_phase(state: Dict[str, Any]) -> Dict[str, str]:
     """Orchestre la phase de découverte complète."""
@@ -452,18 +468,20 @@ def get_sender_number(state: Dict[str, Any], sims_list: List[str]) -> str:
     idx = rr.get("sender_idx", 0) % len(sims_list)
     return sims_list[idx]
 
+_progress: Optional[RoundRobinProgress] = None
+
+def _rr_progress(state: Dict[str, Any]) -> RoundRobinProgress:
+    if _progress is not None and _progress.state is state:
+        return _progress
+    return RoundRobinProgress(state, "pairs", "known_sims", directed=True)   # état non suivi
+
+def sorted_sims(state: Dict[str, Any], sims_map: Dict[str, str]) -> List[str]:
+    """Liste triée des SIMs, en cache tant que sims_map n'est ni remplacé ni modifié."""
+    return _rr_progress(state).sims_list(sims_map)
+
 def all_pairs_done(state: Dict[str, Any], sender: str, sims_list: List[str]) -> bool:
     """Vérifie si toutes les paires de l'émetteur courant sont terminées."""
-    targets = [n for n in sims_list if n != sender]
-    if not targets:
-        return True
-    pairs = state.get("pairs", {})
-    for t in targets:
-        pk = pair_key(sender, t)
-        p  = pairs.get(pk, {})
-        if p.get("status") != "done":
-            return False
-    return True
+    return _rr_progress(state).sender_done(sender, sims_list)
 
 def advance_round_robin(state: Dict[str, Any], sims_list: List[str]) -> str:
     """Passe au prochain émetteur, retourne le nouveau numéro."""
@@ -472,13 +490,59 @@ def advance_round_robin(state: Dict[str, Any], sims_list: List[str]) -> str:
     if rr["sender_idx"] == 0:
         rr["cycle"] = rr.get("cycle", 0) + 1
         # Réinitialiser toutes les paires pour le nouveau cycle
-        print(f"[RR] Cycle {rr['cycle']} — réinitialisation des paires", flush=True)
+        log.info("RR", "nouveau cycle, réinitialisation des paires", cycle=rr["cycle"])
         state["pairs"] = {}
         state["reply_routing"] = {}
     new_sender = sims_list[rr["sender_idx"]]
-    print(f"[RR] Nouvel émetteur → {new_sender} (idx={rr['sender_idx']})", flush=True)
+    log.info("RR", "nouvel émetteur", sender=new_sender, idx=rr["sender_idx"])
     return new_sender
 
+def _current_sender(state: Dict[str, Any], sims_list: List[str]) -> str:
+    """Émetteur courant ; avance au suivant si toutes ses paires sont terminées."""
+    sender = get_sender_number(state, sims_list)
+    if all_pairs_done(state, sender, sims_list):
+        log.info("RR", "émetteur terminé", sender=sender)
+        sender = advance_round_robin(state, sims_list)
+    return sender
+
+def _pair_opened(state: Dict[str, Any], sender: str, target: str) -> None:
+    state.setdefault("pairs", {})[pair_key(sender, target)] = {
+        "sender":   sender,
+        "receiver": target,
+        "turn":     1,
+        "status":   "active",
+        "last_sent_at": clock.now(),
+    }
+    # Enregistrer le routage : quand target répond → répondre via sender
+    state.setdefault("reply_routing", {})[target] = sender
+
+def _active_pairs(state: Dict[str, Any]) -> int:
+    return _rr_progress(state).active
+
+_opening: Set[str] = set()   # paires dont le 1er envoi est en vol
+
+def _open_pair(state: Dict[str, Any], sender: str, spec: str, target: str) -> None:
+    """Soumet le 1er message ; la paire est créée par _pair_sent au drain."""
+    pk = pair_key(sender, target)
+    _opening.add(pk)
+    try:
+        sends.watch(send_sms(state, spec, target, pick_template(1)), _pair_sent, state, sender, target)
+    except Exception as e:
+        _opening.discard(pk)
+        log.error("SMS", "ouverture en erreur", sender=sender, to=target, err=str(e))
+
+def _pair_sent(fut: Future, state: Dict[str, Any], sender: str, target: str) -> dict:
+    pk = pair_key(sender, target)
+    try:
+        fut.result()
+        _pair_opened(state, sender, target)
+        return {"opened": True, "pk": pk}
+    except Exception as e:
+        log.error("SMS", "ouverture en erreur", sender=sender, to=target, err=str(e))
+        return {"error": str(e), "pk": pk}
+    finally:
+        _opening.discard(pk)
+
 def tick_round_robin(state: Dict[str, Any], sims_map: Dict[str, str]) -> dict:
     """
     Lance les envois pour l'émetteur courant vers tous les autres.
@@ -487,149 +551,248 @@ def tick_round_robin(state: Dict[str, Any], sims_map: Dict[str, str]) -> dict:
     if len(sims_map) < 2:
         return {"skipped": "not_enough_sims"}
 
-    sims_list = sorted(sims_map.keys())
-    sender    = get_sender_number(state, sims_list)
+    sims_list   = sorted_sims(state, sims_map)
+    sender      = _current_sender(state, sims_list)
     sender_spec = sims_map[sender]
-    pairs     = state.setdefault("pairs", {})
-    routing   = state.setdefault("reply_routing", {})
-
-    # Vérifier si l'émetteur courant a fini toutes ses paires
-    if all_pairs_done(state, sender, sims_list):
-        print(f"[RR] {sender} a terminé toutes ses paires.", flush=True)
-        sender = advance_round_robin(state, sims_list)
-        sender_spec = sims_map[sender]
+    pairs       = state.setdefault("pairs", {})
 
     targets  = [n for n in sims_list if n != sender]
-    sent     = 0
+    queued   = 0
     skipped  = 0
+    retried  = []   # réponses reportées parties pendant admit()
 
     for target in targets:
         pk = pair_key(sender, target)
         p  = pairs.get(pk)
 
-        if p is None:
-            # Nouvelle paire : envoi du 1er message
-            if not can_send(state, sender_spec):
+        if p is None and pk not in _opening:
+            # Nouvelle paire : 1er message dans la file du téléphone, appliqué au drain
+            ok, drained = admission.admit(state, PRIO_OPENER, sender_spec)
+            retried += drained
+            if not ok:
                 skipped += 1
                 continue
-            msg_text = pick_template(1)
-            try:
-                send_sms(state, sender_spec, target, msg_text)
-                pairs[pk] = {
-                    "sender":   sender,
-                    "receiver": target,
-                    "turn":     1,
-                    "status":   "active",
-                    "last_sent_at": time.time(),
-                }
-                # Enregistrer le routage : quand target répond → répondre via sender
-                routing[target] = sender
-                sent += 1
-                time.sleep(random.uniform(1.0, 3.0))
-            except Exception as e:
-                print(f"  [ERR] send {sender}→{target}: {e}", flush=True)
-                skipped += 1
+            _open_pair(state, sender, sender_spec, target)
+            queued += 1
 
-        elif p.get("status") == "done":
+        elif p is not None and p.get("status") == "done":
             skipped += 1  # déjà terminée
 
-        # status == "active" → en attente de réponse, ne rien faire
+        # status == "active" ou envoi en vol → en attente, ne rien faire
 
-    return {"sender": sender, "sent": sent, "skipped": skipped,
-            "targets": targets, "active_pairs": sum(
-                1 for p in pairs.values() if p.get("status") == "active")}
+    return {"sender": sender, "queued": queued, "opening": len(_opening), "skipped": skipped,
+            "targets": targets, "active_pairs": _active_pairs(state), "replies": retried}
 
-def process_inbound(state: Dict[str, Any], msg: dict) -> Optional[dict]:
+# =========================
+# Tournoi (RR_MODE=tournament)
+# =========================
+def _tournament_round(state: Dict[str, Any], sims_list: List[str]) -> Tuple[int, List[Tuple[str, str]]]:
     """
-    Traite un message reçu.
-    Matching simplifié : basé sur reply_routing[from_number] → pas besoin de deviceID/simSlot.
+    Paires (émetteur, destinataire) de la ronde courante ; passe à la ronde
+    suivante quand elles sont toutes terminées (nouveau cycle après la dernière).
+    """
+    rr       = state.setdefault("round_robin", {"sender_idx": 0, "cycle": 0})
+    n_rounds = round_count(len(sims_list))
+    r        = rr.get("round", 0) % n_rounds
+    pairs    = round_pairs(sims_list, r)
+    done     = state.get("pairs", {})
+    if all(done.get(pair_key(a, b), {}).get("status") == "done" for a, b in pairs):
+        r = rr["round"] = (r + 1) % n_rounds
+        if r == 0:
+            rr["cycle"] = rr.get("cycle", 0) + 1
+            log.info("RR", "nouveau cycle, réinitialisation des paires", cycle=rr["cycle"], mode="tournament")
+            state["pairs"] = {}
+            state["reply_routing"] = {}
+        pairs = round_pairs(sims_list, r)
+        log.info("RR", "ronde", round=r + 1, rounds=n_rounds, pairs=len(pairs))
+    return r, pairs
+
+def tick_tournament(state: Dict[str, Any], sims_map: Dict[str, str]) -> dict:
+    """Ouvre en parallèle toutes les paires de la ronde courante (un envoi par SIM)."""
+    if len(sims_map) < 2:
+        return {"skipped": "not_enough_sims"}
+
+    r, round_ = _tournament_round(state, sorted_sims(state, sims_map))
+    queued = skipped = 0
+    retried = []   # réponses reportées parties pendant admit()
+
+    # Tous les 1ers envois de la ronde partent ensemble dans les files par
+    # téléphone ; les résultats sont appliqués au drain, sans attendre ici.
+    for sender, target in round_:
+        pk = pair_key(sender, target)
+        p  = state.get("pairs", {}).get(pk)
+        if p is None and pk not in _opening:
+            ok, drained = admission.admit(state, PRIO_OPENER, sims_map[sender])
+            retried += drained
+            if not ok:
+                skipped += 1
+                continue
+            _open_pair(state, sender, sims_map[sender], target)
+            queued += 1
+        elif p is not None and p.get("status") == "done":
+            skipped += 1
+
+    return {"round": r, "pairs": len(round_), "queued": queued, "opening": len(_opening),
+            "skipped": skipped, "active_pairs": _active_pairs(state), "replies": retried}
+
+_replying: Dict[str, int] = {}   # pk -> tour de la réponse programmée, pas encore partie
+
+def _inbound_plan(state: Dict[str, Any], msg: dict,
+                  deduped: bool = False) -> Tuple[Optional[dict], Optional[dict]]:
+    """
+    Partie sans I/O de process_inbound() : dedupe, routing, paire.
+    Retourne (résultat, None) si rien à envoyer, sinon (None, plan).
+    deduped=True : l'id a déjà été enregistré par l'appelant (ingest async).
     """
     mid     = msg_id_from(msg)
     from_n  = (msg.get("number") or "").strip()
     content = (msg.get("message") or "").strip()
 
     if not mid or not from_n:
-        return None
+        return None, None
 
-    dedupe = state.setdefault("dedupe_msg_ids", {})
-    if mid in dedupe:
-        return {"ignored": "duplicate", "id": mid}
-    dedupe[mid] = time.time()
+    if not deduped and not DedupeStore(state.setdefault("dedupe_msg_ids", {})).add(mid):
+        metrics.DUPLICATES.inc()
+        return {"ignored": "duplicate", "id": mid}, None
+    metrics.INBOUND.inc()
 
     # Ignorer les SMS de découverte
     if DISCOVERY_TAG in content:
-        return {"ignored": "discovery_msg", "id": mid}
+        return {"ignored": "discovery_msg", "id": mid}, None
 
     sims_map = state.get("known_sims", {})
 
     # from_n doit être un de nos SIMs connus
     if from_n not in sims_map:
-        return {"ignored": "unknown_sender", "from": from_n, "id": mid}
+        return {"ignored": "unknown_sender", "from": from_n, "id": mid}, None
 
     # Trouver l'émetteur original via le routing
     routing    = state.get("reply_routing", {})
     sender_num = routing.get(from_n)  # numA (celui qui avait envoyé en premier)
 
     if not sender_num:
-        return {"ignored": "no_routing", "from": from_n, "id": mid}
+        return {"ignored": "no_routing", "from": from_n, "id": mid}, None
 
     sender_spec = sims_map.get(sender_num)
     if not sender_spec:
-        return {"ignored": "sender_spec_missing", "from": from_n, "id": mid}
+        return {"ignored": "sender_spec_missing", "from": from_n, "id": mid}, None
 
     # Trouver la paire
     pk   = pair_key(sender_num, from_n)
     pair = state.get("pairs", {}).get(pk)
 
     if not pair:
-        return {"ignored": "no_pair", "pk": pk, "id": mid}
+        return {"ignored": "no_pair", "pk": pk, "id": mid}, None
 
     if pair.get("status") == "done":
-        return {"ignored": "pair_done", "pk": pk, "id": mid}
+        return {"ignored": "pair_done", "pk": pk, "id": mid}, None
+
+    # Une réponse déjà programmée pour cette paire calculerait le même tour
+    if pk in _replying:
+        return {"ignored": "reply_pending", "pk": pk, "id": mid}, None
 
     turn = int(pair.get("turn", 1))
     if turn >= MAX_TURNS:
         pair["status"] = "done"
-        return {"done": True, "pk": pk, "turn": turn}
-
-    # Rate limit
-    if not can_send(state, sender_spec):
-        return {"skipped": "rate_limited", "pk": pk}
+        return {"done": True, "pk": pk, "turn": turn}, None
 
     next_turn = turn + 1
-    reply_txt = pick_template(next_turn)
+    _replying[pk] = next_turn
+    return None, {"pk": pk, "spec": sender_spec, "to": from_n,
+                  "turn": next_turn, "text": pick_template(next_turn), "id": mid}
+
+def _live_pair(state: Dict[str, Any], plan: dict) -> Optional[dict]:
+    """
+    Paire relue à l'échéance de la réponse : None si elle a disparu (fin de
+    cycle), est terminée ou a déjà avancé depuis le plan.
+    """
+    pair = state.get("pairs", {}).get(plan["pk"])
+    if not pair or pair.get("status") == "done":
+        return None
+    if int(pair.get("turn", 1)) != plan["turn"] - 1:
+        return None
+    return pair
+
+replies   = ReplyScheduler()
+admission = AdmissionQueue(can_send, time_until_allowed,
+                           lambda state: _limiter(state).global_wait(), replies.schedule)
 
-    time.sleep(random.randint(REPLY_DELAY_MIN_S, REPLY_DELAY_MAX_S))
+def _apply_inbound_reply(plan: dict) -> dict:
+    pair, pk, next_turn = plan["pair"], plan["pk"], plan["turn"]
+    pair["turn"]         = next_turn
+    pair["last_sent_at"] = clock.now()
+    if next_turn >= MAX_TURNS:
+        pair["status"] = "done"
+        log.info("DONE", "paire terminée", sample=True, pk=pk, turns=next_turn)
+    return {"replied": True, "pk": pk, "turn": next_turn, "id": plan["id"]}
+
+def process_inbound(state: Dict[str, Any], msg: dict) -> Optional[dict]:
+    """
+    Traite un message reçu.
+    Matching simplifié : basé sur reply_routing[from_number] → pas besoin de deviceID/simSlot.
+    La réponse est programmée dans `replies` (pas de sleep ici) et part
+    pendant l'attente de la boucle principale.
+    """
+    res, plan = _inbound_plan(state, msg)
+    if plan is None:
+        return res
+
+    delay = random.randint(REPLY_DELAY_MIN_S, REPLY_DELAY_MAX_S)
+    replies.schedule(delay, _submit_inbound_reply, plan)
+    return {"scheduled": True, "pk": plan["pk"], "turn": plan["turn"], "in": delay}
+
+def _submit_inbound_reply(state: Dict[str, Any], plan: dict) -> dict:
+    """
+    Échéance de `replies` : la réponse passe en priorité dans la file d'admission ;
+    si le débit est plein elle est reportée (pas perdue) jusqu'à ce qu'il se libère.
+    """
+    return admission.submit(state, PRIO_REPLY, plan["spec"], _send_inbound_reply, state, plan)
+
+def _send_inbound_reply(state: Dict[str, Any], plan: dict) -> dict:
+    """
+    Échéance de `replies` : la paire est relue (réinitialisée en fin de cycle ?),
+    puis la réponse part dans la file du téléphone ; _inbound_reply_sent l'applique au drain.
+    """
+    if _live_pair(state, plan) is None:
+        _replying.pop(plan["pk"], None)
+        return {"ignored": "pair_gone", "pk": plan["pk"], "id": plan["id"]}
+    try:
+        sends.watch(send_sms(state, plan["spec"], plan["to"], plan["text"]),
+                    _inbound_reply_sent, state, plan)
+    except Exception as e:
+        _replying.pop(plan["pk"], None)
+        return {"error": str(e), "pk": plan["pk"], "id": plan["id"]}
+    return {"sending": True, "pk": plan["pk"], "turn": plan["turn"], "id": plan["id"]}
+
+def _inbound_reply_sent(fut: Future, state: Dict[str, Any], plan: dict) -> dict:
     try:
-        send_sms(state, sender_spec, from_n, reply_txt)
-        pair["turn"]         = next_turn
-        pair["last_sent_at"] = time.time()
-        if next_turn >= MAX_TURNS:
-            pair["status"] = "done"
-            print(f"  [DONE] Paire {pk} terminée ({next_turn} tours)", flush=True)
-        return {"replied": True, "pk": pk, "turn": next_turn, "id": mid}
+        fut.result()
+        pair = _live_pair(state, plan)
+        if pair is None:
+            return {"ignored": "pair_gone", "pk": plan["pk"], "id": plan["id"]}
+        plan["pair"] = pair
+        return _apply_inbound_reply(plan)
     except Exception as e:
-        return {"error": str(e), "pk": pk, "id": mid}
+        return {"error": str(e), "pk": plan["pk"], "id": plan["id"]}
+    finally:
+        _replying.pop(plan["pk"], None)
 
 # =========================
 # MAIN
 # =========================
-def run():
+def _startup() -> Tuple[Dict[str, Any], Dict[str, str]]:
     if not API_KEY:
         raise SystemExit("Variable SMS_GATEWAY_API_KEY (ou RBSOFT_TOKEN) manquante.")
 
-    print("AutoChat ExaGate — Round-Robin Broadcast", flush=True)
-    print(f"BASE_URL = {BASE_URL}", flush=True)
+    log.info("INIT", "AutoChat ExaGate — Round-Robin Broadcast", base_url=BASE_URL)
 
     # Vérification de connectivité
     try:
-        r = requests.get(f"{BASE_URL}{EP_DEVICES}", headers=_headers(),
-                         params=_base_params(), timeout=10)
-        print(f"[INIT] /services/get-devices.php -> {r.status_code}", flush=True)
-        body_preview = r.text[:200].replace("\n", " ")
-        print(f"[INIT] Body: {body_preview!r}", flush=True)
+        r = client.request("GET", EP_DEVICES, timeout=10)
+        log.info("INIT", "connexion", endpoint=EP_DEVICES, status=r.status_code,
+                 body=r.text[:200].replace("\n", " "))
     except Exception as e:
-        print(f"[INIT] Erreur connexion : {e}", flush=True)
+        log.error("INIT", "erreur de connexion", err=str(e))
         raise SystemExit(1)
 
     # ── Chargement état ──────────────────────────────────────────────────────
@@ -638,94 +801,391 @@ def run():
 
     # RESET_STATE=1 : repart de zéro
     if os.getenv("RESET_STATE", "0") == "1":
-        print("[INIT] RESET_STATE=1 — nettoyage complet", flush=True)
+        log.info("INIT", "RESET_STATE=1 — nettoyage complet")
         state = _default_state()
 
     atomic_save(state)
 
     # ── PHASE 1 : DÉCOUVERTE ─────────────────────────────────────────────────
     if not state["discovery"]["done"]:
-        print("\n══ PHASE 1 : DÉCOUVERTE DES SIMs ══", flush=True)
+        log.info("PHASE", "1 : découverte des SIMs")
         with _lock:
             state = load_state()
         try:
             confirmed_sims = run_discovery_phase(state)
         except Exception as e:
-            print(f"[DISCOVERY] Échec : {e}", flush=True)
+            log.error("DISCOVERY", "échec", err=str(e))
             raise SystemExit(1)
         with _lock:
             state = load_state()
         state["known_sims"] = confirmed_sims
         atomic_save(state)
-        print(f"\n✅ {len(confirmed_sims)} SIMs confirmés :", flush=True)
-        for num, spec in confirmed_sims.items():
-            print(f"   {num} -> {spec}", flush=True)
+        log.info("DISCOVERY", "SIMs confirmés", count=len(confirmed_sims), sims=dict(confirmed_sims))
     else:
         confirmed_sims = {k: v for k, v in state["discovery"]["confirmed_sims"].items()}
-        print("[DISCOVERY] Déjà effectuée.", flush=True)
-        for num, spec in confirmed_sims.items():
-            print(f"   {num} -> {spec}", flush=True)
+        log.info("DISCOVERY", "déjà effectuée", count=len(confirmed_sims), sims=dict(confirmed_sims))
 
     if len(confirmed_sims) < 2:
         raise SystemExit(f"Seulement {len(confirmed_sims)} SIM(s) — minimum 2 requis.")
 
-    print("\nDémarrage dans 3s…", flush=True)
-    time.sleep(3)
+    log.info("INIT", "démarrage dans 3s", rr_mode=RR_MODE)
+    clock.sleep(3)
 
     # ── PHASE 2 : ROUND-ROBIN BROADCAST ──────────────────────────────────────
-    print("\n══ PHASE 2 : ROUND-ROBIN BROADCAST ══\n", flush=True)
+    log.info("PHASE", "2 : round-robin broadcast")
+    return state, confirmed_sims
+
+def _apply_sims(state: Dict[str, Any], sims_map: Dict[str, str], now: float) -> Dict[str, str]:
+    """
+    N'écrit known_sims / meta que si la liste change (pas d'écriture à vide).
+    Retourne known_sims : le même dict tant que la liste ne change pas, ce qui
+    garde le cache de sorted_sims() et les compteurs de RoundRobinProgress.
+    """
+    if state.get("known_sims") != sims_map:
+        state["known_sims"] = sims_map
+        state.setdefault("meta", {})["last_sim_refresh"] = now
+    return state["known_sims"]
+
+def _refresh_sims(state: Dict[str, Any], confirmed_sims: Dict[str, str], now: float) -> Dict[str, str]:
+    fresh    = fetch_sims(state)
+    sims_map = _apply_sims(state, {n: s for n, s in fresh.items() if n in confirmed_sims}, now)
+    log.info("SIMS", "actifs", count=len(sims_map), sims=sorted(sims_map))
+    log.info("HTTP", "latences", latency=client.latency_stats(), send=dispatcher.gauges())
+    return sims_map
+
+def export_metrics(state: Dict[str, Any], sims_map: Dict[str, str]) -> None:
+    """Jauges de /metrics, posées depuis la boucle (l'état n'est pas lu par le thread HTTP)."""
+    rr = state.get("round_robin", {})
+    metrics.ACTIVE_CONVS.set(_active_pairs(state))
+    metrics.RR_POSITION.set(rr.get("round" if RR_MODE == "tournament" else "sender_idx", 0))
+    metrics.PENDING_REPLIES.set(len(replies), queue="scheduled")
+    metrics.PENDING_REPLIES.set(len(admission), queue="deferred")
+    metrics.PENDING_REPLIES.set(max(0, len(_tasks) - len(_opening)), queue="async")
+    metrics.PENDING_REPLIES.set(len(sends), queue="sending")
+    metrics.SIMS.set(len(sims_map))
+    metrics.set_send_queue(dispatcher.gauges())
+    metrics.POLL_INTERVAL.set(poller.interval)
+
+# Temps par phase (refresh / inbound / tick / save / wait) + cProfile / tracemalloc sur signal
+profiler = LoopProfiler()
+# Intervalle de get-messages selon le trafic attendu (POLL_ADAPTIVE=1)
+poller   = AdaptivePoller(POLL_INTERVAL_S)
+# Messages poussés par le gateway (WEBHOOK_PORT) ; le poll devient un rattrapage
+inbox    = WebhookInbox()
+
+def _pending_replies() -> int:
+    # programmées, reportées, en vol (sync) ou en tâche (async) : toutes dans _replying
+    return len(_replying)
+
+def drain_sends() -> list:
+    """ENGINE=sync : applique les envois terminés (paires, routage, log) ; thread de la boucle."""
+    done = sends.drain()
+    if done:
+        log.results("SEND", done)
+        poller.snap()
+    return done
+
+def _record_poll(state: Dict[str, Any], new: int) -> None:
+    before = poller.interval
+    poller.record(new, _active_pairs(state), _pending_replies())
+    if poller.enabled and poller.interval != before:
+        log.debug("POLL", "intervalle", interval_s=poller.interval, new=new)
+
+def _start_push() -> None:
+    if inbox.start():
+        poller.enabled = False       # intervalle fixe : seul le balayage WEBHOOK_SWEEP_S interroge
+
+def _poll_due() -> bool:
+    return inbox.sweep_due() if inbox.running else poller.due()
+
+def _ingest(state: Dict[str, Any], msgs: List[dict], cursor: Optional[MessageCursor] = None,
+            tag: str = "INBOUND") -> int:
+    """Traite une page de get-messages ou un lot poussé ; retourne le nombre de nouveaux."""
+    updates = []
+    for m in msgs:
+        out = process_inbound(state, m)
+        if cursor:
+            cursor.advance(m)
+        if out:
+            updates.append(out)
+    if updates:
+        log.results(tag, updates)
+    return sum(1 for u in updates if u.get("ignored") != "duplicate")
+
+def run_once(state: Dict[str, Any], confirmed_sims: Dict[str, str], timers: Dict[str, float]) -> bool:
+    """
+    Une itération de la boucle principale (refresh SIMs, poll, tick), sans
+    l'attente finale. timers = {"refresh": ts}, mis à jour ici.
+    Retourne False si aucun SIM actif (déjà attendu : pas de replies.sleep).
+    """
+    try:
+        now = clock.now()
+
+        # Rafraîchissement périodique des SIMs
+        # (l'état reste en mémoire : plus de load_state() à chaque itération)
+        if (now - timers.get("refresh", 0.0)) >= SIM_REFRESH_INTERVAL_S:
+            sims_map = _refresh_sims(state, confirmed_sims, now)
+            timers["refresh"] = now
+        else:
+            sims_map = state.get("known_sims", {}) or confirmed_sims
+        profiler.mark("refresh")
+
+        if not sims_map:
+            log.warn("SIMS", "aucun SIM actif, attente")
+            clock.sleep(POLL_INTERVAL_S * 2)
+            return False
+
+        # ── Traitement des messages entrants ──────────────────────────
+        drain_sends()                  # paires et routage à jour avant les réponses reçues
+        pushed = inbox.drain()
+        if pushed:
+            try:
+                _ingest(state, pushed, tag="PUSH")
+            except Exception as e:
+                log.error("PUSH", "lot poussé en erreur", err=str(e), exc_info=True)
+        if _poll_due():
+            new = 0
+            try:
+                msgs, cursor = poll_inbound(state)
+                new = _ingest(state, msgs, cursor)
+            except Exception as e:
+                log.error("IN", "inbound en erreur", err=str(e), exc_info=True)
+            finally:
+                _record_poll(state, new)
+        profiler.mark("inbound")
+
+        # ── Tick round-robin (lancer les envois initiaux) ─────────────
+        tick_fn   = tick_tournament if RR_MODE == "tournament" else tick_round_robin
+        rr_result = tick_fn(state, sims_map)
+        retried   = rr_result.pop("replies", [])
+        if retried:
+            log.results("REPLY", retried)
+        if rr_result.get("queued", 0) > 0 or retried:
+            poller.snap()
+        if rr_result.get("queued", 0) > 0 or rr_result.get("active_pairs", 0) > 0:
+            log.info("RR", "tick", **{**rr_result, "targets": len(rr_result.get("targets", ()))})
+        profiler.mark("tick")
+
+        flush_state()
+        export_metrics(state, sims_map)
+        profiler.mark("save")
+
+    except Exception as e:
+        log.error("LOOP", "itération en erreur", err=repr(e), exc_info=True)
+    return True
+
+def wait_next_poll(state: Dict[str, Any]) -> list:
+    """
+    Attente du prochain poll (POLL_INTERVAL_S, moins si le poller l'attend plus
+    tôt) : les réponses programmées partent pendant ce temps, un push l'écourte.
+    """
+    done = replies.sleep(poller.wait_s(), state, wake=inbox.wait if inbox.running else None)
+    if done:
+        log.results("REPLY", done)
+        poller.snap()
+    return done + drain_sends()
 
-    last_sim_refresh = 0.0
-    rr_tick_interval = int(os.getenv("RR_TICK_INTERVAL_S", "15"))  # fréquence des envois initiaux
+def run():
+    state, confirmed_sims = _startup()
+    state  = track_state(state)
+    timers = {"refresh": 0.0}
+    metrics.serve()
+    _start_push()
+    profiler.install_signals()
 
     while True:
-        try:
-            now = time.time()
-
-            # Rafraîchissement périodique des SIMs
-            if (now - last_sim_refresh) >= SIM_REFRESH_INTERVAL_S:
-                with _lock:
-                    state = load_state()
-                fresh    = fetch_sims(state)
-                sims_map = {n: s for n, s in fresh.items() if n in confirmed_sims}
-                state["known_sims"] = sims_map
-                state.setdefault("meta", {})["last_sim_refresh"] = now
-                atomic_save(state)
-                last_sim_refresh = now
-                print(f"[SIMS] {len(sims_map)} actifs: {sorted(sims_map.keys())}", flush=True)
-            else:
-                with _lock:
-                    state = load_state()
-                sims_map = state.get("known_sims", {}) or confirmed_sims
+        profiler.begin()
+        if run_once(state, confirmed_sims, timers):
+            try:
+                wait_next_poll(state)
+            except Exception as e:
+                log.error("LOOP", "attente en erreur", err=repr(e), exc_info=True)
+        profiler.mark("wait")
+        profiler.end()
 
-            if not sims_map:
-                print("[WARN] Aucun SIM actif, attente...", flush=True)
-                time.sleep(POLL_INTERVAL_S * 2)
-                continue
+# =========================
+# ASYNC
+# =========================
+# Même logique que run(), mais envois / poll / refresh sont des coroutines.
+# Toutes les mutations de l'état se font dans la boucle asyncio ; seuls les appels HTTP partent
+# sur le pool de threads. Les limites de can_send passent par AsyncSendLimiter.
+_tasks:   Set[asyncio.Task] = set()
+
+async def _open_pair_async(state: Dict[str, Any], limiter: AsyncSendLimiter,
+                           sender: str, spec: str, target: str) -> None:
+    pk = pair_key(sender, target)
+    try:
+        async with limiter.slot(spec, PRIO_OPENER):
+            await send_sms_async(spec, target, pick_template(1))
+        _pair_opened(state, sender, target)
+    except Exception as e:
+        log.error("SMS", "ouverture en erreur", sender=sender, to=target, err=str(e))
+    finally:
+        _opening.discard(pk)
 
-            # ── Traitement des messages entrants ──────────────────────────
-            msgs = fetch_received_messages(state)
-            msgs_sorted = sorted(msgs, key=lambda x: int(x.get("id") or x.get("ID") or 0))
-            updates = []
-            for m in msgs_sorted:
-                out = process_inbound(state, m)
-                if out:
-                    updates.append(out)
-            if updates:
-                print(f"[INBOUND] {updates}", flush=True)
-
-            # ── Tick round-robin (lancer les envois initiaux) ─────────────
-            rr_result = tick_round_robin(state, sims_map)
-            if rr_result.get("sent", 0) > 0 or rr_result.get("active_pairs", 0) > 0:
-                print(f"[RR] {rr_result}", flush=True)
+async def tick_round_robin_async(state: Dict[str, Any], sims_map: Dict[str, str],
+                                 limiter: AsyncSendLimiter) -> dict:
+    if len(sims_map) < 2:
+        return {"skipped": "not_enough_sims"}
 
-            atomic_save(state)
+    sims_list   = sorted_sims(state, sims_map)
+    sender      = _current_sender(state, sims_list)
+    sender_spec = sims_map[sender]
+    pairs       = state.setdefault("pairs", {})
+    queued = skipped = 0
 
-        except Exception as e:
-            print(f"Error: {repr(e)}", flush=True)
+    for target in sims_list:
+        if target == sender:
+            continue
+        pk = pair_key(sender, target)
+        p  = pairs.get(pk)
+        if p is None and pk not in _opening:
+            _opening.add(pk)
+            spawn(_tasks, _open_pair_async(state, limiter, sender, sender_spec, target))
+            queued += 1
+        elif p is not None and p.get("status") == "done":
+            skipped += 1
+
+    return {"sender": sender, "queued": queued, "opening": len(_opening),
+            "skipped": skipped, "active_pairs": _active_pairs(state)}
+
+async def tick_tournament_async(state: Dict[str, Any], sims_map: Dict[str, str],
+                                limiter: AsyncSendLimiter) -> dict:
+    if len(sims_map) < 2:
+        return {"skipped": "not_enough_sims"}
+
+    r, round_ = _tournament_round(state, sorted_sims(state, sims_map))
+    queued = skipped = 0
 
-        time.sleep(POLL_INTERVAL_S)
+    for sender, target in round_:
+        pk = pair_key(sender, target)
+        p  = state.get("pairs", {}).get(pk)
+        if p is None and pk not in _opening:
+            _opening.add(pk)
+            spawn(_tasks, _open_pair_async(state, limiter, sender, sims_map[sender], target))
+            queued += 1
+        elif p is not None and p.get("status") == "done":
+            skipped += 1
+
+    return {"round": r, "pairs": len(round_), "queued": queued, "opening": len(_opening),
+            "skipped": skipped, "active_pairs": _active_pairs(state)}
+
+async def process_inbound_async(state: Dict[str, Any], msg: dict, limiter: AsyncSendLimiter,
+                                deduped: bool = False) -> Optional[dict]:
+    res, plan = _inbound_plan(state, msg, deduped)
+    if plan is None:
+        return res
+    try:
+        await asyncio.sleep(random.randint(REPLY_DELAY_MIN_S, REPLY_DELAY_MAX_S))
+        async with limiter.slot(plan["spec"], PRIO_REPLY):
+            plan["pair"] = _live_pair(state, plan)
+            if plan["pair"] is None:
+                return {"ignored": "pair_gone", "pk": plan["pk"], "id": plan["id"]}
+            await send_sms_async(plan["spec"], plan["to"], plan["text"])
+        return _apply_inbound_reply(plan)
+    except Exception as e:
+        return {"error": str(e), "pk": plan["pk"], "id": plan["id"]}
+    finally:
+        _replying.pop(plan["pk"], None)
+
+async def _reply_and_log(state: Dict[str, Any], msg: dict, limiter: AsyncSendLimiter) -> None:
+    # id déjà enregistré dans la dédupe par ingest(), avant spawn()
+    out = await process_inbound_async(state, msg, limiter, deduped=True)
+    if out:
+        log.info("INBOUND", "résultat", sample=True, **out)
+        if out.get("replied"):
+            poller.snap()
+
+async def _main_async(state: Dict[str, Any], confirmed_sims: Dict[str, str]) -> None:
+    install_executor()
+    limiter = AsyncSendLimiter(lambda spec: can_send(state, spec),
+                               wait_hint=lambda spec: time_until_allowed(state, spec),
+                               global_wait=lambda: _limiter(state).global_wait())
+
+    def sims_map() -> Dict[str, str]:
+        return state.get("known_sims", {}) or confirmed_sims
+
+    async def refresh():
+        with profiler.phase("refresh"):
+            fresh = await to_thread(fetch_sims, state)
+            sims  = {n: s for n, s in fresh.items() if n in confirmed_sims}
+            _apply_sims(state, sims, clock.now())
+            log.info("SIMS", "actifs", count=len(sims), sims=sorted(sims))
+            log.info("HTTP", "latences", latency=client.latency_stats(), send=dispatcher.gauges())
+
+    def ingest(msgs: List[dict], cursor: Optional[MessageCursor] = None) -> int:
+        dedupe = DedupeStore(state.setdefault("dedupe_msg_ids", {}))
+        new    = 0
+        for m in msgs:
+            # Enregistré avant spawn() : un poll / push qui repasse le même
+            # message avant que la tâche ne tourne ne la duplique pas
+            if dedupe.add(msg_id_from(m)):
+                new += 1
+                spawn(_tasks, _reply_and_log(state, m, limiter))
+            else:
+                metrics.DUPLICATES.inc()
+            if cursor:
+                cursor.advance(m)
+        return new
+
+    async def inbound():
+        if not sims_map() or not _poll_due():
+            return
+        profiler.begin()
+        new = 0
+        try:
+            with profiler.phase("inbound"):
+                msgs, cursor = await to_thread(poll_inbound, state)
+                new = ingest(msgs, cursor)
+        finally:
+            _record_poll(state, new)
+        profiler.end()
+
+    async def push():
+        # Réveillé par le thread HTTP du webhook (call_soon_threadsafe)
+        woken = asyncio.Event()
+        loop  = asyncio.get_running_loop()
+        inbox.on_push = lambda: loop.call_soon_threadsafe(woken.set)
+        while True:
+            pushed = inbox.drain()
+            if pushed:
+                try:
+                    with profiler.phase("push"):
+                        ingest(pushed)
+                except Exception as e:
+                    log.error("PUSH", "lot poussé en erreur", err=repr(e), exc_info=True)
+            await woken.wait()
+            woken.clear()
+
+    async def tick():
+        tick_fn = tick_tournament_async if RR_MODE == "tournament" else tick_round_robin_async
+        with profiler.phase("tick"):
+            rr = await tick_fn(state, sims_map(), limiter)
+        if rr.get("queued", 0) > 0:
+            poller.snap()
+        if rr.get("queued", 0) > 0 or rr.get("active_pairs", 0) > 0:
+            log.info("RR", "tick", **rr, inflight=limiter.in_flight, waiting=limiter.waiting)
+
+    async def save():
+        with profiler.phase("save"):
+            flush_state()
+            export_metrics(state, sims_map())
+
+    await asyncio.gather(
+        *([push()] if inbox.running else []),
+        every(SIM_REFRESH_INTERVAL_S, refresh, "refresh"),
+        every(poller.wake_s,          inbound, "inbound"),
+        every(RR_TICK_INTERVAL_S,     tick,    "tick"),
+        every(POLL_INTERVAL_S,        save,    "save"),
+    )
+
+def run_async():
+    state, confirmed_sims = _startup()
+    metrics.serve()
+    _start_push()
+    profiler.install_signals()
+    asyncio.run(_main_async(track_state(state), confirmed_sims))
 
 
 if __name__ == "__main__":
-    run()
+    run_async() if os.getenv("ENGINE", "sync") == "async" else run()
@@ -0,0 +1,85 @@
+"""
+Planificateur de réponses (min-heap)
+====================================
+Au lieu de time.sleep(délai) avant chaque réponse, process() programme
+l'envoi à now + délai ; la boucle principale draine les échéances pendant
+son attente entre deux polls. Les délais se chevauchent : un lot de N
+réponses prend ~max(délai) et non sum(délai).
+"""
+import heapq
+import itertools
+from typing import Any, Callable, List, Optional
+
+import clock
+from jsonlog import log
+
+
+class ReplyScheduler:
+
+    def __init__(self, now: Callable[[], float] = clock.monotonic,
+                 sleep: Callable[[float], None] = clock.sleep):
+        self._now   = now
+        self._sleep = sleep
+        self._heap: List[tuple] = []     # (due, seq, fn, args)
+        self._seq   = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def clear(self) -> None:
+        """Abandonne toutes les échéances (bancs d'essai, tests)."""
+        self._heap.clear()
+
+    def schedule(self, delay_s: float, fn: Callable, *args) -> float:
+        """Programme fn(*lead, *args) dans delay_s secondes (lead = args de run_due)."""
+        due = self._now() + max(0.0, delay_s)
+        heapq.heappush(self._heap, (due, next(self._seq), fn, args))
+        return due
+
+    def time_until_next(self) -> Optional[float]:
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - self._now())
+
+    def run_due(self, *lead) -> List[Any]:
+        """
+        Exécute toutes les échéances passées ; retourne leurs résultats non-None
+        (listes aplaties). Une échéance en erreur est journalisée et n'arrête
+        pas les suivantes.
+        """
+        out = []
+        while self._heap and self._heap[0][0] <= self._now():
+            _, _, fn, args = heapq.heappop(self._heap)
+            try:
+                r = fn(*lead, *args)
+            except Exception as e:
+                log.error("REPLY", "échéance en erreur", fn=getattr(fn, "__name__", repr(fn)),
+                          err=repr(e), exc_info=True)
+                continue
+            if isinstance(r, list):
+                out.extend(r)
+            elif r is not None:
+                out.append(r)
+        return out
+
+    def sleep(self, seconds: float, *lead,
+              wake: Optional[Callable[[float], bool]] = None) -> List[Any]:
+        """
+        Attend `seconds` en exécutant les échéances qui tombent pendant l'attente.
+        wake(t) remplace sleep(t) et écourte l'attente s'il retourne True
+        (messages poussés sur le webhook).
+        """
+        deadline = self._now() + seconds
+        out = self.run_due(*lead)
+        while True:
+            left = deadline - self._now()
+            if left <= 0:
+                return out
+            nxt  = self.time_until_next()
+            step = left if nxt is None else min(left, nxt)
+            if wake is None:
+                self._sleep(step)
+            elif wake(step):
+                out.extend(self.run_due(*lead))
+                return out
+            out.extend(self.run_due(*lead))
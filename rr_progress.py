@@ -0,0 +1,94 @@
+"""
+Avancement du round-robin (compteurs incrémentaux)
+==================================================
+Évite, à chaque tick, de re-trier les SIMs et de relire toutes les convs :
+  - sims_list(sims) : liste triée mise en cache, recalculée seulement si le
+                      dict de SIMs a été remplacé ou modifié
+  - sender_done(n) : O(1) — nb de convs "done" de n == nb de cibles
+  - active          : O(1) — nb de convs "active"
+
+Les compteurs suivent les mutations de l'état via le listener du Tracker
+(on_change). Clés de conv "a|b" : `directed` = seul a en est propriétaire
+(paires émetteur|destinataire), sinon a et b (clé symétrique).
+"""
+from collections.abc import Mapping
+from typing import Dict, List, Optional
+
+
+class RoundRobinProgress:
+
+    def __init__(self, state: Dict, convs: str, sims: str, directed: bool = False):
+        self.state      = state
+        self._convs_key = convs
+        self._sims_key  = sims
+        self._directed  = directed
+        self._src: Optional[Dict] = None     # dict de SIMs ayant servi au cache
+        self._list: List[str] = []
+        self._set   = frozenset()
+        self._recount()
+
+    # ── SIMs ────────────────────────────────────────────────────────────────
+    def sims_list(self, sims: Dict[str, str]) -> List[str]:
+        if sims is not self._src:
+            self._use(sorted(sims))
+            self._src = sims
+        return self._list
+
+    def _use(self, sims_list: List[str]) -> None:
+        self._src  = None
+        self._list = sims_list
+        self._set  = frozenset(sims_list)
+        self._recount()
+
+    # ── Compteurs ───────────────────────────────────────────────────────────
+    def _recount(self) -> None:
+        self.status_of: Dict[str, str] = {}
+        self.done_of:   Dict[str, int] = {}
+        self.active = 0
+        for k, conv in self.state.get(self._convs_key, {}).items():
+            self._update(k, conv)
+
+    def _owners(self, key: str):
+        parts = key.split("|", 1)
+        if len(parts) != 2 or not (parts[0] in self._set and parts[1] in self._set):
+            return ()
+        return parts[:1] if self._directed else parts
+
+    def _update(self, key: str, conv) -> None:
+        old = self.status_of.pop(key, None)
+        new = conv.get("status") if isinstance(conv, Mapping) else None
+        if old == new:
+            if new is not None:
+                self.status_of[key] = new
+            return
+        if old == "active":
+            self.active -= 1
+        elif old == "done":
+            for n in self._owners(key):
+                self.done_of[n] -= 1
+        if new is None:
+            return
+        self.status_of[key] = new
+        if new == "active":
+            self.active += 1
+        elif new == "done":
+            for n in self._owners(key):
+                self.done_of[n] = self.done_of.get(n, 0) + 1
+
+    def sender_done(self, sender: str, sims_list: List[str]) -> bool:
+        """Toutes les convs de sender vers les autres SIMs sont terminées (O(1) si liste en cache)."""
+        if sims_list is not self._list:
+            self._use(sims_list)
+        return self.done_of.get(sender, 0) >= len(sims_list) - 1
+
+    # ── Listener du Tracker ─────────────────────────────────────────────────
+    def on_change(self, path: tuple, op: str, value) -> None:
+        if not path or path[0] == self._sims_key:
+            self._src = None                 # liste re-triée au prochain sims_list()
+            if not path:
+                self._recount()
+        elif path[0] == self._convs_key:
+            if len(path) == 1:
+                self._recount()
+            elif len(path) == 2 or path[2] == "status":
+                self._update(path[1], self.state.get(self._convs_key, {}).get(path[1]))
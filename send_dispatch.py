@@ -0,0 +1,177 @@
+"""
+Files d'envoi par téléphone + pool de workers
+=============================================
+Un téléphone Android lent ou hors ligne (devices=ID|SLOT) ne bloque plus
+les envois destinés aux autres : chaque appareil a sa file FIFO (les deux
+slots SIM d'un même téléphone la partagent), et un pool borné de workers
+sert les appareils prêts à tour de rôle. Un appareil n'a jamais plus d'un
+envoi en vol ; le débit total croît avec le nombre de téléphones.
+
+Jauges : gauges() → {"queued", "in_flight", "devices_busy", "per_device"}.
+
+ENGINE=sync : la boucle n'attend plus le Future d'un envoi. SendCompletions
+range chaque Future terminé ; la boucle applique les résultats à l'état
+(drain()) depuis son propre thread, avant le poll et après l'attente.
+"""
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Set, Tuple
+
+from jsonlog import log
+
+SEND_WORKERS = int(os.getenv('SEND_WORKERS', '8'))
+
+
+def device_of(spec: str) -> str:
+    """'12|0' → '12' : les slots d'un même téléphone partagent la file."""
+    return str(spec).split("|", 1)[0]
+
+
+class DeviceDispatcher:
+
+    def __init__(self, workers: int = SEND_WORKERS):
+        self.workers = max(1, workers)
+        self._queues: Dict[str, Deque[Tuple[Future, Callable, tuple]]] = {}
+        self._ready: Deque[str] = deque()    # appareils avec envoi en attente et libres
+        self._busy:  Set[str] = set()
+        self._cond   = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+        self.sent = self.failed = 0
+
+    def submit(self, spec: str, fn: Callable, *args) -> Future:
+        """Met fn(*args) dans la file de l'appareil de spec ; retourne un Future."""
+        fut: Future = Future()
+        dev = device_of(spec)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("dispatcher ferme")
+            q = self._queues.setdefault(dev, deque())
+            q.append((fut, fn, args))
+            if len(q) == 1 and dev not in self._busy:
+                self._ready.append(dev)
+            self._start_workers()
+            self._cond.notify()
+        return fut
+
+    def _start_workers(self) -> None:
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._work, name=f"send-{len(self._threads)}", daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while not self._ready and not self._closed:
+                    self._cond.wait()
+                if not self._ready:
+                    return
+                dev = self._ready.popleft()
+                fut, fn, args = self._queues[dev].popleft()
+                self._busy.add(dev)
+            try:
+                if fut.set_running_or_notify_cancel():
+                    try:
+                        fut.set_result(fn(*args))
+                        ok = True
+                    except BaseException as e:
+                        fut.set_exception(e)
+                        ok = False
+                    with self._cond:
+                        self.sent   += ok
+                        self.failed += not ok
+            finally:
+                with self._cond:
+                    self._busy.discard(dev)
+                    if self._queues[dev]:
+                        self._ready.append(dev)
+                        self._cond.notify()
+                    else:
+                        del self._queues[dev]
+
+    def gauges(self) -> Dict[str, Any]:
+        with self._cond:
+            per = {d: len(q) for d, q in self._queues.items() if q}
+            return {"queued": sum(per.values()), "in_flight": len(self._busy),
+                    "devices_busy": sorted(self._busy), "per_device": per,
+                    "sent": self.sent, "failed": self.failed}
+
+    def close(self) -> None:
+        """Laisse les workers finir les files puis s'arrêter."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join()
+
+
+class InlineDispatcher:
+    """
+    Même interface que DeviceDispatcher, mais fn(*args) s'exécute tout de
+    suite dans le thread appelant : déterministe et mono-thread, pour la
+    simulation sur horloge virtuelle (simulate.py).
+    """
+
+    def __init__(self):
+        self.sent = self.failed = 0
+
+    def submit(self, spec: str, fn: Callable, *args) -> Future:
+        fut: Future = Future()
+        try:
+            fut.set_result(fn(*args))
+            self.sent += 1
+        except BaseException as e:
+            fut.set_exception(e)
+            self.failed += 1
+        return fut
+
+    def gauges(self) -> Dict[str, Any]:
+        return {"queued": 0, "in_flight": 0, "devices_busy": [], "per_device": {},
+                "sent": self.sent, "failed": self.failed}
+
+    def close(self) -> None:
+        pass
+
+
+class SendCompletions:
+    """
+    watch(fut, fn, *args) : quand fut se termine (thread du dispatcher), fn est
+    mis en file ; drain() appelle fn(fut, *args) sur le thread de la boucle,
+    seul à modifier l'état. Un résultat en erreur est journalisé, pas propagé.
+    """
+
+    def __init__(self):
+        self._done: Deque[Tuple[Callable, Future, tuple]] = deque()   # append / popleft atomiques
+        self.watched = 0                     # surveillés, pas encore appliqués (thread de la boucle)
+
+    def __len__(self) -> int:
+        return self.watched
+
+    def watch(self, fut: Future, fn: Callable, *args) -> Future:
+        self.watched += 1
+        fut.add_done_callback(lambda f: self._finished(fn, f, args))
+        return fut
+
+    def _finished(self, fn: Callable, fut: Future, args: tuple) -> None:
+        self._done.append((fn, fut, args))
+
+    def drain(self) -> List[Any]:
+        """Applique les envois terminés ; retourne leurs résultats non-None (listes aplaties)."""
+        out: List[Any] = []
+        while self._done:
+            fn, fut, args = self._done.popleft()
+            self.watched -= 1
+            try:
+                r = fn(fut, *args)
+            except Exception as e:
+                log.error("SEND", "resultat d'envoi en erreur", fn=getattr(fn, "__name__", repr(fn)),
+                          err=repr(e), exc_info=True)
+                continue
+            if isinstance(r, list):
+                out.extend(r)
+            elif r is not None:
+                out.append(r)
+        return out
@@ -0,0 +1,156 @@
+"""
+Simulation à événements discrets sur horloge virtuelle
+======================================================
+Exécute la vraie boucle d'un worker (run_once : poll, process, rr_tick,
+replies.sleep) contre un FakeGateway en mémoire, sur une VirtualClock :
+chaque sleep (POLL_INTERVAL_S, pauses entre ouvertures, délais de réponse,
+latence simulée du gateway) fait sauter le temps au lieu d'attendre. Un
+cycle round-robin de plusieurs heures se simule en quelques secondes.
+
+  python simulate.py
+  SIM_SIMS=50 MAX_TURNS=10 PER_SIM_SEND_PER_MIN=20 python simulate.py
+  SIM_WORKER=rbsoft SIM_SIMS=20 RR_MODE=tournament python simulate.py
+
+rbsoft ne répond qu'aux réponses des SIMs qu'il a sollicitées : le faux
+gateway est alors lancé avec une réponse automatique (FAKE_AUTO_REPLY, "OK"
+par défaut) qui tient le rôle du destinataire.
+
+Sortie (une ligne JSON, ajoutée aussi à SIM_OUT si défini) : durée virtuelle
+du 1er cycle complet (toutes les paires à MAX_TURNS messages), pic d'envois
+sur 60 s glissantes, débit moyen, latence livraison→réponse, accélération
+par rapport au temps réel. Les variables du worker (MAX_TURNS, limites,
+POLL_INTERVAL_S, RR_TICK_S, REPLY_DELAY_*) et du gateway (FAKE_LATENCY_MS,
+FAKE_DELIVERY_DELAY_S, FAKE_ERROR_RATE) s'appliquent telles quelles.
+Moteur synchrone uniquement (ENGINE=async n'est pas simulé).
+
+Sans nouvel envoi ni paire terminée pendant SIM_STALL_H heures virtuelles,
+la simulation s'arrête avec "error": "no_progress" (code de sortie 1) au
+lieu de tourner jusqu'à SIM_HORIZON_H.
+"""
+import atexit
+import contextlib
+import importlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import clock
+
+_TMP = tempfile.mkdtemp(prefix="simulate_")
+atexit.register(shutil.rmtree, _TMP, True)   # enregistré avant le worker : exécuté après son flush
+os.environ.setdefault("STATE_FILE", os.path.join(_TMP, "state.json"))
+os.environ.setdefault("SMS_GATEWAY_API_KEY", "sim")
+# Poll incrémental : sans curseur chaque poll relit toute la boîte (coût réel, mais
+# qui domine le temps de simulation sans changer les délais simulés)
+os.environ.setdefault("POLL_CURSOR", "1")
+os.environ.setdefault("MSG_CURSOR_PARAM", "last_id")
+
+from bench_e2e import RunRecorder, percentiles
+from fake_gateway import FakeGateway, LocalClient
+from jsonlog import log
+from send_dispatch import InlineDispatcher
+
+SIM_WORKER    = os.getenv('SIM_WORKER', 'exagate')              # exagate | rbsoft
+SIM_SIMS      = int(os.getenv('SIM_SIMS', '50'))
+SIM_SLOTS     = int(os.getenv('SIM_SLOTS', '1'))
+SIM_HORIZON_H = float(os.getenv('SIM_HORIZON_H', '168'))        # arrêt si pas de cycle complet avant
+SIM_STALL_H   = float(os.getenv('SIM_STALL_H', '2'))            # arrêt en erreur si rien n'avance
+SIM_SEED      = os.getenv('SIM_SEED', '1')
+SIM_VERBOSE   = os.getenv('SIM_VERBOSE', '0') == '1'            # 1 = logs du worker affichés
+SIM_OUT       = os.getenv('SIM_OUT', '')
+
+MODULES = {"exagate": "autochat_exagate", "rbsoft": "rbsoft_auto_chat"}
+
+
+def simulate(worker: str = SIM_WORKER, sims: int = SIM_SIMS, horizon_s: float = SIM_HORIZON_H * 3600,
+             stall_s: float = SIM_STALL_H * 3600) -> dict:
+    vclock = clock.VirtualClock()
+    clock.install(vclock)
+    random.seed(SIM_SEED)
+
+    auto    = os.getenv('FAKE_AUTO_REPLY') or ("OK" if worker == "rbsoft" else "")
+    gateway = FakeGateway(devices=sims, slots=SIM_SLOTS, seed=SIM_SEED, webhook_url="",   # poll seul
+                          auto_reply=auto)
+    mod     = importlib.import_module(MODULES[worker])
+    mod.client     = LocalClient(gateway)
+    mod.dispatcher = InlineDispatcher()
+
+    n        = len(gateway.sims)
+    directed = worker == "rbsoft" and mod.RR_MODE != "tournament"
+    recorder = RunRecorder(n * (n - 1) // 2, mod.MAX_TURNS * (2 if directed else 1))
+
+    wall0 = time.perf_counter()
+    out   = sys.stdout if SIM_VERBOSE else open(os.devnull, "w")
+    with contextlib.redirect_stdout(out):
+        if worker == "rbsoft":
+            state, confirmed = mod._startup()
+            state = mod.track_state(state)
+            step  = lambda: mod.run_once(state, confirmed, timers)
+            wait  = lambda: mod.wait_next_poll(state)
+        else:
+            state = mod.track_state(mod._startup())
+            step  = lambda: mod.run_once(state, timers)
+            wait  = lambda: mod.wait_next_poll()
+        gateway.listeners.append(recorder)       # après la découverte rbsoft : seuls les échanges comptent
+        timers: dict = {}
+        t0 = moved = clock.monotonic()
+        seen  = (0, 0)
+        error = None
+        while clock.monotonic() - t0 < horizon_s and recorder.cycle_at is None:
+            if step():
+                wait()
+            now = (gateway.counters["sent"], recorder.pairs_done)
+            if now != seen:
+                seen, moved = now, clock.monotonic()
+            elif clock.monotonic() - moved >= stall_s:
+                error = "no_progress"
+                break
+        log.flush()                              # lignes en file écrites avant la fin de la redirection
+    wall = time.perf_counter() - wall0
+
+    virtual = vclock.elapsed
+    stats   = gateway.stats()
+    cycle_s = recorder.cycle_at - vclock.start if recorder.cycle_at is not None else None
+    active  = (recorder.last_send - recorder.first_send) if recorder.first_send is not None else 0.0
+    return {
+        "worker":              worker,
+        "error":               error,
+        "sims":                n,
+        "rr_mode":             mod.RR_MODE,
+        "max_turns":           mod.MAX_TURNS,
+        "global_send_per_min": mod.GLOBAL_SEND_PER_MIN,
+        "per_sim_send_per_min": mod.PER_SIM_SEND_PER_MIN,
+        "poll_interval_s":     mod.POLL_INTERVAL_S,
+        "cycle_s":             round(cycle_s, 1) if cycle_s is not None else None,
+        "cycle_h":             round(cycle_s / 3600, 2) if cycle_s is not None else None,
+        "pairs_total":         recorder.pairs_total,
+        "pairs_done":          recorder.pairs_done,
+        "sends":               stats["sent"],
+        "send_errors":         stats["errors"],
+        "polls":               stats["calls"].get("get_messages", 0),
+        "peak_sends_per_min":  recorder.peak_per_min,
+        "avg_sends_per_min":   round(stats["sent"] * 60 / active, 1) if active > 0 else None,
+        "reply_latency_ms":    percentiles(recorder.latencies),
+        "virtual_s":           round(virtual, 1),
+        "wall_s":              round(wall, 2),
+        "speedup":             round(virtual / wall) if wall > 0 else None,
+    }
+
+
+def main():
+    res = simulate()
+    line = json.dumps(res)
+    print(line, flush=True)
+    if SIM_OUT:
+        with open(SIM_OUT, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    if res["error"]:
+        raise SystemExit(f"simulation bloquée : {res['error']} (ni envoi ni paire terminée depuis {SIM_STALL_H} h virtuelles)")
+
+
+if __name__ == "__main__":
+    main()
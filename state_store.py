@@ -0,0 +1,594 @@
+"""
+Persistance de l'état (backends interchangeables)
+=================================================
+STATE_BACKEND=json   : fichier JSON réécrit en entier (comportement historique)
+STATE_BACKEND=journal: snapshot JSON + journal append-only des mutations,
+                       compacté en arrière-plan (voir JournalStateStore)
+STATE_BACKEND=sqlite : base SQLite en mode WAL, une ligne par conv / SIM /
+                       id dédupliqué / compteur de débit ; chaque save() ne
+                       touche que les lignes modifiées, dans une transaction.
+
+Les workers manipulent toujours un dict ; `layout` indique quelles sections
+vont dans une table ligne-à-ligne, le reste va dans la table kv.
+"""
+import os
+import json
+import atexit
+import signal
+import sqlite3
+import tempfile
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import clock
+from jsonlog import log
+
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'json')
+STATE_DB      = os.getenv('STATE_DB', '')
+STATE_FLUSH_S = float(os.getenv('STATE_FLUSH_S', '5'))   # staleness max avant écriture
+
+
+class JsonStateStore:
+    """Écriture atomique (tmp + rename) du dict complet."""
+
+    def __init__(self, path: str, prefix: str = "state_"):
+        self.path   = path
+        self.prefix = prefix
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, state: Dict[str, Any], dirty: Optional[Set[tuple]] = None) -> None:
+        # `dirty` ignoré : le fichier est toujours réécrit en entier
+        self._write(json.dumps(state, ensure_ascii=False, indent=2))
+
+    def _write(self, text: str) -> bool:
+        # Temp file in same dir as the state file to avoid cross-device rename (Render.com)
+        d = os.path.dirname(os.path.abspath(self.path)) or "."
+        fd, tmp = tempfile.mkstemp(prefix=self.prefix, suffix=".json", dir=d)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except Exception:
+            # Fallback: direct write if rename still fails
+            try:
+                with open(self.path, "w", encoding="utf-8") as f:
+                    f.write(text)
+            except Exception as e:
+                log.warn("STATE", "save", err=str(e))
+                return False
+        finally:
+            if os.path.exists(tmp):
+                try: os.remove(tmp)
+                except: pass
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+# ─── Journal + snapshot ────────────────────────────────────────────────────────
+STATE_JOURNAL_COMPACT = int(os.getenv('STATE_JOURNAL_COMPACT', '5000'))   # records avant compaction
+STATE_JOURNAL_FSYNC   = os.getenv('STATE_JOURNAL_FSYNC', '0') == '1'
+
+
+def _apply_record(state: Dict[str, Any], path: List[str], op: str, value: Any) -> None:
+    if not path:
+        if op == "set" and isinstance(value, dict):
+            state.clear()
+            state.update(value)
+        return
+    node = state
+    for k in path[:-1]:
+        nxt = node.get(k)
+        if not isinstance(nxt, dict):
+            nxt = node[k] = {}
+        node = nxt
+    if op == "del":
+        node.pop(path[-1], None)
+    else:
+        node[path[-1]] = value
+
+
+def _replay(state: Dict[str, Any], journal: str) -> int:
+    """Rejoue un journal sur state ; s'arrête à une ligne tronquée. Retourne le nombre de records."""
+    n = 0
+    if not os.path.exists(journal):
+        return n
+    with open(journal, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                r = json.loads(line)
+            except ValueError:
+                break                       # ligne tronquée : fin du journal utile
+            _apply_record(state, r["p"], r["op"], r.get("v"))
+            n += 1
+    return n
+
+
+class JournalStateStore(JsonStateStore):
+    """
+    Snapshot JSON (même fichier que le backend json) + journal <fichier>.journal
+    où chaque mutation suivie est ajoutée en une ligne {"p": chemin, "op", "v"}.
+
+    Les records portent la valeur complète au chemin : les rejouer deux fois
+    donne le même état, ce qui permet de compacter sans bloquer — le journal
+    courant est renommé en .journal.old, un nouveau est ouvert, et un thread
+    reconstruit le snapshot depuis le disque (snapshot précédent + .old
+    rejoué), sérialise et écrit : la boucle ne paie que la rotation, jamais
+    le json.dumps de l'état. .old n'est supprimé qu'une fois le snapshot en
+    place. load() rejoue snapshot + .old + journal ; une dernière ligne
+    tronquée (crash en cours d'écriture) est ignorée.
+    """
+
+    def __init__(self, path: str, prefix: str = "state_",
+                 compact_every: int = STATE_JOURNAL_COMPACT, fsync: bool = STATE_JOURNAL_FSYNC):
+        super().__init__(path, prefix)
+        self.journal       = path + ".journal"
+        self.old           = self.journal + ".old"
+        self.compact_every = compact_every
+        self.fsync         = fsync
+        self.records       = 0              # records depuis le dernier snapshot
+        self._lock         = threading.Lock()
+        self._bg: Optional[threading.Thread] = None
+        self._trim_partial()
+        self._f            = open(self.journal, "a", encoding="utf-8")
+
+    def _trim_partial(self) -> None:
+        """Coupe une dernière ligne incomplète pour que les ajouts repartent proprement."""
+        if not os.path.exists(self.journal):
+            return
+        with open(self.journal, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        state = super().load()
+        found = state is not None
+        state = state or {}
+        for jp in (self.old, self.journal):
+            n = _replay(state, jp)
+            self.records += n
+            found = found or n > 0
+        return state if found else None
+
+    def record(self, path: tuple, op: str, value: Any) -> None:
+        """Listener du Tracker : une mutation = une ligne ajoutée."""
+        line = _dumps({"p": list(path), "op": op, "v": value} if op == "set"
+                      else {"p": list(path), "op": op})
+        with self._lock:
+            self._f.write(line + "\n")
+            self._f.flush()
+            if self.fsync:
+                os.fsync(self._f.fileno())
+            self.records += 1
+
+    def save(self, state: Dict[str, Any], dirty: Optional[Set[tuple]] = None) -> None:
+        # Sans `dirty` (save explicite, migration) : snapshot complet synchrone
+        if dirty is None:
+            self.compact(state, wait=True)
+        elif self.records >= self.compact_every:
+            self.compact(state)
+
+    def compact(self, state: Dict[str, Any], wait: bool = False) -> bool:
+        """
+        wait=True (save explicite, migration) : snapshot de l'état vivant, qui
+        peut contenir des changements non journalisés. Sinon le thread
+        reconstruit l'état depuis le disque, sans toucher au dict partagé.
+        """
+        if self._bg is not None and self._bg.is_alive():
+            if not wait:
+                return False
+            self._bg.join()
+        with self._lock:
+            text = json.dumps(state, ensure_ascii=False, indent=2) if wait else None
+            self._f.close()
+            if os.path.exists(self.old):
+                # Compaction précédente interrompue : on garde tout dans .old
+                with open(self.journal, "r", encoding="utf-8") as src, \
+                     open(self.old, "a", encoding="utf-8") as dst:
+                    dst.write(src.read())
+                os.remove(self.journal)
+            else:
+                os.replace(self.journal, self.old)
+            self._f      = open(self.journal, "a", encoding="utf-8")
+            self.records = 0
+        self._bg = threading.Thread(target=self._snapshot, args=(text,), name="state-compact", daemon=True)
+        self._bg.start()
+        if wait:
+            self._bg.join()
+        return True
+
+    def _snapshot(self, text: Optional[str]) -> None:
+        if text is None:
+            try:
+                state = JsonStateStore.load(self) or {}
+                _replay(state, self.old)
+                text  = json.dumps(state, ensure_ascii=False, indent=2)
+            except Exception as e:
+                log.warn("STATE", "compaction", err=repr(e))
+                return                      # .old conservé, rejoué au prochain load()
+        if not self._write(text):
+            return                          # .old conservé, rejoué au prochain load()
+        try:
+            os.remove(self.old)
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        if self._bg is not None:
+            self._bg.join()
+        with self._lock:
+            self._f.close()
+
+
+# ─── SQLite ─────────────────────────────────────────────────────────────────────
+TABLES = ("convs", "sims", "dedupe", "rate")
+
+
+def _dumps(v: Any) -> str:
+    return json.dumps(v, ensure_ascii=False, separators=(",", ":"))
+
+
+def _split(table: str, value: Any) -> Tuple[Dict[str, str], Optional[Any]]:
+    """Section → (lignes {k: v sérialisée}, reste éventuel pour kv)."""
+    if not isinstance(value, dict):
+        return {}, value
+    if table == "dedupe" and "wm" in value:
+        rows = {k: str(ts) for k, ts in (value.get("win") or {}).items()}
+        return rows, {k: v for k, v in value.items() if k != "win"}
+    if table == "rate":
+        rows = {}
+        for name, v in value.items():
+            if isinstance(v, dict):
+                rows.update({f"{name}/{k}": _dumps(x) for k, x in v.items()})
+                rows.setdefault(f"{name}/", "null")   # garde la sous-section même vide
+            else:
+                rows[name] = _dumps(v)
+        return rows, None
+    if table == "sims":
+        return {k: str(v) for k, v in value.items()}, None
+    return {k: _dumps(v) for k, v in value.items()}, None
+
+
+def _join(table: str, rows: Dict[str, str], rest: Any) -> Any:
+    if table == "dedupe" and isinstance(rest, dict):
+        return {**rest, "win": {k: int(v) for k, v in rows.items()}}
+    if table == "rate":
+        out: Dict[str, Any] = {}
+        for k, v in rows.items():
+            if "/" in k:
+                name, sub = k.split("/", 1)
+                d = out.setdefault(name, {})
+                if sub:
+                    d[sub] = json.loads(v)
+            else:
+                out[k] = json.loads(v)
+        return out
+    if table == "sims":
+        return dict(rows)
+    return {k: json.loads(v) for k, v in rows.items()}
+
+
+class SqliteStateStore:
+    """
+    layout = {section_de_l_etat: table}, ex. {"convs": "convs", "seen": "dedupe"}.
+    save() compare chaque ligne à la dernière version écrite et n'émet que
+    les INSERT/DELETE nécessaires, en une transaction.
+    """
+
+    def __init__(self, path: str, layout: Dict[str, str]):
+        self.path   = path
+        self.layout = layout
+        self.db     = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.db:
+            for t in TABLES + ("kv",):
+                self.db.execute(f"CREATE TABLE IF NOT EXISTS {t} "
+                                f"(sec TEXT NOT NULL, k TEXT NOT NULL, v TEXT NOT NULL, "
+                                f"PRIMARY KEY (sec, k))")
+        # dernière version écrite : {(table, sec): {k: v}}
+        self._last: Dict[Tuple[str, str], Dict[str, str]] = {}
+
+    def _rows(self, table: str, sec: str) -> Dict[str, str]:
+        cur = self.db.execute(f"SELECT k, v FROM {table} WHERE sec=? ORDER BY rowid", (sec,))
+        return dict(cur.fetchall())
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        kv = self._rows("kv", "")
+        if not kv and not any(self._rows(t, s) for s, t in self.layout.items()):
+            return None
+        state: Dict[str, Any] = {k: json.loads(v) for k, v in kv.items()}
+        for sec, table in self.layout.items():
+            rows = self._rows(table, sec)
+            self._last[(table, sec)] = dict(rows)
+            state[sec] = _join(table, rows, state.get(sec))
+        self._last[("kv", "")] = kv
+        return state
+
+    def _diff(self, table: str, sec: str, rows: Dict[str, str]):
+        last = self._last.get((table, sec), {})
+        upserts = [(sec, k, v) for k, v in rows.items() if last.get(k) != v]
+        deletes = [(sec, k) for k in last if k not in rows]
+        return table, upserts, deletes
+
+    def _diff_keys(self, table: str, sec: str, value: Dict[str, Any], keys: Set[str]):
+        """Diff limité aux lignes `keys` d'une section convs/sims."""
+        last = self._last.get((table, sec), {})
+        upserts, deletes = [], []
+        for k in keys:
+            if k in value:
+                v = str(value[k]) if table == "sims" else _dumps(value[k])
+                if last.get(k) != v:
+                    upserts.append((sec, k, v))
+            elif k in last:
+                deletes.append((sec, k))
+        return table, upserts, deletes
+
+    def save(self, state: Dict[str, Any], dirty: Optional[Set[tuple]] = None) -> int:
+        """
+        dirty = chemins modifiés (sec,) ou (sec, clé) fournis par StatePersister ;
+        None = tout comparer. Retourne le nombre de lignes écrites ou supprimées.
+        """
+        if dirty is not None and () in dirty:
+            dirty = None                    # racine remplacée (clear) : sections supprimées incluses
+        whole = None if dirty is None else {p[0] for p in dirty if len(p) == 1}
+        keyed: Dict[str, Set[str]] = {}
+        for p in dirty or ():
+            if len(p) > 1:
+                keyed.setdefault(p[0], set()).add(str(p[1]))
+
+        plan = []
+        kv: Dict[str, str] = {}
+        for sec, value in state.items():
+            if dirty is not None and sec not in whole and sec not in keyed:
+                continue
+            table = self.layout.get(sec)
+            if table is None:
+                kv[sec] = _dumps(value)
+                continue
+            if (dirty is not None and sec not in whole and table in ("convs", "sims")
+                    and isinstance(value, dict)):
+                plan.append(self._diff_keys(table, sec, value, keyed[sec]))
+                continue
+            rows, rest = _split(table, value)
+            if rest is not None:
+                kv[sec] = _dumps(rest)
+            plan.append(self._diff(table, sec, rows))
+        for sec, table in self.layout.items():
+            if sec not in state and (dirty is None or sec in whole):
+                plan.append(self._diff(table, sec, {}))
+        if dirty is None:
+            plan.append(self._diff("kv", "", kv))
+        else:
+            last_kv = self._last.get(("kv", ""), {})
+            gone    = [("", k) for k in whole if k not in state and k in last_kv]
+            plan.append(("kv", [("", k, v) for k, v in kv.items() if last_kv.get(k) != v], gone))
+
+        n = 0
+        with self.db:
+            for table, upserts, deletes in plan:
+                if upserts:
+                    self.db.executemany(
+                        f"INSERT OR REPLACE INTO {table} (sec, k, v) VALUES (?, ?, ?)", upserts)
+                if deletes:
+                    self.db.executemany(f"DELETE FROM {table} WHERE sec=? AND k=?", deletes)
+                n += len(upserts) + len(deletes)
+        # Commit OK : ces lignes deviennent la référence du prochain diff
+        for table, upserts, deletes in plan:
+            for sec, k, v in upserts:
+                self._last.setdefault((table, sec), {})[k] = v
+            for sec, k in deletes:
+                self._last.get((table, sec), {}).pop(k, None)
+        return n
+
+    def close(self) -> None:
+        self.db.close()
+
+
+# ─── Suivi des mutations ────────────────────────────────────────────────────────
+class Tracker:
+    """
+    Reçoit chaque mutation de l'état suivi : dirty garde les chemins (sec,) ou
+    (sec, clé) modifiés depuis la dernière écriture, () si la racine a été
+    vidée (le store compare alors tout) ; les listeners reçoivent
+    (chemin complet, op, valeur) — op = "set" ou "del".
+    """
+
+    def __init__(self, now: Callable[[], float] = clock.monotonic):
+        self.dirty: Set[tuple] = set()
+        self.since: Optional[float] = None      # 1re mutation non écrite
+        self.listeners: List[Callable[[tuple, str, Any], None]] = []
+        self._now = now
+
+    def touch(self, path: tuple, op: str, value: Any) -> None:
+        self.dirty.add(path[:2])
+        if self.since is None:
+            self.since = self._now()
+        for fn in self.listeners:
+            fn(path, op, value)
+
+    def reset(self) -> None:
+        self.dirty.clear()
+        self.since = None
+
+
+def _wrap(value: Any, tracker: Tracker, path: tuple) -> Any:
+    if hasattr(value, "bind_tracker"):      # conteneur qui signale lui-même ses mutations
+        value.bind_tracker(tracker, path)
+        return value
+    if isinstance(value, (TrackedDict, TrackedList)):
+        if value._tracker is tracker and value._path == path:
+            return value
+        value = dict(value) if isinstance(value, dict) else list(value)
+    if isinstance(value, dict):
+        return TrackedDict(value, tracker, path)
+    if isinstance(value, list):
+        return TrackedList(value, tracker, path)
+    return value
+
+
+class TrackedDict(dict):
+    """dict qui signale ses mutations au Tracker ; les sous-dicts sont suivis aussi."""
+
+    def __init__(self, data: Dict, tracker: Tracker, path: tuple = ()):
+        super().__init__()
+        self._tracker = tracker
+        self._path    = path
+        for k, v in data.items():
+            dict.__setitem__(self, k, _wrap(v, tracker, path + (k,)))
+
+    def __setitem__(self, k, v):
+        v = _wrap(v, self._tracker, self._path + (k,))
+        dict.__setitem__(self, k, v)
+        self._tracker.touch(self._path + (k,), "set", v)
+
+    def __delitem__(self, k):
+        dict.__delitem__(self, k)
+        self._tracker.touch(self._path + (k,), "del", None)
+
+    def setdefault(self, k, default=None):
+        if k not in self:
+            self[k] = default
+        return dict.__getitem__(self, k)
+
+    def pop(self, k, *default):
+        if k in self:
+            v = dict.pop(self, k)
+            self._tracker.touch(self._path + (k,), "del", None)
+            return v
+        return dict.pop(self, k, *default)
+
+    def popitem(self):
+        k, v = dict.popitem(self)
+        self._tracker.touch(self._path + (k,), "del", None)
+        return k, v
+
+    def update(self, *args, **kw):
+        for k, v in dict(*args, **kw).items():
+            self[k] = v
+
+    def clear(self):
+        dict.clear(self)
+        self._tracker.touch(self._path, "set", self)
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class TrackedList(list):
+    """Liste feuille : toute mutation est signalée comme un remplacement complet."""
+
+    def __init__(self, data: List, tracker: Tracker, path: tuple):
+        super().__init__(data)
+        self._tracker = tracker
+        self._path    = path
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+def _list_mutator(name: str):
+    base = getattr(list, name)
+
+    def fn(self, *args, **kw):
+        r = base(self, *args, **kw)
+        self._tracker.touch(self._path, "set", self)
+        return r
+    fn.__name__ = name
+    return fn
+
+
+for _name in ("append", "extend", "insert", "pop", "remove", "clear", "sort", "reverse",
+              "__setitem__", "__delitem__"):
+    setattr(TrackedList, _name, _list_mutator(_name))
+
+
+class StatePersister:
+    """
+    Écritures regroupées : flush() seulement si l'état a changé, et au plus
+    une fois par STATE_FLUSH_S secondes via maybe_flush() ; flush forcé sur
+    SIGTERM / SIGINT et à la sortie du process.
+    """
+
+    def __init__(self, store, max_stale_s: float = STATE_FLUSH_S,
+                 now: Callable[[], float] = clock.monotonic):
+        self.store       = store
+        self.max_stale_s = max_stale_s
+        self.tracker     = Tracker(now)
+        self.state: Optional[TrackedDict] = None
+        self.writes      = 0
+        self._now        = now
+
+    def track(self, state: Dict[str, Any]) -> TrackedDict:
+        self.state = _wrap(dict(state), self.tracker, ())
+        if hasattr(self.store, "record"):
+            self.tracker.listeners.append(self.store.record)
+        return self.state
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self.tracker.dirty)
+
+    def maybe_flush(self) -> bool:
+        since = self.tracker.since
+        if since is None or self._now() - since < self.max_stale_s:
+            return False
+        return self.flush()
+
+    def flush(self) -> bool:
+        if self.state is None or not self.tracker.dirty:
+            return False
+        dirty = set(self.tracker.dirty)
+        self.tracker.reset()
+        try:
+            self.store.save(self.state, dirty)
+        except Exception:
+            self.tracker.dirty |= dirty        # réessayé au prochain flush
+            self.tracker.since = self.tracker.since or self._now()
+            raise
+        self.writes += 1
+        return True
+
+    def install_shutdown_flush(self) -> None:
+        atexit.register(self.store.close)      # atexit : ordre inverse → flush puis close
+        atexit.register(self.flush)
+        for sig, exc in ((signal.SIGTERM, SystemExit), (signal.SIGINT, KeyboardInterrupt)):
+            def handler(signum, frame, exc=exc):
+                self.flush()
+                raise exc(0) if exc is SystemExit else exc()
+            try:
+                signal.signal(sig, handler)
+            except ValueError:
+                pass   # hors du thread principal
+
+
+def make_store(json_path: str, layout: Dict[str, str], prefix: str = "state_"):
+    """
+    Backend choisi par STATE_BACKEND. En sqlite, si la base est vide et que
+    l'ancien fichier JSON existe, il sert d'état initial (migration).
+    """
+    if STATE_BACKEND == "journal":
+        return JournalStateStore(json_path, prefix)
+    if STATE_BACKEND != "sqlite":
+        return JsonStateStore(json_path, prefix)
+    db_path = STATE_DB or os.path.splitext(json_path)[0] + ".db"
+    store   = SqliteStateStore(db_path, layout)
+    if store.load() is None and os.path.exists(json_path):
+        legacy = JsonStateStore(json_path).load()
+        if legacy:
+            store.save(legacy)
+            log.info("STATE", "migration JSON -> SQLite", src=json_path, db=db_path)
+    return store
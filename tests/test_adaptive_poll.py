@@ -0,0 +1,53 @@
+from adaptive_poll import AdaptivePoller
+from clock import VirtualClock
+
+
+def _poller(**kw):
+    clk = VirtualClock(1000.0)
+    kw  = {"floor_s": 1, "ceiling_s": 60, "factor": 2, "active_s": 2, "enabled": True, **kw}
+    return clk, AdaptivePoller(5, now=clk.monotonic, **kw)
+
+
+def test_idle_backs_off_to_the_ceiling():
+    clk, p = _poller()
+    assert p.due() and p.wait_s() == 0.0                  # jamais pollé : tout de suite
+    assert [p.record(0, 0) for _ in range(5)] == [10, 20, 40, 60, 60]
+    assert not p.due() and p.skipped == 1
+    assert p.wait_s() == 5                                # la boucle se réveille quand même à base
+    clk.sleep(60)
+    assert p.due()
+
+
+def test_new_messages_drop_to_the_floor_and_activity_caps_the_interval():
+    clk, p = _poller()
+    p.record(0, 0)
+    p.record(0, 0)
+    assert p.record(3, 0) == 1                            # le trafic coule
+    assert p.record(0, 4) == 2                            # réponse attendue : x2 plafonné à active_s
+    assert p.record(0, 0, pending=1) == 2
+    assert p.record(0, 0) == 10                           # plus rien : reprend depuis base
+
+
+def test_snap_brings_the_next_poll_forward_only():
+    clk, p = _poller()
+    p.record(0, 0)
+    p.record(0, 0)                                        # prochain poll dans 20 s
+    p.snap()
+    assert p.interval == 1 and p.wait_s() == 1
+    p.record(5, 0)                                        # prochain poll dans 1 s
+    clk.sleep(0.5)
+    p.snap()                                              # 1.5 s : plus tard que l'échéance prévue
+    assert p.wait_s() == 0.5
+
+
+def test_disabled_polls_every_iteration_at_base():
+    clk, p = _poller(enabled=False)
+    assert p.record(0, 0) == 5 and p.record(0, 0) == 5
+    p.snap()
+    assert p.due() and p.wait_s() == 5 and p.wake_s() == 5
+    assert p.polls == 2 and p.skipped == 0
+
+
+def test_bounds_are_clamped_to_base():
+    _, p = _poller(floor_s=10, ceiling_s=3, active_s=50, factor=0.5)
+    assert (p.floor, p.active, p.ceiling, p.factor) == (5, 5, 5, 1.0)
@@ -0,0 +1,102 @@
+from admission import PRIO_OPENER, PRIO_REFRESH, PRIO_REPLY, AdmissionQueue
+from clock import VirtualClock
+
+
+class Budget:
+    """Envois autorisés par SIM (et au total si global_left n'est pas None)."""
+
+    def __init__(self, **per_spec):
+        self.left = dict(per_spec)
+        self.global_left = None
+
+    def can_send(self, state, spec):
+        if self.global_left == 0 or self.left.get(spec, 0) <= 0:
+            return False
+        self.left[spec] -= 1
+        if self.global_left is not None:
+            self.global_left -= 1
+        return True
+
+    def global_wait(self, state):
+        return 1.0 if self.global_left == 0 else 0.0
+
+
+def _queue(budget):
+    clk   = VirtualClock(1000)
+    timer = []
+    q = AdmissionQueue(budget.can_send, lambda state, spec: 2.0, budget.global_wait,
+                       lambda wait, fn: timer.append((wait, fn)) or clk.monotonic() + wait,
+                       now=clk.monotonic)
+    return q, timer
+
+
+def test_submit_runs_immediately_when_allowed():
+    q, timer = _queue(Budget(a=1))
+    assert q.submit(None, PRIO_REPLY, "a", lambda: "sent") == "sent"
+    assert len(q) == 0 and timer == []
+
+
+def test_refused_reply_is_deferred_and_retried_on_drain():
+    budget   = Budget(a=0)
+    q, timer = _queue(budget)
+    assert q.submit(None, PRIO_REPLY, "a", lambda: "sent") == {"deferred": "a", "in": 2.0}
+    assert len(q) == 1 and q.deferred == 1
+    assert timer[0][0] == 2.0                    # drain() programmé à time_until_allowed
+    assert q.drain() is None                     # toujours refusé : reste en file
+    budget.left["a"] = 1
+    assert q.drain() == ["sent"]
+    assert len(q) == 0 and q.retried == 1
+
+
+def test_pending_reply_blocks_opener_on_same_sim_only():
+    budget = Budget(a=0, b=5)
+    q, _   = _queue(budget)
+    q.submit(None, PRIO_REPLY, "a", lambda: "reply")
+    budget.left["a"] = 0
+    assert q.admit(None, PRIO_OPENER, "a") == (False, [])
+    assert q.admit(None, PRIO_OPENER, "b") == (True, [])
+
+
+def test_global_limit_blocks_all_lower_priorities():
+    budget = Budget(a=0, b=5)
+    q, _   = _queue(budget)
+    q.submit(None, PRIO_REPLY, "a", lambda: "reply")
+    budget.global_left = 0
+    assert q.admit(None, PRIO_REFRESH, "b") == (False, [])
+
+
+def test_admit_returns_replies_sent_while_draining():
+    budget = Budget(a=0, b=5)
+    q, _   = _queue(budget)
+    q.submit(None, PRIO_REPLY, "a", lambda: {"replied": "a"})
+    budget.left["a"] = 2
+    ok, drained = q.admit(None, PRIO_OPENER, "a")
+    assert ok and drained == [{"replied": "a"}]
+    assert q.retried == 1 and len(q) == 0
+
+
+def test_drain_runs_by_priority():
+    budget = Budget(a=0)
+    q, _   = _queue(budget)
+    order  = []
+    q.submit(None, PRIO_REFRESH, "a", order.append, "refresh")
+    q.submit(None, PRIO_REPLY, "a", order.append, "reply")
+    budget.left["a"] = 1
+    q.drain()
+    assert order == ["reply"]
+    assert q.pending() == {PRIO_REFRESH: 1}
+
+
+def test_submit_returns_other_results_run_in_the_same_pass():
+    budget = Budget(a=0, b=1)
+    q, _   = _queue(budget)
+    q.submit(None, PRIO_REPLY, "a", lambda: "old")
+    budget.left["a"] = 1
+    assert q.submit(None, PRIO_REPLY, "b", lambda: "new") == ["new", "old"]
+
+
+def test_clear_drops_pending_sends():
+    q, _ = _queue(Budget())
+    q.submit(None, PRIO_REPLY, "a", lambda: None)
+    q.clear()
+    assert len(q) == 0 and q.drain() is None
@@ -0,0 +1,66 @@
+import random
+
+from autochat_exagate import StateIndex
+from state_store import StatePersister
+
+
+class _NullStore:
+    def save(self, state, dirty=None):
+        pass
+
+
+def _tracked(state):
+    persister = StatePersister(_NullStore())
+    state     = persister.track(state)
+    index     = StateIndex(state)
+    persister.tracker.listeners.append(index.on_change)
+    return state, index
+
+
+def _views(index):
+    return index.by_spec, index.active_of
+
+
+def test_reverse_indexes_match_a_rebuild_after_mutations():
+    rnd   = random.Random(11)
+    nums  = [f"+23760{i:04d}" for i in range(8)]
+    state, index = _tracked({"sims": {n: f"{i}|0" for i, n in enumerate(nums)}, "convs": {}})
+    for step in range(400):
+        a, b = sorted(rnd.sample(nums, 2))
+        key  = f"{a}|{b}"
+        op   = rnd.random()
+        if op < 0.35:
+            state["convs"][key] = {"turn": 1, "status": "active", "last_sender": a}
+        elif op < 0.55 and key in state["convs"]:
+            state["convs"][key]["status"] = rnd.choice(["done", "active"])
+        elif op < 0.65 and key in state["convs"]:
+            state["convs"][key]["turn"] += 1                     # hors status : index inchangé
+        elif op < 0.75:
+            state["convs"].pop(key, None)
+        elif op < 0.85:
+            n = rnd.choice(nums)
+            state["sims"][n] = f"{rnd.randrange(20)}|{rnd.randrange(2)}"
+        elif op < 0.9:
+            state["convs"] = {k: dict(v) for k, v in state["convs"].items()}   # section remplacée
+        elif op < 0.92:
+            state["sims"] = {n: f"{i}|1" for i, n in enumerate(nums)}
+        assert _views(index) == _views(StateIndex(state)), step
+
+
+def test_root_clear_rebuilds_the_index():
+    state, index = _tracked({"sims": {"+2376001": "1|0"},
+                             "convs": {"+2376001|+2376002": {"status": "active"}}})
+    state.clear()
+    state.update({"sims": {"+2376003": "3|0"}, "convs": {}})
+    assert index.by_spec == {"3|0": "+2376003"}
+    assert index.active_of == {}
+
+
+def test_receiver_uses_spec_then_active_conv():
+    state, index = _tracked({"sims": {"+2376001": "1|0", "+2376002": "2|1"},
+                             "convs": {"+2376001|+2376002": {"status": "active"}}})
+    assert index.receiver("+2376001", 2, 1) == ("2|1", "+2376002")
+    assert index.receiver("+2376001", None, None) == ("2|1", "+2376002")   # slot inconnu : conv active
+    state["convs"]["+2376001|+2376002"]["status"] = "done"
+    assert index.receiver("+2376001", None, None) == (None, None)
+    assert index.receiver("+2376001", 9, 0) == (None, None)
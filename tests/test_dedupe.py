@@ -0,0 +1,61 @@
+from clock import VirtualClock
+from dedupe import DedupeStore
+
+
+def test_add_reports_duplicates():
+    seen = DedupeStore({}, now=VirtualClock(1000).now)
+    assert seen.add("42")
+    assert not seen.add("42")
+    assert not seen.add(42)                 # même id, int ou str
+    assert 42 in seen and "43" not in seen
+
+
+def test_window_overflow_folds_into_watermark():
+    store = {}
+    seen  = DedupeStore(store, max_size=3, now=VirtualClock(1000).now)
+    for i in range(1, 6):
+        seen.add(i)
+    assert len(seen) == 3
+    assert seen.watermark == 2
+    assert list(store["win"]) == ["3", "4", "5"]
+    assert 1 in seen and 2 in seen
+    assert not seen.add(1)
+
+
+def test_ttl_evicts_and_folds_numeric_ids():
+    clk  = VirtualClock(1000)
+    seen = DedupeStore({}, ttl_s=10, now=clk.now)
+    seen.add("abc")
+    seen.add(7)
+    clk.sleep(11)
+    seen.add(8)
+    assert len(seen) == 1
+    assert "abc" not in seen                # non numérique : oublié après TTL
+    assert 7 in seen                        # numérique : absorbé par le watermark
+    assert seen.watermark == 7
+
+
+def test_checkpoint_keeps_non_numeric_ids():
+    store = {}
+    seen  = DedupeStore(store, now=VirtualClock(1000).now)
+    for mid in ("12", "abc", "9"):
+        seen.add(mid)
+    assert seen.checkpoint() == 12
+    assert store["win"] == {"abc": 1000}
+    assert 9 in seen and 11 in seen and "abc" in seen
+
+
+def test_watermark_never_moves_back():
+    seen = DedupeStore({"wm": 50, "win": {}}, now=VirtualClock(1000).now)
+    seen.add(3)
+    assert seen.checkpoint() == 50
+
+
+def test_legacy_dict_is_migrated_and_trimmed():
+    clk   = VirtualClock(1000)
+    store = {"6": 100, "x": 998, "5": 999}    # ordre d'insertion = ordre chronologique
+    seen  = DedupeStore(store, ttl_s=60, now=clk.now)
+    assert set(store) == {"wm", "win"}
+    assert "5" in seen and "x" in seen
+    assert 6 in seen                        # expiré au chargement, couvert par le watermark
+    assert store["win"] == {"x": 998, "5": 999}
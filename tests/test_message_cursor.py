@@ -0,0 +1,55 @@
+from message_cursor import MessageCursor, numeric_id
+
+
+def _page(*ids):
+    return [{"id": i, "number": "+237600000000", "message": "x"} for i in ids]
+
+
+def _ids(msgs):
+    return [numeric_id(m) for m in msgs]
+
+
+def test_empty_cursor_keeps_whole_page_in_order():
+    cur = MessageCursor({}, lookback=0)
+    assert _ids(cur.select(_page(3, 1, 2))) == [1, 2, 3]
+    assert cur.params() == {}
+
+
+def test_ascending_and_descending_pages_stop_at_cursor():
+    cur = MessageCursor({"last_id": 10}, lookback=0)
+    assert _ids(cur.select(_page(5, 6, 7, 8, 9, 10, 11, 12))) == [11, 12]
+    assert _ids(cur.select(_page(12, 11, 10, 9, 8))) == [11, 12]
+
+
+def test_lookback_re_presents_ids_under_cursor():
+    cur = MessageCursor({"last_id": 10}, param="last_id", lookback=2)
+    assert _ids(cur.select(_page(5, 6, 7, 8, 9, 10, 11, 12))) == [9, 10, 11, 12]
+    assert cur.params() == {"last_id": 8}
+
+
+def test_lookback_param_never_negative():
+    cur = MessageCursor({"last_id": 3}, param="last_id", lookback=20)
+    assert cur.params() == {"last_id": 0}
+
+
+def test_unordered_page_falls_back_to_full_sort():
+    cur = MessageCursor({"last_id": 10}, lookback=2)
+    # extrémités croissantes, désordre au milieu : tri complet
+    assert _ids(cur.select(_page(12, 5, 11, 9, 10, 13))) == [9, 10, 11, 12, 13]
+
+
+def test_non_numeric_ids_are_kept():
+    cur  = MessageCursor({"last_id": 10}, lookback=0)
+    page = _page(9, 11) + [{"id": "abc", "number": "+237600000001", "message": "x"}]
+    out  = cur.select(page)
+    assert [m["id"] for m in out] == ["abc", 11]
+
+
+def test_advance_only_moves_forward():
+    store = {}
+    cur   = MessageCursor(store, lookback=0)
+    for m in _page(4, 9, 7):
+        cur.advance(m)
+    cur.advance({"id": "abc"})
+    assert cur.last_id == 9
+    assert store == {"last_id": 9}
@@ -0,0 +1,76 @@
+import socket
+import urllib.request
+
+from metrics import Registry, endpoint_label, serve
+
+
+def _registry():
+    reg = Registry()
+    return reg, reg.counter("t_sends_total", "Envois"), reg.gauge("t_queue", "File", ("queue",)), \
+        reg.histogram("t_seconds", "Latence", ("endpoint",), buckets=(0.1, 1.0))
+
+
+def test_render_counters_gauges_and_histograms():
+    reg, sends, queue, seconds = _registry()
+    sends.inc()
+    sends.inc(2)
+    queue.set(3, queue="replies")
+    queue.set(1.5, queue="admission")
+    for v in (0.05, 0.5, 0.5, 7):
+        seconds.observe(v, endpoint="send.php")
+    assert reg.render() == "\n".join([
+        "# HELP t_sends_total Envois",
+        "# TYPE t_sends_total counter",
+        "t_sends_total 3",
+        "# HELP t_queue File",
+        "# TYPE t_queue gauge",
+        't_queue{queue="admission"} 1.5',
+        't_queue{queue="replies"} 3',
+        "# HELP t_seconds Latence",
+        "# TYPE t_seconds histogram",
+        't_seconds_bucket{endpoint="send.php",le="0.1"} 1',       # buckets cumulés
+        't_seconds_bucket{endpoint="send.php",le="1"} 3',
+        't_seconds_bucket{endpoint="send.php",le="+Inf"} 4',
+        't_seconds_sum{endpoint="send.php"} 8.05',
+        't_seconds_count{endpoint="send.php"} 4',
+    ]) + "\n"
+
+
+def test_unlabelled_series_exist_before_first_update():
+    reg = Registry()
+    reg.counter("t_total", "Compteur")
+    h = reg.histogram("t_seconds", "Duree", buckets=(1.0,))
+    text = reg.render()
+    assert "t_total 0\n" in text
+    assert 't_seconds_bucket{le="+Inf"} 0\n' in text and "t_seconds_count 0\n" in text
+    h.observe(2.0)
+    assert 't_seconds_bucket{le="1"} 0\n' in reg.render()
+
+
+def test_label_values_are_escaped():
+    reg = Registry()
+    g = reg.gauge("t_g", "Jauge", ("name",))
+    g.set(1, name='a"b\\c\nd')
+    assert 't_g{name="a\\"b\\\\c\\nd"} 1' in reg.render()
+
+
+def test_endpoint_label_and_http_server():
+    assert endpoint_label("/services/send.php") == "send.php"
+    reg, sends, _, _ = _registry()
+    sends.inc()
+    assert serve(port=0, registry=reg) is None             # 0 = désactivé
+    server = serve(port=_free_port(), registry=reg)
+    try:
+        url = "http://%s:%d" % server.server_address[:2]
+        with urllib.request.urlopen(url + "/metrics", timeout=5) as r:
+            assert r.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert "t_sends_total 1\n" in r.read().decode("utf-8")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
@@ -0,0 +1,81 @@
+import pytest
+
+import pair_matrix
+from pair_matrix import PairMatrix, PairMatrixStore, dumps, loads
+from state_store import SqliteStateStore, StatePersister
+
+A, B, C, D = "+2376001", "+2376002", "+2376003", "+2376004"
+
+
+def _convs():
+    return {
+        f"{A}|{B}": {"turn": 3, "status": "active", "last_sender": A, "at": 1792200000.5},
+        f"{A}|{C}": {"turn": 10, "status": "done", "last_sender": C},
+        f"{B}|{C}": {"turn": 70000, "status": "paused", "last_sender": D, "err": "timeout"},   # hors schéma
+        f"{C}|{D}": {},
+    }
+
+
+def test_dumps_loads_round_trip():
+    m = PairMatrix.from_dict(_convs())
+    back = loads(dumps(m))
+    assert back.to_dict() == _convs()
+    assert len(back) == 4 and back.nums == m.nums
+    assert back.extra == {pair_matrix._tri(1, 2): {"turn": 70000, "status": "paused",
+                                                   "last_sender": D, "err": "timeout"}}
+
+
+def test_round_trip_of_empty_and_cleared_matrix():
+    assert loads(dumps(PairMatrix())).to_dict() == {}
+    m = PairMatrix.from_dict(_convs())
+    m.clear()
+    back = loads(dumps(m))
+    assert len(back) == 0 and list(back) == [] and back.nums == m.nums
+
+
+def test_loads_rejects_a_foreign_header():
+    data = bytearray(dumps(PairMatrix.from_dict(_convs())))
+    data[:4] = b"XXXX"
+    with pytest.raises(ValueError):
+        loads(bytes(data))
+
+
+def test_pair_ids_are_triangular_and_stable_when_numbers_arrive():
+    m = PairMatrix.from_dict({f"{A}|{B}": {"turn": 1}})
+    p_ab = m._pid(f"{A}|{B}")
+    m[f"{C}|{D}"] = {"turn": 2}
+    m[f"{A}|{D}"] = {"turn": 3}
+    n = len(m.nums)
+    assert len(m.status) == n * (n - 1) // 2
+    assert m._pid(f"{A}|{B}") == m._pid(f"{B}|{A}") == p_ab == 0
+    pids = {m._pid(f"{x}|{y}") for x in m.nums for y in m.nums if x < y}
+    assert pids == set(range(len(m.status)))            # bijection paires ↔ [0, n(n-1)/2)
+    assert m[f"{A}|{B}"]["turn"] == 1 and m[f"{D}|{A}"]["turn"] == 3
+
+
+def test_out_of_range_keys():
+    m = PairMatrix.from_dict({f"{A}|{B}": {"turn": 1}})
+    assert m.get(f"{A}|{A}") is None and f"{A}|{A}" not in m
+    assert m.get(f"{A}|+2376999") is None                 # numéro jamais vu : pas d'id créé
+    assert m.get("sans-separateur") is None
+    assert len(m.nums) == 2
+    with pytest.raises(KeyError):
+        m[f"{A}|{A}"] = {"turn": 1}
+    with pytest.raises(KeyError):
+        del m[f"{A}|{C}"]
+
+
+def test_store_writes_the_matrix_after_a_root_clear(tmp_path):
+    inner     = SqliteStateStore(str(tmp_path / "state.db"), {"sims": "sims"})
+    store     = PairMatrixStore(inner, str(tmp_path / "convs.pmx"))
+    persister = StatePersister(store, max_stale_s=0)
+    state     = persister.track({"convs": PairMatrix.from_dict(_convs()), "sims": {A: "1|0"},
+                                 "cursor": {"last_id": 9}, "rr_idx": 1})
+    store.save(state)
+
+    state.clear()                           # touche la racine : chemin ()
+    state.update({"convs": PairMatrix.from_dict({f"{A}|{D}": {"turn": 1}}), "sims": {D: "4|0"}})
+    assert persister.flush()
+    loaded = store.load()
+    assert loaded["convs"].to_dict() == {f"{A}|{D}": {"turn": 1}}
+    assert {k: v for k, v in loaded.items() if k != "convs"} == {"sims": {D: "4|0"}}
@@ -0,0 +1,65 @@
+import pytest
+
+from clock import VirtualClock
+from rate_limiter import RateLimiter
+
+
+def test_per_sim_burst_then_emission_interval():
+    clk = VirtualClock(1000)
+    rl  = RateLimiter({}, global_limit=100, per_sim_limit=3, now=clk.now)
+    assert [rl.try_acquire("1|0") for _ in range(4)] == [True, True, True, False]
+    assert rl.time_until_allowed("1|0") == pytest.approx(20)     # T = 60 / 3
+    assert rl.time_until_allowed("2|0") == 0
+    clk.sleep(19.9)
+    assert not rl.try_acquire("1|0")
+    clk.sleep(0.1)
+    assert rl.try_acquire("1|0")
+    assert not rl.try_acquire("1|0")
+
+
+def test_global_limit_spans_sims():
+    clk = VirtualClock(1000)
+    rl  = RateLimiter({}, global_limit=2, per_sim_limit=10, now=clk.now)
+    assert rl.try_acquire("1|0") and rl.try_acquire("2|0")
+    assert not rl.try_acquire("3|0")
+    assert rl.global_wait() == pytest.approx(30)                  # T = 60 / 2
+    clk.sleep(30)
+    assert rl.global_wait() == 0
+    assert rl.try_acquire("3|0")
+
+
+def test_refused_send_consumes_nothing():
+    clk   = VirtualClock(1000)
+    store = {}
+    rl    = RateLimiter(store, global_limit=1, per_sim_limit=10, now=clk.now)
+    assert rl.try_acquire("1|0")
+    before = {"tat": store["tat"], "sims": dict(store["sims"])}
+    assert not rl.try_acquire("2|0")
+    assert store == before
+
+
+def test_idle_period_restores_full_burst():
+    clk = VirtualClock(1000)
+    rl  = RateLimiter({}, global_limit=100, per_sim_limit=3, now=clk.now)
+    for _ in range(3):
+        rl.try_acquire("1|0")
+    clk.sleep(60)
+    assert [rl.try_acquire("1|0") for _ in range(4)] == [True, True, True, False]
+
+
+@pytest.mark.parametrize("per_key", ["per_sim", "per"])
+def test_legacy_timestamp_lists_are_migrated(per_key):
+    clk   = VirtualClock(1000)
+    store = {"global": [990, 995, 900], per_key: {"1|0": [990, 995], "2|0": [900]}}
+    rl    = RateLimiter(store, global_limit=3, per_sim_limit=2, now=clk.now)
+    assert set(store) == {"tat", "sims"}
+    assert store["sims"] == {"1|0": 1060.0}          # 2 envois récents -> now + 2 x 30 ; 2|0 expiré
+    assert rl.time_until_allowed("1|0") == pytest.approx(30)
+    assert rl.try_acquire("2|0")                      # 3e envoi global de la minute
+    assert not rl.try_acquire("3|0")
+
+
+def test_empty_legacy_store_starts_clean():
+    store = {}
+    RateLimiter(store, global_limit=5, per_sim_limit=5, now=VirtualClock(1000).now)
+    assert store == {"tat": 0.0, "sims": {}}
@@ -0,0 +1,59 @@
+import rbsoft_auto_chat as rb
+from rr_progress import RoundRobinProgress
+from state_store import JsonStateStore, StatePersister
+
+SIMS = {"+2376001": "1|0", "+2376002": "2|0", "+2376003": "3|0"}
+
+
+def _tracked(tmp_path, monkeypatch):
+    persister = StatePersister(JsonStateStore(str(tmp_path / "state.json")))
+    state     = persister.track(rb._default_state())
+    progress  = RoundRobinProgress(state, "pairs", "known_sims", directed=True)
+    persister.tracker.listeners.append(progress.on_change)
+    monkeypatch.setattr(rb, "_progress", progress)
+    return state, progress
+
+
+def test_refresh_keeps_known_sims_when_unchanged(tmp_path, monkeypatch):
+    state, progress = _tracked(tmp_path, monkeypatch)
+    monkeypatch.setattr(rb, "fetch_sims", lambda state: dict(SIMS))
+    first = rb._refresh_sims(state, SIMS, 1000.0)
+    rb.sorted_sims(state, first)
+
+    recounts = []
+    monkeypatch.setattr(progress, "_recount", lambda: recounts.append(1))
+    second = rb._refresh_sims(state, SIMS, 1060.0)
+    assert second is first is state["known_sims"]
+    rb.sorted_sims(state, second)
+    assert recounts == []                        # ni re-tri ni recomptage O(paires)
+    assert state["meta"]["last_sim_refresh"] == 1000.0
+
+
+def test_refresh_replaces_known_sims_when_the_set_changes(tmp_path, monkeypatch):
+    state, _ = _tracked(tmp_path, monkeypatch)
+    monkeypatch.setattr(rb, "fetch_sims", lambda state: dict(SIMS))
+    first = rb._refresh_sims(state, SIMS, 1000.0)
+    monkeypatch.setattr(rb, "fetch_sims", lambda state: {n: s for n, s in SIMS.items() if n != "+2376003"})
+    second = rb._refresh_sims(state, SIMS, 1060.0)
+    assert second is not first and sorted(second) == ["+2376001", "+2376002"]
+    assert rb.sorted_sims(state, second) == ["+2376001", "+2376002"]
+
+
+def test_failed_poll_still_runs_the_tick(tmp_path, monkeypatch):
+    state, _ = _tracked(tmp_path, monkeypatch)
+    state["known_sims"] = dict(SIMS)
+    ticks, polls = [], []
+
+    def broken_poll(state):
+        raise ConnectionError("gateway indisponible")
+
+    monkeypatch.setattr(rb, "_poll_due", lambda: True)
+    monkeypatch.setattr(rb, "poll_inbound", broken_poll)
+    monkeypatch.setattr(rb, "_record_poll", lambda state, new: polls.append(new))
+    monkeypatch.setattr(rb, "tick_round_robin", lambda state, sims_map: ticks.append(sims_map) or {})
+    monkeypatch.setattr(rb, "flush_state", lambda: None)
+    monkeypatch.setattr(rb, "export_metrics", lambda state, sims_map: None)
+
+    assert rb.run_once(state, SIMS, {"refresh": rb.clock.now()}) is True
+    assert polls == [0]                          # poll compté même en erreur
+    assert ticks == [state["known_sims"]]        # le tick n'est pas sauté
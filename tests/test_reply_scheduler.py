@@ -0,0 +1,63 @@
+from clock import VirtualClock
+from reply_scheduler import ReplyScheduler
+
+
+def _sched(start=1000.0):
+    clk = VirtualClock(start)
+    return clk, ReplyScheduler(now=clk.monotonic, sleep=clk.sleep)
+
+
+def test_failing_callback_does_not_stop_the_drain():
+    clk, rs = _sched()
+    rs.schedule(1, lambda: "a")
+    rs.schedule(2, lambda: 1 / 0)
+    rs.schedule(3, lambda: "c")
+    clk.sleep(5)
+    assert rs.run_due() == ["a", "c"]
+    assert len(rs) == 0
+
+
+def test_sleep_runs_the_whole_wait_despite_a_failure():
+    clk, rs = _sched()
+    rs.schedule(1, lambda: 1 / 0)
+    rs.schedule(2, lambda: "b")
+    assert rs.sleep(10) == ["b"]
+    assert clk.elapsed == 10
+
+
+def test_run_due_in_deadline_then_schedule_order():
+    clk, rs = _sched()
+    rs.schedule(3, lambda lead, x: (lead, x), "c")
+    rs.schedule(1, lambda lead, x: (lead, x), "a")
+    rs.schedule(1, lambda lead, x: (lead, x), "b")      # même échéance : ordre d'ajout
+    rs.schedule(-5, lambda lead, x: [x, x], "z")         # délai négatif = tout de suite, liste aplatie
+    assert rs.run_due("s") == ["z", "z"]
+    assert rs.time_until_next() == 1
+    clk.sleep(3)
+    assert rs.run_due("s") == [("s", "a"), ("s", "b"), ("s", "c")]
+    assert rs.time_until_next() is None
+
+
+def test_sleep_stops_early_when_wake_reports_a_push():
+    clk, rs = _sched()
+    rs.schedule(2, lambda: "r1")
+    rs.schedule(8, lambda: "r2")
+    steps = []
+
+    def wake(t):
+        steps.append(t)
+        clk.sleep(t if len(steps) == 1 else 1)           # 2e attente : push après 1 s
+        return len(steps) == 2
+
+    assert rs.sleep(10, wake=wake) == ["r1"]
+    assert steps == [2, 6]                               # réveillé à l'échéance puis jusqu'à la suivante
+    assert clk.elapsed == 3 and len(rs) == 1
+
+
+def test_clear_drops_pending_replies():
+    clk, rs = _sched()
+    rs.schedule(1, lambda: "a")
+    rs.schedule(2, lambda: "b")
+    rs.clear()
+    assert len(rs) == 0
+    assert rs.sleep(5) == []
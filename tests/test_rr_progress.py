@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+from rr_progress import RoundRobinProgress
+from state_store import StatePersister
+
+
+class _NullStore:
+    def save(self, state, dirty=None):
+        pass
+
+
+def _tracked(state, directed):
+    persister = StatePersister(_NullStore())
+    state     = persister.track(state)
+    progress  = RoundRobinProgress(state, "convs", "sims", directed=directed)
+    persister.tracker.listeners.append(progress.on_change)
+    return state, progress
+
+
+def _snapshot(p):
+    return p.active, {n: c for n, c in p.done_of.items() if c}
+
+
+@pytest.mark.parametrize("directed", [False, True])
+def test_incremental_counters_match_full_recount(directed):
+    rnd   = random.Random(7)
+    nums  = [f"+23760{i:04d}" for i in range(8)]
+    state, progress = _tracked({"sims": {n: f"{i}|0" for i, n in enumerate(nums)}, "convs": {}}, directed)
+    sims_list = progress.sims_list(state["sims"])
+    for step in range(400):
+        a, b = rnd.sample(nums, 2)
+        key  = f"{a}|{b}" if directed else "|".join(sorted((a, b)))
+        op   = rnd.random()
+        if op < 0.4:
+            state["convs"][key] = {"turn": 1, "status": "active"}
+        elif op < 0.7 and key in state["convs"]:
+            state["convs"][key]["status"] = "done"
+        elif op < 0.8:
+            state["convs"].pop(key, None)
+        elif op < 0.85:
+            state["convs"] = {}
+        else:
+            state["convs"][key] = {"turn": 0, "status": "done"}
+        fresh = RoundRobinProgress(state, "convs", "sims", directed=directed)
+        fresh.sims_list(state["sims"])
+        assert _snapshot(progress) == _snapshot(fresh), step
+        for n in nums:
+            assert progress.sender_done(n, sims_list) == fresh.sender_done(n, sims_list)
+
+
+def test_sender_done_counts_only_known_sims():
+    nums  = ["+1", "+2", "+3"]
+    state, progress = _tracked({"sims": {n: "1|0" for n in nums}, "convs": {}}, False)
+    sims_list = progress.sims_list(state["sims"])
+    state["convs"]["+1|+2"] = {"status": "done"}
+    state["convs"]["+1|+9"] = {"status": "done"}        # SIM inconnue : ignorée
+    assert not progress.sender_done("+1", sims_list)
+    state["convs"]["+1|+3"] = {"status": "done"}
+    assert progress.sender_done("+1", sims_list)
+
+
+def test_sims_list_cached_until_sims_change():
+    state, progress = _tracked({"sims": {"+2": "1|0", "+1": "2|0"}, "convs": {}}, False)
+    first = progress.sims_list(state["sims"])
+    assert first == ["+1", "+2"]
+    assert progress.sims_list(state["sims"]) is first
+    state["sims"]["+0"] = "3|0"
+    assert progress.sims_list(state["sims"]) == ["+0", "+1", "+2"]
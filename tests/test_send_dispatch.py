@@ -0,0 +1,76 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from send_dispatch import DeviceDispatcher, InlineDispatcher, SendCompletions, device_of
+
+
+def test_device_of_groups_slots():
+    assert device_of("12|0") == device_of("12|1") == "12"
+
+
+def test_per_device_fifo_order():
+    d, order = DeviceDispatcher(workers=4), []
+    lock = threading.Lock()
+
+    def send(tag):
+        with lock:
+            order.append(tag)
+
+    futs = [d.submit(f"7|{i % 2}", send, i) for i in range(20)]
+    for f in futs:
+        f.result(timeout=5)
+    d.close()
+    assert order == list(range(20))              # un seul envoi en vol par téléphone
+
+
+def test_slow_device_does_not_block_others():
+    d, started, release = DeviceDispatcher(workers=2), threading.Event(), threading.Event()
+    slow = d.submit("1|0", lambda: started.set() or release.wait(5))
+    fast = d.submit("2|0", lambda: "ok")
+    assert fast.result(timeout=2) == "ok" and started.wait(2)
+    assert not slow.done()
+    g = d.gauges()
+    assert g["in_flight"] == 1 and g["devices_busy"] == ["1"]
+    release.set()
+    slow.result(timeout=2)
+    d.close()
+
+
+def test_gauges_count_queued_sent_and_failed():
+    d, started, release = DeviceDispatcher(workers=1), threading.Event(), threading.Event()
+    first = d.submit("1|0", lambda: started.set() or release.wait(5))
+    assert started.wait(2)
+    d.submit("1|1", lambda: None)
+    bad   = d.submit("1|0", lambda: 1 / 0)
+    g = d.gauges()
+    assert g["queued"] == 2 and g["per_device"] == {"1": 2}
+    release.set()
+    first.result(timeout=2)
+    with pytest.raises(ZeroDivisionError):
+        bad.result(timeout=2)
+    d.close()
+    g = d.gauges()
+    assert (g["sent"], g["failed"], g["queued"]) == (2, 1, 0)
+
+
+def test_completions_apply_on_drain_only():
+    done = SendCompletions()
+    fut: Future = Future()
+    seen = []
+    done.watch(fut, lambda f, tag: seen.append((tag, f.result())) or {"applied": tag}, "a")
+    assert len(done) == 1 and done.drain() == []
+    fut.set_result(42)                         # thread du dispatcher : rien n'est appliqué
+    assert seen == []
+    assert done.drain() == [{"applied": "a"}]
+    assert seen == [("a", 42)] and len(done) == 0
+
+
+def test_completions_log_failing_callback_and_continue():
+    done = SendCompletions()
+    inline = InlineDispatcher()
+    done.watch(inline.submit("1|0", lambda: 1), lambda f: 1 / 0)
+    done.watch(inline.submit("2|0", lambda: 2), lambda f: {"v": f.result()})
+    assert done.drain() == [{"v": 2}]
+    assert len(done) == 0
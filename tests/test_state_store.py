@@ -0,0 +1,178 @@
+import os
+
+from state_store import JournalStateStore, JsonStateStore, SqliteStateStore, StatePersister
+
+LAYOUT = {"convs": "convs", "sims": "sims", "seen": "dedupe", "rate": "rate"}
+
+
+def _state():
+    return {
+        "convs":  {"+2376001|+2376002": {"turn": 3, "status": "active", "last_sender": "+2376001"},
+                   "+2376001|+2376003": {"turn": 10, "status": "done", "last_sender": "+2376003"}},
+        "rr_idx": 4,
+        "sims":   {"+2376001": "1|0", "+2376002": "2|0", "+2376003": "3|1"},
+        "seen":   {"wm": 120, "win": {"125": 1792200000, "abc": 1792200005}},
+        "cursor": {"last_id": 125},
+        "rate":   {"tat": 1792200012.5, "sims": {"1|0": 1792200010.0}},
+    }
+
+
+def test_json_round_trip(tmp_path):
+    path  = str(tmp_path / "state.json")
+    store = JsonStateStore(path)
+    assert store.load() is None
+    store.save(_state())
+    assert JsonStateStore(path).load() == _state()
+    assert [p.name for p in tmp_path.iterdir()] == ["state.json"]   # pas de fichier tmp laissé
+
+
+def test_sqlite_round_trip(tmp_path):
+    path  = str(tmp_path / "state.db")
+    store = SqliteStateStore(path, LAYOUT)
+    assert store.load() is None
+    store.save(_state())
+    store.close()
+    assert SqliteStateStore(path, LAYOUT).load() == _state()
+
+
+def test_sqlite_writes_only_changed_rows(tmp_path):
+    path  = str(tmp_path / "state.db")
+    store = SqliteStateStore(path, LAYOUT)
+    state = _state()
+    store.save(state)
+    assert store.save(state) == 0
+
+    state["convs"]["+2376001|+2376002"]["turn"] = 4
+    del state["sims"]["+2376003"]
+    state["rr_idx"] = 5
+    dirty = {("convs", "+2376001|+2376002"), ("sims", "+2376003"), ("rr_idx",)}
+    assert store.save(state, dirty) == 3
+    store.close()
+    assert SqliteStateStore(path, LAYOUT).load() == state
+
+
+def _journaled(path, **kw):
+    store     = JournalStateStore(path, **kw)
+    persister = StatePersister(store, max_stale_s=0)
+    return store, persister, persister.track(_state())
+
+
+def _mutate(state):
+    state["convs"]["+2376001|+2376002"]["turn"] = 4
+    state["convs"]["+2376002|+2376003"] = {"turn": 1, "status": "active", "last_sender": "+2376002"}
+    del state["sims"]["+2376003"]
+    state["rr_idx"] = 5
+
+
+def test_journal_replays_mutations(tmp_path):
+    path = str(tmp_path / "state.json")
+    store, _, state = _journaled(path)
+    store.save(state)                       # snapshot complet
+    _mutate(state)
+    store.close()
+    assert JournalStateStore(path).load() == state
+
+
+def test_journal_ignores_truncated_last_line(tmp_path):
+    path = str(tmp_path / "state.json")
+    store, _, state = _journaled(path)
+    store.save(state)
+    _mutate(state)
+    store.close()
+    with open(path + ".journal", "a", encoding="utf-8") as f:
+        f.write('{"p": ["rr_idx"], "op": "set", "v": 9')     # crash en cours d'écriture
+
+    reopened = JournalStateStore(path)
+    assert reopened.load() == state
+    reopened.record(("rr_idx",), "set", 6)  # la ligne tronquée est coupée avant d'ajouter
+    reopened.close()
+    assert JournalStateStore(path).load() == {**state, "rr_idx": 6}
+
+
+def test_background_compaction_round_trip(tmp_path):
+    path = str(tmp_path / "state.json")
+    store, persister, state = _journaled(path, compact_every=3)
+    store.save(state)
+    _mutate(state)
+    assert persister.flush()                # >= compact_every records : compaction en fond
+    state["rr_idx"] = 6                     # mutation pendant la compaction
+    store.close()
+    assert not os.path.exists(path + ".journal.old")
+    assert JsonStateStore(path).load()["convs"]["+2376001|+2376002"]["turn"] == 4
+    assert JournalStateStore(path).load() == state
+
+
+def test_sqlite_persists_root_replacement(tmp_path):
+    path      = str(tmp_path / "state.db")
+    store     = SqliteStateStore(path, LAYOUT)
+    persister = StatePersister(store, max_stale_s=0)
+    state     = persister.track(_state())
+    store.save(state)
+
+    fresh = _state()
+    del fresh["cursor"]                     # section kv disparue
+    fresh["seen"]   = {"wm": 0, "win": {}}
+    fresh["rr_idx"] = 0
+    fresh["convs"]  = {"+2376002|+2376003": {"turn": 1, "status": "active", "last_sender": "+2376002"}}
+    state.clear()                           # touche la racine : chemin ()
+    state.update(fresh)
+    assert () in persister.tracker.dirty
+    assert persister.flush()
+    store.close()
+    assert SqliteStateStore(path, LAYOUT).load() == fresh
+
+
+class _CountingStore:
+    def __init__(self):
+        self.saves = []
+
+    def save(self, state, dirty=None):
+        self.saves.append(set(dirty))
+
+
+def test_persister_coalesces_mutations_into_one_write():
+    store     = _CountingStore()
+    persister = StatePersister(store, max_stale_s=0)
+    state     = persister.track(_state())
+    assert not persister.flush()            # rien de modifié : pas d'écriture
+
+    for turn in range(4, 9):
+        state["convs"]["+2376001|+2376002"]["turn"] = turn
+    state["rr_idx"] = 5
+    state["cursor"] = {"last_id": 130}
+    assert persister.flush()
+    assert store.saves == [{("convs", "+2376001|+2376002"), ("rr_idx",), ("cursor",)}]
+    assert persister.writes == 1 and not persister.dirty
+
+
+def test_maybe_flush_waits_for_max_stale():
+    now       = [100.0]
+    store     = _CountingStore()
+    persister = StatePersister(store, max_stale_s=5, now=lambda: now[0])
+    state     = persister.track(_state())
+    assert not persister.maybe_flush()
+
+    state["rr_idx"] = 5
+    now[0] = 103.0
+    state["rr_idx"] = 6                     # l'âge compte depuis la 1re mutation non écrite
+    now[0] = 104.9
+    assert not persister.maybe_flush()
+    now[0] = 105.0
+    assert persister.maybe_flush()
+    assert store.saves == [{("rr_idx",)}]
+    assert persister.tracker.since is None
+
+
+def test_failed_flush_keeps_paths_dirty():
+    class Failing(_CountingStore):
+        def save(self, state, dirty=None):
+            raise OSError("disque plein")
+
+    persister = StatePersister(Failing(), max_stale_s=0)
+    state     = persister.track(_state())
+    state["rr_idx"] = 5
+    try:
+        persister.flush()
+    except OSError:
+        pass
+    assert persister.tracker.dirty == {("rr_idx",)}
@@ -0,0 +1,50 @@
+from itertools import combinations
+
+import pytest
+
+from tournament import round_count, round_pairs
+
+
+def _sims(n):
+    return [f"+23760000{i:04d}" for i in range(n)]
+
+
+@pytest.mark.parametrize("n,rounds", [(0, 0), (1, 0), (2, 1), (3, 3), (4, 3), (7, 7), (10, 9)])
+def test_round_count(n, rounds):
+    assert round_count(n) == rounds
+
+
+@pytest.mark.parametrize("n", range(2, 13))
+def test_every_pair_exactly_once_per_cycle(n):
+    sims  = _sims(n)
+    seen  = []
+    for r in range(round_count(n)):
+        pairs   = round_pairs(sims, r)
+        players = [s for p in pairs for s in p]
+        assert len(players) == len(set(players))           # un seul partenaire par ronde
+        assert len(pairs) == n // 2                          # au plus un SIM au repos
+        seen += [frozenset(p) for p in pairs]
+    assert sorted(seen, key=sorted) == sorted((frozenset(p) for p in combinations(sims, 2)), key=sorted)
+
+
+def test_rounds_wrap_around_cycle():
+    sims = _sims(6)
+    assert round_pairs(sims, 5) == round_pairs(sims, 0)
+
+
+def test_odd_count_rests_each_sim_once():
+    sims   = _sims(5)
+    rested = [set(sims) - {s for p in round_pairs(sims, r) for s in p} for r in range(round_count(5))]
+    assert sorted(s for (s,) in rested) == sims
+
+
+def test_opener_alternates_for_fixed_sim():
+    sims    = _sims(6)
+    openers = [next(a for a, b in round_pairs(sims, r) if sims[0] in (a, b)) == sims[0]
+               for r in range(round_count(6))]
+    assert openers == [True, False, True, False, True]
+
+
+def test_too_few_sims():
+    assert round_pairs([], 0) == []
+    assert round_pairs(_sims(1), 0) == []
@@ -0,0 +1,92 @@
+import json
+import socket
+import urllib.error
+import urllib.request
+
+import pytest
+
+import autochat_exagate as ex
+from clock import VirtualClock
+from webhook import WebhookInbox
+
+MSG = {"id": 7, "number": "+2376001", "message": "Bonjour", "deviceID": 2, "simSlot": 0}
+
+
+@pytest.fixture
+def inbox():
+    box = WebhookInbox(port=_free_port(), secret="s3cret", queue_max=2)
+    assert box.start()
+    yield box
+    box.server.shutdown()
+    box.server.server_close()
+
+
+def _post(box, body, key="s3cret", path=None, form=False):
+    url  = "http://%s:%d%s?key=%s" % (*box.server.server_address[:2], path or box.path, key)
+    data = body.encode() if form else json.dumps(body).encode()
+    ctype = "application/x-www-form-urlencoded" if form else "application/json"
+    req  = urllib.request.Request(url, data=data, headers={"Content-Type": ctype})
+    try:
+        with urllib.request.urlopen(req, timeout=5) as r:
+            return r.status, json.loads(r.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_push_requires_the_secret(inbox):
+    assert _post(inbox, MSG, key="faux")[0] == 401
+    assert _post(inbox, MSG, path="/autre")[0] == 404
+    assert inbox.drain() == []
+    assert _post(inbox, MSG) == (200, {"success": True, "accepted": 1})
+    assert inbox.drain() == [MSG]
+
+
+def test_form_body_lists_and_invalid_messages(inbox):
+    assert _post(inbox, "number=%2B2376002&message=Salut&id=8", form=True)[1]["accepted"] == 1
+    assert _post(inbox, [{"number": "", "message": "x"}, {"id": 9}])[1]["accepted"] == 0
+    assert [m["number"] for m in inbox.drain()] == ["+2376002"]
+
+
+def test_full_queue_answers_503_so_the_gateway_retries(inbox):
+    status, body = _post(inbox, [MSG, MSG, MSG])
+    assert (status, body["accepted"]) == (503, 2)
+    assert inbox.wait(0) is True                          # push signalé à la boucle
+    assert len(inbox.drain()) == 2 and inbox.wait(0) is False
+
+
+def test_refuses_other_interfaces_without_a_secret():
+    assert not WebhookInbox(port=_free_port(), host="0.0.0.0", secret="").start()
+    assert WebhookInbox(port=0).start() is False          # 0 = poll seul
+    loopback = WebhookInbox(port=_free_port(), host="127.0.0.1", secret="")
+    assert loopback.start()                               # loopback : secret facultatif
+    loopback.server.shutdown()
+    loopback.server.server_close()
+
+
+def test_sweep_is_spaced_only_while_the_receiver_runs(inbox):
+    clk = VirtualClock(1000.0)
+    assert WebhookInbox(now=clk.monotonic).sweep_due()    # sans récepteur : chaque poll
+    inbox.sweep_s, inbox._now = 60, clk.monotonic
+    assert inbox.sweep_due()
+    clk.sleep(59)
+    assert not inbox.sweep_due()
+    clk.sleep(1)
+    assert inbox.sweep_due() and not inbox.sweep_due()
+
+
+def test_sweep_does_not_answer_a_pushed_message_twice(monkeypatch):
+    monkeypatch.setattr(ex, "replies", ex.ReplyScheduler())
+    monkeypatch.setattr(ex, "_replying", {})
+    monkeypatch.setattr(ex, "_index", None)
+    state = {"sims": {"+2376001": "1|0", "+2376002": "2|0"}, "convs": {}, "seen": {}}
+
+    assert ex._ingest(state, [MSG], tag="PUSH") == 1
+    assert len(ex.replies) == 1
+    assert ex._ingest(state, [MSG]) == 0                  # rattrapage : déjà vu, ignoré
+    assert len(ex.replies) == 1
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
@@ -0,0 +1,42 @@
+"""
+Planification en tournoi (méthode du cercle)
+============================================
+RR_MODE=tournament : au lieu d'un seul émetteur qui ouvre une conv vers tous
+les autres SIMs, chaque ronde associe chaque SIM à exactement un partenaire
+et toutes les paires de la ronde tournent en parallèle. Les N(N-1)/2 paires
+sont couvertes en N-1 rondes (N pair) ou N rondes avec un SIM au repos
+(N impair), au lieu de N balayages successifs.
+
+Méthode du cercle : le 1er SIM est fixe, les autres tournent d'un cran par
+ronde ; la position k est associée à la position m-1-k.
+"""
+import os
+from typing import List, Optional, Tuple
+
+RR_MODE = os.getenv('RR_MODE', 'sender')     # sender | tournament
+
+
+def round_count(n: int) -> int:
+    if n < 2:
+        return 0
+    return n - 1 if n % 2 == 0 else n
+
+
+def round_pairs(sims_list: List[str], r: int) -> List[Tuple[str, str]]:
+    """Paires (ouvreur, partenaire) de la ronde r ; l'ouvreur alterne d'une ronde à l'autre."""
+    players: List[Optional[str]] = list(sims_list)
+    if len(players) % 2:
+        players.append(None)                 # SIM au repos pour cette ronde
+    m = len(players)
+    if m < 2:
+        return []
+    r %= m - 1
+    rest   = players[1:]
+    circle = [players[0]] + rest[m - 1 - r:] + rest[:m - 1 - r]
+    out = []
+    for k in range(m // 2):
+        a, b = circle[k], circle[m - 1 - k]
+        if a is None or b is None:
+            continue
+        out.append((b, a) if (r + k) % 2 else (a, b))
+    return out
@@ -0,0 +1,189 @@
+"""
+Ingestion push : récepteur webhook des SMS entrants
+===================================================
+WEBHOOK_PORT=8090 démarre un serveur HTTP (thread daemon) sur lequel le
+gateway pousse chaque message reçu, avec les champs lus par process() :
+
+  POST /inbound?key=<WEBHOOK_SECRET>
+  {"id": 1234, "number": "+2376...", "message": "Hello !", "deviceID": 3, "simSlot": 0}
+
+Corps JSON (un message ou une liste) ou formulaire (application/x-www-form-
+urlencoded, un message). Le thread HTTP ne touche pas l'état : il pose les
+messages dans une file bornée et réveille la boucle (wait() en sync,
+on_push en async) qui les traite aussitôt, sans attendre le poll suivant.
+
+get-messages.php devient un balayage de rattrapage toutes les
+WEBHOOK_SWEEP_S (callbacks perdus, redémarrage) ; la dédupe écarte ce qui
+a déjà été poussé. WEBHOOK_PORT=0 (défaut) : poll seul, comportement inchangé.
+
+Chaque message accepté fait partir de vrais SMS : écoute sur 127.0.0.1 par
+défaut, et refus de démarrer sur une autre interface sans WEBHOOK_SECRET.
+"""
+import hmac
+import json
+import os
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import clock
+import metrics
+from jsonlog import log
+
+WEBHOOK_PORT      = int(os.getenv('WEBHOOK_PORT', '0'))
+WEBHOOK_HOST      = os.getenv('WEBHOOK_HOST', '127.0.0.1')
+WEBHOOK_PATH      = os.getenv('WEBHOOK_PATH', '/inbound')
+WEBHOOK_SECRET    = os.getenv('WEBHOOK_SECRET', '')               # vide = loopback uniquement
+WEBHOOK_SWEEP_S   = float(os.getenv('WEBHOOK_SWEEP_S', '60'))
+WEBHOOK_QUEUE_MAX = int(os.getenv('WEBHOOK_QUEUE_MAX', '10000'))
+WEBHOOK_MAX_BODY  = 1 << 20
+
+LOOPBACK = ("127.0.0.1", "localhost", "::1")
+
+
+def _valid(m) -> bool:
+    return isinstance(m, dict) and bool(m.get("number")) and "message" in m
+
+
+class WebhookInbox:
+
+    def __init__(self, port: int = WEBHOOK_PORT, host: str = WEBHOOK_HOST,
+                 path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET,
+                 sweep_s: float = WEBHOOK_SWEEP_S, queue_max: int = WEBHOOK_QUEUE_MAX,
+                 now: Callable[[], float] = clock.monotonic):
+        self.port     = port
+        self.host     = host
+        self.path     = path
+        self.secret   = secret
+        self.sweep_s  = sweep_s
+        self._now     = now
+        self._q: "queue.Queue" = queue.Queue(queue_max)
+        self._event   = threading.Event()
+        self._next_sweep: Optional[float] = None
+        self.server: Optional[ThreadingHTTPServer] = None
+        # ENGINE=async : appelé depuis le thread HTTP après chaque push accepté
+        self.on_push: Optional[Callable[[], None]] = None
+
+    @property
+    def running(self) -> bool:
+        return self.server is not None
+
+    def start(self) -> bool:
+        """Démarre le récepteur ; False si WEBHOOK_PORT=0 ou port occupé (poll seul)."""
+        if not self.port or self.server is not None:
+            return self.server is not None
+        if not self.secret and self.host not in LOOPBACK:
+            log.error("PUSH", "WEBHOOK_SECRET requis hors loopback, poll seul", host=self.host)
+            return False
+        handler = type("WebhookHandler", (_Handler,), {"inbox": self})
+        try:
+            server = ThreadingHTTPServer((self.host, self.port), handler)
+        except OSError as e:
+            log.warn("PUSH", "port indisponible, poll seul", port=self.port, err=str(e))
+            return False
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="webhook", daemon=True).start()
+        self.server = server
+        log.info("PUSH", "recepteur demarre", sweep_s=self.sweep_s,
+                 url=f"http://{self.host}:{server.server_address[1]}{self.path}")
+        return True
+
+    # ── thread HTTP ─────────────────────────────────────────────────────────
+    def push(self, msgs: List[dict]) -> int:
+        """Met en file les messages valides ; retourne le nombre accepté."""
+        accepted = 0
+        for m in msgs:
+            if not _valid(m):
+                metrics.WEBHOOK.inc(result="rejected")
+                continue
+            try:
+                self._q.put_nowait(m)
+            except queue.Full:
+                metrics.WEBHOOK.inc(result="full")
+                continue
+            accepted += 1
+        if accepted:
+            metrics.WEBHOOK.inc(accepted, result="accepted")
+            self._event.set()
+            if self.on_push is not None:
+                self.on_push()
+        return accepted
+
+    def authorized(self, key: Optional[str]) -> bool:
+        if not self.secret:
+            return True
+        return hmac.compare_digest((key or "").encode(), self.secret.encode())
+
+    def full(self) -> bool:
+        return self._q.full()
+
+    # ── boucle principale ───────────────────────────────────────────────────
+    def drain(self) -> List[dict]:
+        out = []
+        try:
+            while True:
+                out.append(self._q.get_nowait())
+        except queue.Empty:
+            return out
+
+    def wait(self, timeout: float) -> bool:
+        """Attente interrompue par un push (temps réel) ; True si des messages attendent."""
+        if self._event.wait(max(0.0, timeout)):
+            self._event.clear()
+        return not self._q.empty()
+
+    def sweep_due(self) -> bool:
+        """Poll de rattrapage dû ? Toujours vrai sans récepteur (poll normal)."""
+        if self.server is None:
+            return True
+        now = self._now()
+        if self._next_sweep is not None and now < self._next_sweep:
+            return False
+        self._next_sweep = now + self.sweep_s
+        return True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    inbox: WebhookInbox
+
+    def _send(self, code: int, body: dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != self.inbox.path:
+            self._send(404, {"success": False, "error": "not found"})
+            return
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if not self.inbox.authorized(query.get("key")):
+            self._send(401, {"success": False, "error": "cle invalide"})
+            return
+        n = int(self.headers.get("Content-Length") or 0)
+        if n > WEBHOOK_MAX_BODY:
+            self._send(413, {"success": False, "error": "corps trop gros"})
+            return
+        raw = self.rfile.read(n) if n else b""
+        try:
+            if "json" in (self.headers.get("Content-Type") or "") or raw[:1] in (b"{", b"["):
+                body = json.loads(raw.decode("utf-8"))
+            else:
+                body = {k: v[-1] for k, v in parse_qs(raw.decode("utf-8", "replace")).items()}
+        except ValueError:
+            self._send(400, {"success": False, "error": "JSON invalide"})
+            return
+        msgs = body if isinstance(body, list) else [body]
+        accepted = self.inbox.push(msgs)
+        if accepted < len(msgs) and self.inbox.full():
+            self._send(503, {"success": False, "accepted": accepted})   # le gateway peut rejouer
+            return
+        self._send(200, {"success": True, "accepted": accepted})
+
+    def log_message(self, fmt, *args):
+        pass